@@ -56,7 +56,8 @@ setup(
     # },
     entry_points={
         'console_scripts': [
-            'print-hello-worlds=sigflow.clitools.print_hello_worlds:main'
+            'print-hello-worlds=sigflow.clitools.print_hello_worlds:main',
+            'sigflow=sigflow.clitools.cli:main',
         ],
     }
     # List additional URLs that are relevant to your project as a dict.
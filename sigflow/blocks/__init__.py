@@ -1,6 +1,13 @@
+from .adaptive import *
 from .base import *
 # sigflow.blocks.filter is deprecated. See sigflow.blocks.lti.
 # from .filter import *
+from .delay import *
+from .fir import *
 from .junction import *
+from .kalman import *
 from .lti import *
 from .matrix import *
+from .resample import *
+from .spectrum import *
+from .statistics import *
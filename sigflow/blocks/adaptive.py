@@ -0,0 +1,544 @@
+"""Adaptive filter blocks.
+"""
+import numpy as np
+import scipy.fft
+
+from .base import Block
+
+
+class _AdaptiveFilter(Block):
+    """Base class of the adaptive FIR filters
+
+    Parameters
+    ----------
+    taps : int
+        Number of taps of the filter of each reference.
+    nreference : int
+        Number of reference inputs.
+    step : float
+        Step size of the adaptation.
+    regularization : float
+        Added to the power of the references in the normalization.
+    label : str
+        Label for this block.
+    """
+    def __init__(self, taps, nreference, step, regularization, label):
+        taps = int(taps)
+        if taps < 1:
+            raise ValueError("taps must be a positive integer.")
+        nreference = int(nreference)
+        if nreference < 1:
+            raise ValueError("nreference must be a positive integer.")
+        self._taps = taps
+        self._nreference = nreference
+        self.step = step
+        self.regularization = regularization
+        self._outputs = np.zeros(2, dtype=self.dtype)
+        super().__init__(label=label)
+        self.ninput = nreference + 1
+        self.noutput = 2
+
+    @property
+    def taps(self):
+        """Number of taps of the filter of each reference."""
+        return self._taps
+
+    @property
+    def nreference(self):
+        """Number of reference inputs."""
+        return self._nreference
+
+    @property
+    def step(self):
+        """Step size of the adaptation, 0 to freeze the weights."""
+        return self._step
+
+    @step.setter
+    def step(self, step):
+        """step.setter"""
+        step = float(step)
+        if step < 0:
+            raise ValueError("step must not be negative.")
+        self._step = step
+
+    @Block.inputs.setter
+    def inputs(self, _inputs):
+        """inputs.setter, filter the sample and adapt the weights."""
+        self._inputs = np.ravel(np.asarray(_inputs, dtype=self.dtype))
+        if hasattr(self, "_ninput"):
+            samples = np.broadcast_to(self._inputs, self.ninput)
+            self._outputs[:] = self._push(samples[:-1], samples[-1])
+
+    def _push(self, references, desired):
+        """Filter a sample and adapt the weights.
+
+        Parameters
+        ----------
+        references : array
+            The sample of each reference.
+        desired : float
+            The sample of the desired signal.
+
+        Returns
+        -------
+        float
+            The error.
+        float
+            The estimate of the desired signal.
+        """
+        raise NotImplementedError
+
+    def _i2o(self):
+        """The error and the estimate of the current sample.
+
+        Returns
+        -------
+        array
+            [error, estimate]
+        """
+        return self._outputs.copy()
+
+    def _split(self, inputs):
+        """References and desired signal of a chunk."""
+        x = np.atleast_2d(np.asarray(inputs, dtype=self.dtype))
+        if len(x) != self.ninput:
+            raise ValueError("expected {} inputs, got {}"
+                             "".format(self.ninput, len(x)))
+        return x[:-1], x[-1]
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        return {"taps": self.taps, "nreference": self.nreference,
+                "step": self.step, "regularization": self.regularization}
+
+
+class NLMS(_AdaptiveFilter):
+    """A normalized least mean squares adaptive filter block
+
+    e[n] = d[n] - sum_r w_r . x_r[n]
+
+    w_r += step * e[n] x_r[n] / (sum_r |x_r[n]|^2 + regularization)
+
+    where x_r[n] holds the last taps samples of reference r.
+
+    Parameters
+    ----------
+    taps : int
+        Number of taps of the filter of each reference.
+    nreference : int, optional
+        Number of reference inputs.
+        Defaults to 1.
+    step : float, optional
+        Step size of the adaptation, between 0 and 2.
+        Defaults to 0.5.
+    regularization : float, optional
+        Added to the power of the references in the normalization.
+        Defaults to 1e-6.
+    label : str, optional
+        Label for this block.
+        Defaults to None.
+
+    Attributes
+    ----------
+    ninput : int
+        nreference+1 inputs, the references and then the desired
+        signal d.
+    noutput : int
+        2 outputs, the error e, i.e. the cancelled signal, and the
+        estimate d - e.
+
+    Note
+    ----
+    The weights are updated every sample, at a cost of O(taps) per
+    reference, which suits short filters.
+    See PartitionedBlockLMS for long filters.
+    """
+    def __init__(self, taps, nreference=1, step=0.5, regularization=1e-6,
+                 label=None):
+        """Constructor
+
+        Parameters
+        ----------
+        taps : int
+            Number of taps of the filter of each reference.
+        nreference : int, optional
+            Number of reference inputs.
+            Defaults to 1.
+        step : float, optional
+            Step size of the adaptation, between 0 and 2.
+            Defaults to 0.5.
+        regularization : float, optional
+            Added to the power of the references in the normalization.
+            Defaults to 1e-6.
+        label : str, optional
+            Label for this block.
+            Defaults to None.
+        """
+        # Weights of each reference, newest sample first.
+        self._weights = np.zeros((int(nreference), int(taps)),
+                                 dtype=self.dtype)
+        # Last samples of each reference, newest first.
+        self._history = np.zeros_like(self._weights)
+        super().__init__(taps, nreference, step, regularization, label)
+
+    @property
+    def weights(self):
+        """(nreference, taps) array of the weights of each reference."""
+        return self._weights.copy()
+
+    @weights.setter
+    def weights(self, weights):
+        """weights.setter"""
+        self._weights[:] = weights
+
+    def _push(self, references, desired):
+        """Filter a sample and adapt the weights, see _AdaptiveFilter."""
+        history = self._history
+        history[:, 1:] = history[:, :-1]
+        history[:, 0] = references
+        estimate = np.vdot(self._weights, history)
+        error = desired - estimate
+        power = np.vdot(history, history) + self.regularization
+        self._weights += (self.step * error / power) * history
+        return error, estimate
+
+    def process(self, inputs):
+        """Filter and adapt over a chunk of samples.
+
+        Parameters
+        ----------
+        inputs : array
+            (nreference+1, n) array of the references and the desired
+            signal.
+
+        Returns
+        -------
+        array
+            (2, n) array of the error and the estimate.
+        """
+        references, desired = self._split(inputs)
+        n = len(desired)
+        outputs = np.empty((2, n), dtype=self.dtype)
+        if n == 0:
+            return outputs
+        taps = self.taps
+        weights = self._weights
+        step = self.step
+        regularization = self.regularization
+        ## oldest first, so that the window of sample k is a slice
+        full = np.concatenate([self._history[:, ::-1], references], axis=1)
+        power = np.sum(self._history**2)
+        for k in range(n):
+            window = full[:, k+1:k+1+taps][:, ::-1]
+            power += np.sum(full[:, k+taps]**2) - np.sum(full[:, k]**2)
+            estimate = np.vdot(weights, window)
+            error = desired[k] - estimate
+            weights += (step * error / (power + regularization)) * window
+            outputs[:, k] = error, estimate
+        self._history[:] = full[:, -taps:][:, ::-1]
+        self._outputs[:] = outputs[:, -1]
+        self._inputs = np.append(references[:, -1], desired[-1])
+        return outputs
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        return cls(int(parameters["taps"]),
+                   nreference=int(parameters["nreference"]),
+                   step=float(parameters["step"]),
+                   regularization=float(parameters["regularization"]),
+                   label=label)
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        return {"weights": self._weights, "history": self._history}
+
+
+class PartitionedBlockLMS(_AdaptiveFilter):
+    """A partitioned frequency-domain block LMS adaptive filter block
+
+    Same as NLMS, except that the weights are adapted once every block
+    of partition samples, from the errors of the whole block, with a
+    step normalized by the power of the references at each frequency.
+
+    Parameters
+    ----------
+    taps : int
+        Number of taps of the filter of each reference.
+    partition : int, optional
+        Block size B, and size of the partitions of the filters.
+        Defaults to 256.
+    nreference : int, optional
+        Number of reference inputs.
+        Defaults to 1.
+    step : float, optional
+        Step size of the adaptation, between 0 and 2.
+        Defaults to 0.5.
+    forgetting : float, optional
+        Forgetting factor of the power estimates, between 0 and 1.
+        Defaults to 0.9.
+    regularization : float, optional
+        Added to the power of the references in the normalization.
+        Defaults to 1e-6.
+    label : str, optional
+        Label for this block.
+        Defaults to None.
+
+    Attributes
+    ----------
+    ninput : int
+        nreference+1 inputs, the references and then the desired
+        signal d.
+    noutput : int
+        2 outputs, the error e, i.e. the cancelled signal, and the
+        estimate d - e.
+
+    Note
+    ----
+    The filters are split into P partitions of B taps, whose spectra of
+    size 2B are kept in one contiguous array, and the spectra of the
+    last P windows of 2B samples of each reference form a frequency-
+    domain delay line, so a block costs one FFT per reference plus P
+    products of spectra, whatever the length of the filters.
+    The output has no latency: the contributions of the partitions
+    beyond the first are computed once at the start of a block, and the
+    first partition is convolved with the samples of the block as they
+    arrive, in direct form for single samples or by FFT for chunks.
+    The gradients are constrained to B taps, so the adapted filters are
+    exactly taps long.
+    """
+    def __init__(self, taps, partition=256, nreference=1, step=0.5,
+                 forgetting=0.9, regularization=1e-6, label=None):
+        """Constructor
+
+        Parameters
+        ----------
+        taps : int
+            Number of taps of the filter of each reference.
+        partition : int, optional
+            Block size B, and size of the partitions of the filters.
+            Defaults to 256.
+        nreference : int, optional
+            Number of reference inputs.
+            Defaults to 1.
+        step : float, optional
+            Step size of the adaptation, between 0 and 2.
+            Defaults to 0.5.
+        forgetting : float, optional
+            Forgetting factor of the power estimates, between 0 and 1.
+            Defaults to 0.9.
+        regularization : float, optional
+            Added to the power of the references in the normalization.
+            Defaults to 1e-6.
+        label : str, optional
+            Label for this block.
+            Defaults to None.
+        """
+        partition = int(partition)
+        if partition < 1:
+            raise ValueError("partition must be a positive integer.")
+        if not 0 <= forgetting < 1:
+            raise ValueError("forgetting must be between 0 and 1.")
+        self._partition = partition
+        self.forgetting = float(forgetting)
+        nreference = int(nreference)
+        npart = -(-int(taps) // partition)
+        nbin = partition + 1
+        # Complex spectra stored as pairs of floats.
+        # Spectra of the partitions of the filters.
+        self._weights = np.zeros((nreference, npart, 2*nbin),
+                                 dtype=self.dtype)
+        # Spectra of the windows of the last blocks, current one first.
+        self._spectra = np.zeros_like(self._weights)
+        # Taps of the first partition, newest sample last.
+        self._head = np.zeros((nreference, partition), dtype=self.dtype)
+        # Previous and current blocks of the references, and errors of
+        # the current block.
+        self._history = np.zeros((nreference, 2*partition), dtype=self.dtype)
+        self._errors = np.zeros(partition, dtype=self.dtype)
+        # Estimates of the partitions beyond the first for the block.
+        self._tail = np.zeros(partition, dtype=self.dtype)
+        # Power of the references at each frequency.
+        self._power = np.zeros(nbin, dtype=self.dtype)
+        # Samples in the current block.
+        self._counts = np.zeros(1, dtype=self.dtype)
+        super().__init__(taps, nreference, step, regularization, label)
+        self._update_head()
+
+    @property
+    def partition(self):
+        """Block size, and size of the partitions of the filters."""
+        return self._partition
+
+    @property
+    def _complex_dtype(self):
+        """Complex data type with the precision of self.dtype."""
+        return np.promote_types(self.dtype, np.complex64)
+
+    @property
+    def weights(self):
+        """(nreference, taps) array of the weights of each reference."""
+        size = self._partition
+        spectra = self._weights.view(self._complex_dtype)
+        weights = scipy.fft.irfft(spectra, 2*size, axis=-1)[..., :size]
+        return weights.reshape(self.nreference, -1)[:, :self.taps].copy()
+
+    @weights.setter
+    def weights(self, weights):
+        """weights.setter, the estimates of the block are updated."""
+        size = self._partition
+        padded = np.zeros((self.nreference, self._weights.shape[1]*size),
+                          dtype=self.dtype)
+        padded[:, :self.taps] = weights
+        spectra = scipy.fft.rfft(
+            padded.reshape(self.nreference, -1, size), 2*size, axis=-1)
+        self._weights.view(self._complex_dtype)[:] = spectra
+        self._update_head()
+        self._update_tail()
+
+    def _update_head(self):
+        """Taps of the first partition, newest sample last."""
+        size = self._partition
+        spectra = self._weights.view(self._complex_dtype)[:, 0]
+        head = scipy.fft.irfft(spectra, 2*size, axis=-1)[:, :size]
+        self._head[:] = head[:, ::-1]
+
+    def _update_tail(self):
+        """Estimates of the partitions beyond the first for the block."""
+        size = self._partition
+        weights = self._weights.view(self._complex_dtype)[:, 1:]
+        if weights.shape[1] == 0:
+            return
+        spectra = self._spectra.view(self._complex_dtype)[:, 1:]
+        product = np.einsum("rpf,rpf->f", weights, spectra)
+        self._tail[:] = scipy.fft.irfft(product, 2*size)[size:]
+
+    def _push(self, references, desired):
+        """Filter a sample and adapt the weights, see _AdaptiveFilter."""
+        size = self._partition
+        filled = int(self._counts[0])
+        self._history[:, size+filled] = references
+        window = self._history[:, filled+1:size+filled+1]
+        estimate = self._tail[filled] + np.vdot(self._head, window)
+        error = desired - estimate
+        self._errors[filled] = error
+        self._counts[0] = filled + 1
+        if filled + 1 == size:
+            self._adapt()
+        return error, estimate
+
+    def process(self, inputs):
+        """Filter and adapt over a chunk of samples.
+
+        Parameters
+        ----------
+        inputs : array
+            (nreference+1, n) array of the references and the desired
+            signal.
+
+        Returns
+        -------
+        array
+            (2, n) array of the error and the estimate.
+        """
+        references, desired = self._split(inputs)
+        n = len(desired)
+        outputs = np.empty((2, n), dtype=self.dtype)
+        if n == 0:
+            return outputs
+        size = self._partition
+        head = self._weights.view(self._complex_dtype)[:, 0]
+        start = 0
+        while start < n:
+            ## up to the end of the current block
+            filled = int(self._counts[0])
+            stop = min(n, start + size - filled)
+            count = stop - start
+            self._history[:, size+filled:size+filled+count] = \
+                references[:, start:stop]
+            self._history[:, size+filled+count:] = 0
+            current = scipy.fft.rfft(self._history, axis=-1)
+            self._spectra.view(self._complex_dtype)[:, 0] = current
+            estimate = scipy.fft.irfft(np.einsum("rf,rf->f", head, current),
+                                       2*size)[size+filled:size+filled+count]
+            estimate += self._tail[filled:filled+count]
+            error = desired[start:stop] - estimate
+            self._errors[filled:filled+count] = error
+            outputs[0, start:stop] = error
+            outputs[1, start:stop] = estimate
+            self._counts[0] = filled + count
+            if filled + count == size:
+                self._adapt(current)
+            start = stop
+        self._outputs[:] = outputs[:, -1]
+        self._inputs = np.append(references[:, -1], desired[-1])
+        return outputs
+
+    def _adapt(self, current=None):
+        """Adapt the weights at the end of a block and start the next one.
+
+        Parameters
+        ----------
+        current : array or None, optional
+            Spectra of the window of the block, computed if None.
+        """
+        size = self._partition
+        complex_dtype = self._complex_dtype
+        spectra = self._spectra.view(complex_dtype)
+        if current is None:
+            current = scipy.fft.rfft(self._history, axis=-1)
+            spectra[:, 0] = current
+        power = np.sum(current.real**2 + current.imag**2, axis=0)
+        if not np.any(self._power):
+            self._power[:] = power
+        else:
+            self._power *= self.forgetting
+            self._power += (1 - self.forgetting) * power
+        if self.step:
+            errors = scipy.fft.rfft(
+                np.concatenate([np.zeros(size, dtype=self.dtype),
+                                self._errors]))
+            ## the power of a window of 2B samples times P/2 is the power
+            ## of the P*B taps normalizing NLMS
+            norm = self._power * (spectra.shape[1] / 2) + self.regularization
+            gradient = spectra.conj() * (errors / norm)
+            ## constrain the gradients to B taps, and to the taps of the
+            ## filter in the last partition
+            gradient = scipy.fft.irfft(gradient, 2*size, axis=-1)[..., :size]
+            gradient = gradient.reshape(self.nreference, -1)
+            gradient[:, self.taps:] = 0
+            gradient = scipy.fft.rfft(
+                gradient.reshape(self.nreference, -1, size), 2*size, axis=-1)
+            self._weights.view(complex_dtype)[:] += self.step * gradient
+            self._update_head()
+        ## next block
+        spectra[:, 1:] = spectra[:, :-1]
+        self._history[:, :size] = self._history[:, size:]
+        self._history[:, size:] = 0
+        self._counts[0] = 0
+        self._update_tail()
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        parameters = super()._parameters()
+        parameters.update(partition=self.partition,
+                          forgetting=self.forgetting)
+        return parameters
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        return cls(int(parameters["taps"]),
+                   partition=int(parameters["partition"]),
+                   nreference=int(parameters["nreference"]),
+                   step=float(parameters["step"]),
+                   forgetting=float(parameters["forgetting"]),
+                   regularization=float(parameters["regularization"]),
+                   label=label)
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        return {"weights": self._weights, "head": self._head,
+                "spectra": self._spectra, "history": self._history,
+                "errors": self._errors, "tail": self._tail,
+                "power": self._power, "counts": self._counts}
@@ -1,3 +1,5 @@
+import weakref
+
 import numpy as np
 
 """Elements in a block diagram
@@ -17,6 +19,27 @@ class Block:
         The number of inputs
     noutput : int
         The number of outputs
+    dtype : numpy.dtype
+        The data type of the buffers, states and coefficients.
+        Defaults to float64.
+    pure : bool
+        True if the output only depends on the current inputs, i.e. the
+        block has no states.
+        Systems in event-driven mode skip pure blocks whose inputs did
+        not change, see System.event_driven.
+        Defaults to False.
+    latency : int
+        Number of samples the output lags the inputs by, at least, so
+        that the outputs of the next latency samples only depend on past
+        inputs, see Block._peek.
+        Systems process feedback loops through such blocks in chunks,
+        see System.process.
+        Defaults to 0.
+    rate : int or fractions.Fraction
+        Number of output samples per input sample.
+        Blocks changing the rate only process chunks, whose outputs
+        have a different number of samples, see System.process.
+        Defaults to 1.
 
     Note
     ----
@@ -30,6 +53,29 @@ class Block:
 
        output = block(input)
     """
+    __slots__ = ("label", "_inputs", "_ninput", "_noutput", "_owners",
+                 "_dtype", "__weakref__")
+    pure = False
+    latency = 0
+    rate = 1
+
+    def __new__(cls, *args, **kwargs):
+        """Allocate a block with the default dtype and no owners.
+
+        Note
+        ----
+        The core blocks keep their attributes in ``__slots__``, so the
+        defaults are set here rather than as class attributes, before
+        any constructor runs.
+        LTI, Matrix and Junction have no instance dictionary, so their
+        attributes are fixed; subclasses without ``__slots__``, e.g. user
+        blocks and System, have one as usual.
+        """
+        block = super().__new__(cls)
+        block._owners = None  # Systems containing this block.
+        block._dtype = np.dtype(np.float64)
+        return block
+
     def __init__(self, label=None):
         """Constructor
 
@@ -74,6 +120,272 @@ class Block:
         """
         return self.inputs
 
+    def process(self, inputs):
+        """Process a chunk of samples.
+
+        Parameters
+        ----------
+        inputs : array
+            (ninput, n) array of n samples of each input.
+            A 1-D array is taken as n samples of a single input.
+
+        Returns
+        -------
+        array
+            (noutput, n) array of n samples of each output.
+
+        Note
+        ----
+        By default, the samples are passed to the block one by one.
+        This method should be redefined with a vectorized implementation
+        where possible.
+        The block's states must be carried over to the next chunk.
+        """
+        inputs = np.atleast_2d(inputs)
+        outputs = np.empty((self.noutput, inputs.shape[1]), dtype=self.dtype)
+        for k in range(inputs.shape[1]):
+            if self.ninput > 1:
+                outputs[:, k] = self(inputs[:, k])
+            else:
+                outputs[:, k] = self(inputs[0, k])
+        return outputs
+
+    def _peek(self, n):
+        """Outputs of the next samples, without advancing the block.
+
+        Parameters
+        ----------
+        n : int
+            Number of samples, at most self.latency.
+
+        Returns
+        -------
+        array
+            (noutput, n) array of the outputs of the next n samples,
+            whatever the inputs of these samples.
+
+        Note
+        ----
+        Blocks with a latency must redefine this method.
+        """
+        raise NotImplementedError("{} has no latency"
+                                  "".format(type(self).__name__))
+
+    def initialize_steady_state(self, inputs):
+        """Set the states to the equilibrium for constant inputs.
+
+        Parameters
+        ----------
+        inputs : float or array
+            The constant value of each input.
+
+        Returns
+        -------
+        array
+            The steady-state value of each output.
+
+        Note
+        ----
+        By default, the block is evaluated once, which is only valid for
+        blocks without states.
+        Blocks with states must redefine this method.
+        """
+        if self._states():
+            raise NotImplementedError("{} has no steady-state "
+                                      "initialization"
+                                      "".format(type(self).__name__))
+        inputs = np.ravel(inputs)
+        if self.ninput == 1:
+            inputs = inputs[0]
+        return np.atleast_1d(self(inputs))
+
+    def frequency_response(self, freqs):
+        """Frequency response of the block.
+
+        Parameters
+        ----------
+        freqs : array
+            Frequencies in Hz.
+
+        Returns
+        -------
+        array
+            (n_freq, noutput, ninput) complex array of the gains from
+            each input to each output.
+
+        Note
+        ----
+        This method should be redefined by linear blocks.
+        """
+        raise NotImplementedError("{} has no frequency response"
+                                  "".format(type(self).__name__))
+
+    @property
+    def dtype(self):
+        """Data type of the buffers, states and coefficients."""
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, dtype):
+        """dtype setter
+
+        Parameters
+        ----------
+        dtype : numpy.dtype or type
+            A floating point data type, e.g. numpy.float32.
+        """
+        dtype = np.dtype(dtype)
+        if not np.issubdtype(dtype, np.floating):
+            raise TypeError("dtype must be a floating point type, not {}"
+                            "".format(dtype))
+        self._dtype = dtype
+        self._cast()
+
+    def _cast(self):
+        """Cast the states and coefficients of the block to self.dtype.
+
+        Note
+        ----
+        By default, only the state arrays are cast.
+        Integer states, e.g. counters and indices, keep their dtype.
+        Blocks with coefficients should redefine this method to cast
+        them and call the base method for the states.
+        """
+        states = {key: array for key, array in self._states().items()
+                  if not np.issubdtype(array.dtype, np.integer)}
+        if any(array.dtype != self.dtype for array in states.values()):
+            self._bind_states({key: array.astype(self.dtype)
+                               for key, array in states.items()})
+        self._notify()
+
+    def _add_owner(self, system):
+        """Register a system containing this block.
+
+        Parameters
+        ----------
+        system : System
+            The system to be notified when the block changes.
+        """
+        if self._owners is None:
+            self._owners = weakref.WeakSet()
+        self._owners.add(system)
+
+    def _remove_owner(self, system):
+        """Unregister a system containing this block."""
+        if self._owners is not None:
+            self._owners.discard(system)
+
+    def _notify(self, states=False):
+        """Notify the systems containing this block of a change.
+
+        Parameter setters call this method, so that the systems only
+        update what depends on this block.
+
+        Parameters
+        ----------
+        states : bool, optional
+            True if the state arrays of the block were replaced.
+            Defaults to False.
+        """
+        if self._owners:
+            for system in list(self._owners):
+                system._on_block_changed(self, states)
+
+    def _compact(self, shared):
+        """Release what the block can rebuild, see System.compact.
+
+        Parameters
+        ----------
+        shared : dict
+            Arrays shared by the blocks, see sigflow.core.memory.share.
+            Blocks replace their coefficients with the shared arrays of
+            the same content, which are read-only.
+
+        Note
+        ----
+        By default, nothing is released.
+        Blocks with coefficients or holding objects only needed to build
+        them, e.g. python-control objects, should redefine this method.
+        """
+
+    def _parameters(self):
+        """Parameters needed to reconstruct the block.
+
+        Returns
+        -------
+        dict
+            Parameters of the block as arrays, strings or numbers.
+
+        Note
+        ----
+        Subclasses with parameters should redefine this method together
+        with ``_from_parameters``.
+        """
+        return {}
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block from the output of ``_parameters``.
+
+        Parameters
+        ----------
+        parameters : dict
+            Parameters of the block.
+        label : str or None, optional
+            Label for this block.
+            Defaults to None
+
+        Returns
+        -------
+        Block
+        """
+        return cls(label=label)
+
+    def _states(self):
+        """Dynamic states of the block.
+
+        Returns
+        -------
+        dict
+            The state arrays of the block.
+            These are the actual arrays used by the block, not copies.
+            Keys are the names of the attributes holding the arrays,
+            without the leading underscore.
+
+        Note
+        ----
+        Blocks must update their state arrays in place, so that the
+        arrays can be bound to views of a larger buffer,
+        see ``_bind_states``.
+        """
+        return {}
+
+    def _bind_states(self, states):
+        """Replace the state arrays of the block.
+
+        Parameters
+        ----------
+        states : dict
+            Arrays to hold the states from now on, same keys as
+            ``_states``.
+        """
+        for key, array in states.items():
+            setattr(self, "_"+key, array)
+        self._notify(states=True)
+
+    def _set_states(self, states):
+        """Set the dynamic states of the block.
+
+        Parameters
+        ----------
+        states : dict
+            New values of the state arrays, same keys as ``_states``.
+            The arrays are copied in place.
+        """
+        current = self._states()
+        for key, value in states.items():
+            current[key][...] = value
+
     @property
     def inputs(self):
         """Input of the block."""
@@ -92,7 +404,7 @@ class Block:
         -------
             inputs
         """
-        self._inputs = np.atleast_1d(inputs)
+        self._inputs = np.atleast_1d(np.asarray(inputs, dtype=self.dtype))
 
     @property
     def output(self):
@@ -108,6 +420,7 @@ class Block:
     def ninput(self, ninput):
         """ninput setter"""
         self._ninput = ninput
+        self._notify()
 
     @property
     def noutput(self):
@@ -118,3 +431,4 @@ class Block:
     def noutput(self, noutput):
         """noutput setter"""
         self._noutput = noutput
+        self._notify()
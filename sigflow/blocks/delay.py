@@ -0,0 +1,426 @@
+"""Delay line block.
+"""
+import numpy as np
+import scipy.signal
+import scipy.special
+
+from sigflow.core.utils import rational_response
+from .base import Block
+
+
+INTERPOLATIONS = ("lagrange", "thiran")
+
+
+class DelayLine(Block):
+    """A fractional delay line block
+
+    y(t) = x(t - delay)
+
+    Parameters
+    ----------
+    delay : float
+        The delay in seconds.
+    dt : float
+        The sampling time in seconds.
+    order : int, optional
+        Order of the interpolation of fractional delays.
+        Defaults to 3.
+    interpolation : str, optional
+        "lagrange" for a Lagrange interpolation FIR filter, or "thiran"
+        for a Thiran allpass filter, see DelayLine.interpolation.
+        Defaults to "lagrange".
+    max_delay : float or None, optional
+        Longest delay the buffer is allocated for, in seconds.
+        Defaults to None, meaning the delay.
+    label : str, optional
+        Label for this block.
+        Defaults to None.
+
+    Attributes
+    ----------
+    latency : int
+        The integer part of the delay in samples, before the
+        interpolation filter.
+
+    Note
+    ----
+    The past inputs are kept in a preallocated circular buffer, so a
+    sample costs O(order) whatever the delay.
+    ``DelayLine.process`` copies contiguous slices of the buffer instead
+    of looping over the samples.
+    A delay of D samples is split into an integer delay M and a
+    fractional delay d interpolated by the filter, with d around order/2
+    for Lagrange and around order for Thiran, where the filters are most
+    accurate.
+    Thiran filters have a flat magnitude response but need D > order-1.
+    In a feedback loop, a delay line with a latency lets System.process
+    run the loop in chunks of up to latency+1 samples instead of sample
+    by sample.
+    """
+    def __init__(self, delay, dt, order=3, interpolation="lagrange",
+                 max_delay=None, label=None):
+        """Constructor
+
+        Parameters
+        ----------
+        delay : float
+            The delay in seconds.
+        dt : float
+            The sampling time in seconds.
+        order : int, optional
+            Order of the interpolation of fractional delays.
+            Defaults to 3.
+        interpolation : str, optional
+            "lagrange" for a Lagrange interpolation FIR filter, or
+            "thiran" for a Thiran allpass filter.
+            Defaults to "lagrange".
+        max_delay : float or None, optional
+            Longest delay the buffer is allocated for, in seconds.
+            Defaults to None, meaning the delay.
+        label : str, optional
+            Label for this block.
+            Defaults to None.
+        """
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError("interpolation must be one of {}."
+                             "".format(", ".join(INTERPOLATIONS)))
+        order = int(order)
+        if order < 0:
+            raise ValueError("order must be a non-negative integer.")
+        self._interpolation = interpolation
+        self._order = order
+        self._dt = float(dt)
+        self._delay = None
+        self._max_delay = max_delay
+        self.latency = 0
+        self._taps = None  # Lagrange interpolation taps, reversed
+        self._allpass_coefficients = None  # (b, a) of the Thiran filter
+
+        ## Circular buffer stored twice in a row, so that the last samples
+        ## are always a contiguous slice.
+        self._buffer = None
+        self._position = None  # index of the newest sample
+        self._allpass = None  # Thiran filter states at the last sample
+        self._allpass_now = None  # Thiran filter states now
+        self.delay = delay
+        super().__init__(label=label)
+
+    @property
+    def delay(self):
+        """The delay in seconds."""
+        return self._delay
+
+    @delay.setter
+    def delay(self, delay):
+        """delay.setter"""
+        delay = float(delay)
+        if delay < 0:
+            raise ValueError("delay must not be negative.")
+        samples = round(delay / self._dt, 9)
+        order = self._order
+        if self._interpolation == "lagrange":
+            integer = max(int(np.floor(samples - (order-1)/2)), 0)
+            fraction = samples - integer
+            self._taps = _lagrange(fraction, order)[::-1].astype(
+                self.dtype)
+        else:
+            integer = max(int(np.floor(samples - order + 0.5)), 0)
+            fraction = samples - integer
+            if order > 0 and fraction <= order - 1:
+                raise ValueError("delay must be longer than order-1 "
+                                 "samples for a Thiran filter.")
+            a = _thiran(fraction, order)
+            self._allpass_coefficients = (a[::-1].astype(self.dtype),
+                                          a.astype(self.dtype))
+        self._delay = delay
+        self.latency = integer
+        n_taps = 1 if self._taps is None else len(self._taps)
+        size = integer + n_taps
+        if self._max_delay is not None:
+            size = max(size, int(np.ceil(self._max_delay / self._dt))
+                       + order + 1)
+        rebound = self._buffer is None or size > len(self._buffer)//2
+        if rebound:
+            self._resize(size)
+        if self._interpolation == "thiran" and (
+                self._allpass is None or len(self._allpass) != order):
+            self._allpass = np.zeros(order, dtype=self.dtype)
+            self._allpass_now = np.zeros(order, dtype=self.dtype)
+            rebound = True
+        self._notify(states=rebound)
+
+    @property
+    def dt(self):
+        """Sampling time"""
+        return self._dt
+
+    @property
+    def order(self):
+        """Order of the interpolation of fractional delays."""
+        return self._order
+
+    @property
+    def interpolation(self):
+        """Interpolation of fractional delays, "lagrange" or "thiran".
+
+        Note
+        ----
+        Lagrange filters are FIR filters, exact at low frequencies, whose
+        magnitude response drops towards the Nyquist frequency.
+        Thiran filters are allpass filters with a maximally flat group
+        delay at low frequencies.
+        """
+        return self._interpolation
+
+    def _resize(self, size):
+        """Reallocate the buffer for size samples, keeping the newest."""
+        buffer = np.zeros(2*size, dtype=self.dtype)
+        if self._buffer is not None:
+            kept = self._tail(min(size, len(self._buffer)//2))
+            buffer[size-len(kept):size] = kept
+            buffer[2*size-len(kept):] = kept
+        self._buffer = buffer
+        self._position = np.array([size-1], dtype=np.int64)
+
+    def _tail(self, count):
+        """The last count inputs, oldest first, as a view of the buffer."""
+        size = len(self._buffer) // 2
+        end = int(self._position[0]) + size + 1
+        return self._buffer[end-count:end]
+
+    def _push(self, x):
+        """Append inputs to the buffer."""
+        buffer = self._buffer
+        size = len(buffer) // 2
+        if len(x) > size:
+            x = x[-size:]
+        n = len(x)
+        start = (int(self._position[0]) + 1) % size
+        first = min(n, size - start)
+        buffer[start:start+first] = x[:first]
+        buffer[size+start:size+start+first] = x[:first]
+        buffer[:n-first] = x[first:]
+        buffer[size:size+n-first] = x[first:]
+        self._position[0] = (start + n - 1) % size
+
+    def _delayed(self, x):
+        """The inputs of the interpolation filter for a chunk.
+
+        Returns
+        -------
+        array
+            The input delayed by self.latency samples, preceded by the
+            samples the interpolation filter needs from before.
+        """
+        n_taps = 1 if self._taps is None else len(self._taps)
+        history = self._tail(self.latency + n_taps - 1)
+        if len(x) <= self.latency:
+            return history[:len(x)+n_taps-1]
+        return np.concatenate([history, x[:len(x)-self.latency]])
+
+    @property
+    def inputs(self):
+        """Input of the block."""
+        return self._tail(1)
+
+    @inputs.setter
+    def inputs(self, _inputs):
+        """inputs.setter, push the input into the buffer."""
+        if self._allpass is not None:
+            self._allpass[:] = self._allpass_now
+        self._push(np.atleast_1d(np.asarray(_inputs, dtype=self.dtype)))
+
+    def _i2o(self):
+        """Delay the current input.
+
+        Returns
+        -------
+        float
+            The output of the delay line.
+        """
+        if self._taps is not None:
+            n_taps = len(self._taps)
+            window = self._tail(self.latency + n_taps)[:n_taps]
+            return self._taps @ window
+        w = self._tail(self.latency + 1)[0]
+        b, a = self._allpass_coefficients
+        if len(a) == 1:
+            return b[0] * w
+        state = self._allpass
+        y = b[0]*w + state[0]
+        now = self._allpass_now
+        now[:] = b[1:]*w - a[1:]*y
+        now[:-1] += state[1:]
+        return y
+
+    def process(self, inputs):
+        """Delay a chunk of samples, see Block.process."""
+        x = np.atleast_2d(np.asarray(inputs, dtype=self.dtype))[0]
+        n = len(x)
+        if n == 0:
+            return np.empty((1, 0), dtype=self.dtype)
+        w = self._delayed(x)
+        if self._taps is not None:
+            y = np.convolve(w, self._taps[::-1], mode="valid")
+        elif len(self._allpass_coefficients[1]) == 1:
+            y = self._allpass_coefficients[0][0] * w
+        else:
+            ## keep the states at the last sample, as sample by sample
+            b, a = self._allpass_coefficients
+            y = np.empty(n, dtype=self.dtype)
+            if n > 1:
+                y[:-1], self._allpass[:] = scipy.signal.lfilter(
+                    b, a, w[:-1], zi=self._allpass_now)
+            else:
+                self._allpass[:] = self._allpass_now
+            last, self._allpass_now[:] = scipy.signal.lfilter(
+                b, a, w[-1:], zi=self._allpass)
+            y[-1] = last[0]
+        self._push(x)
+        return y.reshape(1, -1).astype(self.dtype, copy=False)
+
+    def _peek(self, n):
+        """Outputs of the next samples, see Block._peek."""
+        if n > self.latency:
+            raise ValueError("can only peek at the next {} samples"
+                             "".format(self.latency))
+        w = self._delayed(np.empty(n, dtype=self.dtype))
+        if self._taps is not None:
+            y = np.convolve(w, self._taps[::-1], mode="valid")
+        else:
+            b, a = self._allpass_coefficients
+            if len(a) == 1:
+                y = b[0] * w
+            else:
+                y, _ = scipy.signal.lfilter(b, a, w, zi=self._allpass_now)
+        return y.reshape(1, -1).astype(self.dtype, copy=False)
+
+    def initialize_steady_state(self, inputs):
+        """Fill the buffer with a constant input.
+
+        Parameters
+        ----------
+        inputs : float or array
+            The constant input.
+
+        Returns
+        -------
+        array
+            The steady-state output.
+        """
+        u = np.asarray(inputs, dtype=float).item()
+        self._buffer[:] = u
+        if self._allpass is not None and len(self._allpass):
+            b, a = self._allpass_coefficients
+            zi = scipy.signal.lfilter_zi(b.astype(float), a.astype(float))
+            self._allpass[:] = zi * u
+            self._allpass_now[:] = zi * u
+        return np.atleast_1d(self._i2o())
+
+    def frequency_response(self, freqs):
+        """Frequency response of the delay line.
+
+        Parameters
+        ----------
+        freqs : array
+            Frequencies in Hz.
+
+        Returns
+        -------
+        array
+            (n_freq, 1, 1) complex array of the gains.
+        """
+        freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+        if self._taps is not None:
+            b, a = self._taps[::-1], [1.]
+        else:
+            b, a = self._allpass_coefficients
+        response = rational_response(b, a, freqs, self.dt)
+        delay = np.exp(-2j*np.pi*freqs*self.dt*self.latency)
+        return response * delay.reshape(-1, 1, 1)
+
+    def _cast(self):
+        """Cast the coefficients and states, see Block._cast."""
+        if self._taps is not None:
+            self._taps = self._taps.astype(self.dtype)
+        else:
+            self._allpass_coefficients = tuple(
+                c.astype(self.dtype) for c in self._allpass_coefficients)
+        super()._cast()
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        parameters = {"delay": self.delay, "dt": self.dt,
+                      "order": self.order,
+                      "interpolation": self.interpolation}
+        if self._max_delay is not None:
+            parameters["max_delay"] = self._max_delay
+        return parameters
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        max_delay = parameters.get("max_delay")
+        if max_delay is not None:
+            max_delay = float(max_delay)
+        return cls(float(parameters["delay"]), float(parameters["dt"]),
+                   order=int(parameters["order"]),
+                   interpolation=str(parameters["interpolation"]),
+                   max_delay=max_delay, label=label)
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        states = {"buffer": self._buffer, "position": self._position}
+        if self._allpass is not None:
+            states["allpass"] = self._allpass
+            states["allpass_now"] = self._allpass_now
+        return states
+
+
+def _lagrange(fraction, order):
+    """Taps of the Lagrange interpolation of a fractional delay.
+
+    Parameters
+    ----------
+    fraction : float
+        The delay in samples, between 0 and order.
+    order : int
+        Order of the interpolation.
+
+    Returns
+    -------
+    array
+        The order+1 taps, h[i] being the gain of the input delayed by
+        i samples.
+    """
+    taps = np.ones(order+1)
+    for i in range(order+1):
+        for j in range(order+1):
+            if j != i:
+                taps[i] *= (fraction - j) / (i - j)
+    return taps
+
+
+def _thiran(fraction, order):
+    """Denominator of the Thiran allpass filter of a fractional delay.
+
+    Parameters
+    ----------
+    fraction : float
+        The delay in samples, larger than order-1.
+    order : int
+        Order of the filter.
+
+    Returns
+    -------
+    array
+        The order+1 coefficients, starting with 1.
+        The numerator is the same reversed.
+    """
+    a = np.ones(order+1)
+    for k in range(1, order+1):
+        n = np.arange(order+1)
+        a[k] = ((-1)**k * scipy.special.comb(order, k)
+                * np.prod((fraction - order + n)
+                          / (fraction - order + k + n)))
+    return a
@@ -4,6 +4,7 @@ import control
 import numpy as np
 import scipy
 
+from sigflow.core.utils import rational_response
 from .base import Block
 
 
@@ -33,6 +34,11 @@ class Filter(Block):
     When ``inputs.setter`` the current input and output is saved into a register
     for next cycle.
     This means that calling ``inputs.setter`` indicates the end of a cycle.
+    The discrete coefficients are always computed in float64 and cast to
+    ``dtype`` afterwards.
+    The poles of high order or oversampled filters are sensitive to the
+    rounding of the coefficients, so float32 may make them unstable.
+    LTI is robust to this.
     """
     def __init__(self, tf, fs, method="bilinear", label=None):
         """Constructor
@@ -53,10 +59,13 @@ class Filter(Block):
             Defaults to None.
         """
         self._tf = None
+        self._num = None  # Numerator and denominator of self.tf
+        self._den = None
         self._fs = None
         self._method = None
         self._num_d = None
         self._den_d = None
+        self._coefficients = None  # (num_d, den_d[1:]) cast to dtype.
         self._input_register = None
         self._output_register = None
         self.tf = tf
@@ -68,12 +77,77 @@ class Filter(Block):
         """Pass input through filter and return the output"""
         input_register = self.input_register
         output_register = self.output_register
-        num_d = self.num_d
-        den_d = self.den_d
+        num_d, den_d = self._coefficients
         out = (np.dot(num_d, input_register)
-               - np.dot(den_d[1:], output_register[1:]))
+               - np.dot(den_d, output_register[1:]))
         return out
 
+    def initialize_steady_state(self, inputs):
+        """Fill the registers with the equilibrium for a constant input.
+
+        Parameters
+        ----------
+        inputs : float or array
+            The constant input.
+
+        Returns
+        -------
+        array
+            The steady-state output.
+        """
+        u = np.asarray(inputs, dtype=float).item()
+        num_d, den_d = self._coefficients
+        y = np.sum(num_d, dtype=float) * u / (1 + np.sum(den_d, dtype=float))
+        self._inputs = u
+        self.input_register[:] = u
+        self.output_register[:] = y
+        return np.atleast_1d(y)
+
+    def frequency_response(self, freqs):
+        """Frequency response of the transfer function.
+
+        Parameters
+        ----------
+        freqs : array
+            Frequencies in Hz.
+
+        Returns
+        -------
+        array
+            (n_freq, 1, 1) complex array of tf evaluated at 2j*pi*freqs.
+        """
+        return rational_response(self._num, self._den, freqs)
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        return {"num": self._num, "den": self._den,
+                "fs": self.fs, "method": self.method,
+                "num_d": self.num_d, "den_d": self.den_d}
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block without discretizing tf."""
+        filt = cls.__new__(cls)
+        filt._tf = None
+        filt._num = parameters["num"]
+        filt._den = parameters["den"]
+        filt._fs = float(parameters["fs"])
+        filt._method = str(parameters["method"])
+        filt._num_d = parameters["num_d"]
+        filt._den_d = parameters["den_d"]
+        filt._coefficients = None
+        filt._input_register = None
+        filt._output_register = None
+        filt._cast_coefficients()
+        filt._reset_register()
+        Block.__init__(filt, label=label)
+        return filt
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        return {"input_register": self.input_register,
+                "output_register": self.output_register}
+
     @property
     def inputs(self):
         """Input of the block."""
@@ -89,6 +163,8 @@ class Filter(Block):
     @property
     def tf(self):
         """The transfer function of the filter (continuous)."""
+        if self._tf is None and self._num is not None:
+            self._tf = control.tf(self._num, self._den)
         return self._tf
 
     @tf.setter
@@ -102,6 +178,8 @@ class Filter(Block):
             raise ValueError("tf must be a stable transfer function.")
 
         self._tf = _tf
+        self._num = np.array(_tf.num[0][0], dtype=float)
+        self._den = np.array(_tf.den[0][0], dtype=float)
         self._set_coefs()
         self._reset_register()
 
@@ -138,6 +216,7 @@ class Filter(Block):
     def num_d(self, _num_d):
         """num_d.setter"""
         self._num_d = _num_d
+        self._cast_coefficients()
 
     @property
     def den_d(self):
@@ -148,6 +227,7 @@ class Filter(Block):
     def den_d(self, _den_d):
         """den_d.setter"""
         self._den_d = _den_d
+        self._cast_coefficients()
 
     @property
     def input_register(self):
@@ -171,14 +251,14 @@ class Filter(Block):
 
     def _set_coefs(self):
         """Set discrete filter coefficients."""
-        if (self.tf is not None
+        if (self._num is not None
             and self.fs is not None
             and self.method is not None):
             # Set coefficients for discrete filters.
             # Note: H(z) = (b0 + b1*z^1...)/(1 + a1*z^1...)
             # print("set coefs")
-            num = self.tf.num[0][0]
-            den = self.tf.den[0][0]
+            num = self._num
+            den = self._den
             dt = 1/self.fs
             method = self.method
             num_d, den_d, _ = scipy.signal.cont2discrete(
@@ -188,11 +268,29 @@ class Filter(Block):
             self.num_d = num_d
             self.den_d = den_d
 
+    def _cast_coefficients(self):
+        """Cast the discrete coefficients to self.dtype."""
+        if self.num_d is not None and self.den_d is not None:
+            self._coefficients = (
+                np.asarray(self.num_d).astype(self.dtype, copy=False),
+                np.asarray(self.den_d)[1:].astype(self.dtype, copy=False))
+
+    def _cast(self):
+        """Cast the states and coefficients, see Block._cast."""
+        self._cast_coefficients()
+        super()._cast()
+
     def _reset_register(self):
-        """Reset the input/output register"""
+        """Reset the input/output register if their sizes changed"""
         if self.num_d is not None and self.den_d is not None:
-            self.input_register = np.zeros_like(self.num_d)
-            self.output_register = np.zeros_like(self.den_d)
+            if (self.input_register is not None
+                    and len(self.input_register) == len(self.num_d)
+                    and len(self.output_register) == len(self.den_d)):
+                self._notify()
+                return
+            self.input_register = np.zeros(len(self.num_d), dtype=self.dtype)
+            self.output_register = np.zeros(len(self.den_d), dtype=self.dtype)
+            self._notify(states=True)
 
     def _latch_input_register(self):
         """Shift and then put input value into input register
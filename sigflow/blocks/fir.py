@@ -0,0 +1,348 @@
+"""Finite impulse response filter block.
+"""
+import numpy as np
+import scipy.fft
+
+from sigflow.core.utils import rational_response
+from .base import Block
+
+
+class FIR(Block):
+    """A finite impulse response filter block
+
+    y[n] = taps[0]*x[n] + taps[1]*x[n-1] + ... + taps[L-1]*x[n-L+1]
+
+    Parameters
+    ----------
+    taps : array
+        The impulse response of the filter.
+    partition : int or None, optional
+        Partition size for the uniformly partitioned overlap-save
+        convolution of chunks.
+        If None, the chunks are convolved with the whole impulse
+        response at once.
+        Defaults to None.
+    direct_threshold : int, optional
+        Chunks are convolved in direct form if the number of taps is not
+        larger than this.
+        Defaults to 64.
+    dt : float or None, optional
+        Sampling time, for the frequency response.
+        Defaults to None.
+    label : str, optional
+        Label for this filter.
+        Defaults to None.
+
+    Note
+    ----
+    Calling the block filters one sample in direct form.
+    ``FIR.process`` filters a chunk of samples with FFT overlap-save
+    convolution.
+    With a partition size of B, the impulse response is split into
+    blocks of B taps and the chunk is processed in blocks of B samples
+    using FFTs of size 2B, so the cost stays low even for chunks much
+    shorter than the impulse response.
+    The input history is kept across calls and chunks.
+    The FFTs are computed in the precision of ``dtype``.
+    """
+    def __init__(self, taps, partition=None, direct_threshold=64, dt=None,
+                 label=None):
+        """Constructor
+
+        Parameters
+        ----------
+        taps : array
+            The impulse response of the filter.
+        partition : int or None, optional
+            Partition size for the uniformly partitioned overlap-save
+            convolution of chunks.
+            If None, the chunks are convolved with the whole impulse
+            response at once.
+            Defaults to None.
+        direct_threshold : int, optional
+            Chunks are convolved in direct form if the number of taps is
+            not larger than this.
+            Defaults to 64.
+        dt : float or None, optional
+            Sampling time, for the frequency response.
+            Defaults to None.
+        label : str, optional
+            Label for this filter.
+            Defaults to None.
+        """
+        self._taps = None
+        self._partition = None
+        self._history = None
+        self._spectra = None
+        self._spectra_valid = None
+        self._taps_spectra = {}
+        self.direct_threshold = direct_threshold
+        self.dt = dt
+        self.taps = taps
+        self.partition = partition
+        super().__init__(label=label)
+
+    @property
+    def taps(self):
+        """The impulse response of the filter."""
+        return self._taps
+
+    @taps.setter
+    def taps(self, _taps):
+        """taps.setter"""
+        _taps = np.asarray(_taps, dtype=self.dtype)
+        if _taps.ndim != 1 or len(_taps) == 0:
+            raise ValueError("taps must be a non-empty 1-D array.")
+        self._taps = _taps
+        self._taps_reversed = _taps[::-1].copy()
+        self._taps_spectra = {}
+        # The last element is the current input.
+        # Keep the history if the number of taps is unchanged.
+        rebound = self._history is None or len(self._history) != len(_taps)
+        if rebound:
+            self._history = np.zeros(len(_taps), dtype=self.dtype)
+        self._reset_spectra(rebound)
+
+    @property
+    def partition(self):
+        """Partition size of the partitioned convolution."""
+        return self._partition
+
+    @partition.setter
+    def partition(self, _partition):
+        """partition.setter"""
+        if _partition is not None:
+            _partition = int(_partition)
+            if _partition < 1:
+                raise ValueError("partition must be a positive integer.")
+        self._partition = _partition
+        self._taps_spectra = {}
+        self._reset_spectra()
+
+    @property
+    def inputs(self):
+        """Input of the block."""
+        return self._history[-1:]
+
+    @inputs.setter
+    def inputs(self, _inputs):
+        """inputs.setter, push the input into the history."""
+        self._history[:-1] = self._history[1:]
+        self._history[-1] = np.asarray(_inputs).item()
+        self._spectra_valid[0] = 0.
+
+    def _i2o(self):
+        """Filter the current input in direct form.
+
+        Returns
+        -------
+        float
+            The output of the filter.
+        """
+        return self._taps_reversed @ self._history
+
+    def initialize_steady_state(self, inputs):
+        """Fill the history with a constant input.
+
+        Parameters
+        ----------
+        inputs : float or array
+            The constant input.
+
+        Returns
+        -------
+        array
+            The steady-state output.
+        """
+        u = np.asarray(inputs, dtype=float).item()
+        self._history[:] = u
+        self._spectra_valid[0] = 0.
+        return np.atleast_1d(self._i2o())
+
+    def frequency_response(self, freqs):
+        """Frequency response of the filter.
+
+        Parameters
+        ----------
+        freqs : array
+            Frequencies in Hz.
+
+        Returns
+        -------
+        array
+            (n_freq, 1, 1) complex array of the gains.
+        """
+        if self.dt is None:
+            raise ValueError("the frequency response requires dt.")
+        return rational_response(self.taps, [1.], freqs, self.dt)
+
+    def process(self, inputs):
+        """Filter a chunk of samples, see Block.process."""
+        x = np.atleast_2d(np.asarray(inputs, dtype=self.dtype))[0]
+        n_taps = len(self.taps)
+        if n_taps <= self.direct_threshold:
+            full = np.concatenate([self._history[1:], x])
+            y = np.convolve(full, self.taps, mode="valid")
+        elif self.partition is None:
+            full = np.concatenate([self._history[1:], x])
+            y = self._overlap_save(full)
+        else:
+            y = self._partitioned_overlap_save(x)
+            full = np.concatenate([self._history[1:], x])
+        self._history[:] = full[-n_taps:]
+        return y.reshape(1, -1)
+
+    @property
+    def _complex_dtype(self):
+        """Complex data type with the precision of self.dtype."""
+        return np.promote_types(self.dtype, np.complex64)
+
+    def _cast(self):
+        """Cast the taps and states, see Block._cast."""
+        if self._taps.dtype != self.dtype:
+            self._taps = self._taps.astype(self.dtype)
+            self._taps_reversed = self._taps[::-1].copy()
+            self._taps_spectra = {}
+        super()._cast()
+        self._spectra_valid[0] = 0.
+
+    def _taps_spectrum(self, taps, nfft):
+        """Cached spectrum of the taps zero-padded to nfft."""
+        key = (taps.shape, nfft)
+        if key not in self._taps_spectra:
+            self._taps_spectra[key] = scipy.fft.rfft(taps, nfft, axis=-1)
+        return self._taps_spectra[key]
+
+    def _overlap_save(self, full):
+        """Overlap-save convolution with the whole impulse response.
+
+        Parameters
+        ----------
+        full : array
+            The input history followed by the chunk.
+
+        Returns
+        -------
+        array
+            The output for the chunk.
+        """
+        n_taps = len(self.taps)
+        n = len(full) - n_taps + 1
+        nfft = scipy.fft.next_fast_len(n_taps - 1 + min(n, 4*n_taps))
+        step = nfft - n_taps + 1
+        nseg = -(-n // step)
+        padded = np.zeros((nseg-1)*step + nfft, dtype=self.dtype)
+        padded[:len(full)] = full
+        segments = np.lib.stride_tricks.as_strided(
+            padded, shape=(nseg, nfft),
+            strides=(step*padded.strides[0], padded.strides[0]))
+        spectra = scipy.fft.rfft(segments, axis=-1)
+        spectra *= self._taps_spectrum(self.taps, nfft)
+        y = scipy.fft.irfft(spectra, nfft, axis=-1)[:, n_taps-1:]
+        return y.reshape(-1)[:n]
+
+    def _partitioned_overlap_save(self, x):
+        """Uniformly partitioned overlap-save convolution.
+
+        Parameters
+        ----------
+        x : array
+            The chunk.
+
+        Returns
+        -------
+        array
+            The output for the chunk.
+        """
+        size = self.partition
+        n_taps = len(self.taps)
+        n_part = -(-n_taps // size)
+        n = len(x)
+        n_block = -(-n // size)
+
+        ## Spectra of the 2B windows ending at each block of the chunk,
+        ## preceded by those of the n_part-1 previous blocks.
+        ## Samples before the history only meet zero taps.
+        padded = np.zeros((n_part+1)*size + n_block*size, dtype=self.dtype)
+        start = (n_part+1)*size - (n_taps-1)
+        padded[start:start+n_taps-1] = self._history[1:]
+        padded[(n_part+1)*size:(n_part+1)*size+n] = x
+        if self._spectra_valid[0]:
+            new = np.lib.stride_tricks.as_strided(
+                padded[n_part*size:], shape=(n_block, 2*size),
+                strides=(size*padded.strides[0], padded.strides[0]))
+            spectra = np.concatenate(
+                [self._spectra.view(self._complex_dtype),
+                 scipy.fft.rfft(new, axis=-1)])
+        else:
+            windows = np.lib.stride_tricks.as_strided(
+                padded[size:], shape=(n_block+n_part-1, 2*size),
+                strides=(size*padded.strides[0], padded.strides[0]))
+            spectra = scipy.fft.rfft(windows, axis=-1)
+
+        taps = np.zeros(n_part*size, dtype=self.dtype)
+        taps[:n_taps] = self.taps
+        taps_spectra = self._taps_spectrum(taps.reshape(n_part, size),
+                                           2*size)
+        out = np.zeros((n_block, size+1), dtype=self._complex_dtype)
+        for p in range(n_part):
+            out += taps_spectra[p] * spectra[n_part-1-p:n_part-1-p+n_block]
+        y = scipy.fft.irfft(out, 2*size, axis=-1)[:, size:]
+
+        ## Keep the spectra of the last blocks if the chunk ended at a
+        ## block boundary.
+        if n % size == 0 and n_part > 1:
+            self._spectra.view(self._complex_dtype)[:] = spectra[-(n_part-1):]
+            self._spectra_valid[0] = 1.
+        else:
+            self._spectra_valid[0] = float(n_part == 1 and n % size == 0)
+        return y.reshape(-1)[:n]
+
+    def _reset_spectra(self, rebound=False):
+        """Reset the cached spectra of the previous input blocks.
+
+        Parameters
+        ----------
+        rebound : bool, optional
+            True if other state arrays were replaced.
+            Defaults to False.
+        """
+        if self._taps is None:
+            return
+        n_part = 1
+        size = 0
+        if self.partition is not None:
+            size = self.partition
+            n_part = -(-len(self.taps) // size)
+        # Complex spectra stored as pairs of floats.
+        shape = (n_part-1, 2*(size+1))
+        if self._spectra is None or self._spectra.shape != shape:
+            self._spectra = np.zeros(shape, dtype=self.dtype)
+            self._spectra_valid = np.zeros(1, dtype=self.dtype)
+            rebound = True
+        self._spectra_valid[0] = 0.
+        self._notify(states=rebound)
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        return {"taps": self.taps, "partition": self.partition,
+                "direct_threshold": self.direct_threshold, "dt": self.dt}
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        partition = parameters.get("partition")
+        if partition is not None:
+            partition = int(partition)
+        dt = parameters.get("dt")
+        if dt is not None:
+            dt = float(dt)
+        return cls(parameters["taps"], partition=partition,
+                   direct_threshold=int(parameters["direct_threshold"]),
+                   dt=dt, label=label)
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        return {"history": self._history,
+                "spectra": self._spectra,
+                "spectra_valid": self._spectra_valid}
@@ -29,6 +29,8 @@ class Junction(Matrix):
        input 2 ------- |
        input 3 ---------
     """
+    __slots__ = ("_signs",)
+
     def __init__(self, signs="++", label=None):
         """Constructor
 
@@ -46,6 +48,15 @@ class Junction(Matrix):
         super().__init__(label=label)
         self.signs = signs
 
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        return {"signs": self.signs}
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        return cls(str(parameters["signs"]), label=label)
+
     @property
     def signs(self):
         """Signs of the inputs"""
@@ -0,0 +1,475 @@
+"""Kalman filter block.
+"""
+import control
+import numpy as np
+import scipy.linalg
+
+from .base import Block
+
+
+class KalmanFilter(Block):
+    """A Kalman filter estimating the states of a discrete-time model
+
+    x[k+1] = A @ x[k] + B @ u[k] + w[k]
+
+    y[k] = C @ x[k] + D @ u[k] + v[k]
+
+    with process noise covariance Q = E[w w^T] and measurement noise
+    covariance R = E[v v^T].
+
+    Parameters
+    ----------
+    model : control.StateSpace or tuple
+        The discrete-time model, or its matrices (A, B, C, D).
+    Q : array
+        Covariance of the process noise.
+    R : array
+        Covariance of the measurement noise.
+    steady_state : bool, optional
+        True to use the steady-state gain, False to propagate the
+        covariance of the estimates and update the gain every sample,
+        see KalmanFilter.steady_state.
+        Defaults to True.
+    covariance : array or None, optional
+        Initial covariance of the predicted states in time-varying mode.
+        Defaults to None, meaning the steady-state covariance.
+    nbatch : int, optional
+        Number of independent estimators of the same model.
+        Defaults to 1.
+    label : str, optional
+        Label for this block.
+        Defaults to None.
+
+    Attributes
+    ----------
+    ninput : int
+        nbatch*(nu+ny) inputs, the inputs u and then the measurements y
+        of each estimator in turn.
+    noutput : int
+        nbatch*nx outputs, the filtered state estimates x[k|k] of each
+        estimator in turn.
+
+    Note
+    ----
+    The steady-state gain is computed once from the discrete algebraic
+    Riccati equation, and the update and prediction are fused into two
+    matrix products per sample, shared by all the estimators of the
+    batch.
+    ``KalmanFilter.process`` evaluates the steady-state filter of a chunk
+    with a parallel prefix scan of the predictions, i.e. log2(n) products
+    of the whole chunk instead of n products of single samples.
+    In time-varying mode, the covariance does not depend on the
+    measurements, so one covariance and gain serve the whole batch.
+    """
+    def __init__(self, model, Q, R, steady_state=True, covariance=None,
+                 nbatch=1, label=None):
+        """Constructor
+
+        Parameters
+        ----------
+        model : control.StateSpace or tuple
+            The discrete-time model, or its matrices (A, B, C, D).
+        Q : array
+            Covariance of the process noise.
+        R : array
+            Covariance of the measurement noise.
+        steady_state : bool, optional
+            True to use the steady-state gain, False to propagate the
+            covariance of the estimates and update the gain every sample.
+            Defaults to True.
+        covariance : array or None, optional
+            Initial covariance of the predicted states in time-varying
+            mode.
+            Defaults to None, meaning the steady-state covariance.
+        nbatch : int, optional
+            Number of independent estimators of the same model.
+            Defaults to 1.
+        label : str, optional
+            Label for this block.
+            Defaults to None.
+        """
+        if isinstance(model, control.StateSpace):
+            if control.isctime(model, strict=True):
+                raise ValueError("model must be a discrete-time system.")
+            model = (model.A, model.B, model.C, model.D)
+        nbatch = int(nbatch)
+        if nbatch < 1:
+            raise ValueError("nbatch must be a positive integer.")
+        self._nbatch = nbatch
+        self._steady_state = bool(steady_state)
+        self._matrices = None
+        self._state = None
+        self._covariance = None
+        self.update_model(*model, Q=Q, R=R)
+        if covariance is not None:
+            self._covariance[:] = covariance
+            self._update_gain()
+        super().__init__(label=label)
+        self.ninput = nbatch * (self.nu + self.ny)
+        self.noutput = nbatch * self.nx
+
+    def update_model(self, A=None, B=None, C=None, D=None, Q=None, R=None):
+        """Change the model or the noise covariances.
+
+        Parameters
+        ----------
+        A, B, C, D : array or None, optional
+            New model matrices, None to keep the current ones.
+            The number of states, inputs and outputs cannot change.
+        Q, R : array or None, optional
+            New noise covariances, None to keep the current ones.
+
+        Note
+        ----
+        The steady-state gain is computed again.
+        In time-varying mode, the covariance of the estimates is kept
+        and the gain follows from the next sample on.
+        """
+        new = {"A": A, "B": B, "C": C, "D": D, "Q": Q, "R": R}
+        if self._matrices is not None:
+            for key, value in new.items():
+                if value is None:
+                    new[key] = self._matrices[key]
+        if new["A"] is None or new["B"] is None or new["C"] is None:
+            raise ValueError("A, B and C must be given.")
+        A = np.atleast_2d(np.asarray(new["A"], dtype=float))
+        B = np.asarray(new["B"], dtype=float)
+        if B.ndim < 2:
+            B = B.reshape(len(A), -1)
+        C = np.asarray(new["C"], dtype=float)
+        if C.ndim < 2:
+            C = C.reshape(-1, len(A))
+        D = np.zeros((len(C), B.shape[1])) if new["D"] is None else \
+            np.asarray(new["D"], dtype=float).reshape(len(C), B.shape[1])
+        Q = np.asarray(new["Q"], dtype=float).reshape(len(A), len(A))
+        R = np.asarray(new["R"], dtype=float).reshape(len(C), len(C))
+        if self._matrices is not None and (
+                A.shape != self._matrices["A"].shape
+                or B.shape != self._matrices["B"].shape
+                or C.shape != self._matrices["C"].shape):
+            raise ValueError("the number of states, inputs and outputs "
+                             "cannot change.")
+        self._matrices = {"A": A, "B": B, "C": C, "D": D, "Q": Q, "R": R}
+        covariance = scipy.linalg.solve_discrete_are(A.T, C.T, Q, R)
+        self._steady_covariance = covariance
+        if self._state is None:
+            self._state = np.zeros((self._nbatch, len(A)), dtype=self.dtype)
+            self._covariance = covariance.astype(self.dtype)
+        self._update_gain()
+        self._notify()
+
+    @property
+    def A(self):
+        """State matrix of the model."""
+        return self._matrices["A"]
+
+    @property
+    def B(self):
+        """Input matrix of the model."""
+        return self._matrices["B"]
+
+    @property
+    def C(self):
+        """Output matrix of the model."""
+        return self._matrices["C"]
+
+    @property
+    def D(self):
+        """Feedthrough matrix of the model."""
+        return self._matrices["D"]
+
+    @property
+    def Q(self):
+        """Covariance of the process noise."""
+        return self._matrices["Q"]
+
+    @property
+    def R(self):
+        """Covariance of the measurement noise."""
+        return self._matrices["R"]
+
+    @property
+    def nx(self):
+        """Number of states of an estimator."""
+        return len(self.A)
+
+    @property
+    def nu(self):
+        """Number of inputs u of an estimator."""
+        return self.B.shape[1]
+
+    @property
+    def ny(self):
+        """Number of measurements y of an estimator."""
+        return len(self.C)
+
+    @property
+    def nbatch(self):
+        """Number of independent estimators."""
+        return self._nbatch
+
+    @property
+    def steady_state(self):
+        """True to use the steady-state gain.
+
+        Note
+        ----
+        Otherwise, the covariance of the predicted states is propagated
+        with the Riccati recursion, e.g. to converge from a large initial
+        uncertainty or to follow a model changed with
+        KalmanFilter.update_model.
+        Switching to time-varying mode starts from the steady-state
+        covariance.
+        """
+        return self._steady_state
+
+    @steady_state.setter
+    def steady_state(self, steady_state):
+        """steady_state.setter"""
+        steady_state = bool(steady_state)
+        if steady_state != self._steady_state:
+            self._steady_state = steady_state
+            self._covariance = self._steady_covariance.astype(self.dtype)
+            self._update_gain()
+            self._notify(states=True)
+
+    @property
+    def gain(self):
+        """Current gain K, x[k|k] = x[k|k-1] + K (y - C x[k|k-1] - D u)."""
+        return self._gain.copy()
+
+    @property
+    def covariance(self):
+        """Covariance of the predicted states x[k|k-1]."""
+        if self._steady_state:
+            return self._steady_covariance.copy()
+        return self._covariance.astype(float)
+
+    def _update_gain(self):
+        """Compute the gain and the fused update matrices."""
+        A, B, C, D, R = (self._matrices[key] for key in "ABCDR")
+        if self._steady_state:
+            covariance = self._steady_covariance
+        else:
+            covariance = self._covariance.astype(float)
+        innovation = C @ covariance @ C.T + R
+        gain = scipy.linalg.solve(innovation, C @ covariance,
+                                  assume_a="pos").T
+        self._gain = gain
+        ## x[k|k] = [x[k|k-1], u, y] @ update
+        ## x[k+1|k] = [x[k|k], u] @ predict
+        update = np.concatenate([np.identity(len(A)) - gain @ C,
+                                 -gain @ D, gain], axis=1).T
+        predict = np.concatenate([A, B], axis=1).T
+        self._coefficients = (update.astype(self.dtype),
+                              predict.astype(self.dtype))
+
+    def _propagate_covariance(self):
+        """Riccati recursion of the covariance with the current gain."""
+        A, C, Q, R = (self._matrices[key] for key in "ACQR")
+        gain = self._gain
+        covariance = self._covariance.astype(float)
+        ## Joseph form, symmetric and positive for any gain
+        correction = np.identity(len(A)) - gain @ C
+        filtered = (correction @ covariance @ correction.T
+                    + gain @ R @ gain.T)
+        self._covariance[:] = A @ filtered @ A.T + Q
+
+    def _cast(self):
+        """Cast the coefficients and states, see Block._cast."""
+        self._update_gain()
+        super()._cast()
+
+    def _step(self, signals):
+        """Update and predict the states of the batch with a sample.
+
+        Parameters
+        ----------
+        signals : array
+            (nbatch, nu+ny) array of the inputs of each estimator.
+
+        Returns
+        -------
+        array
+            (nbatch, nx) array of the filtered state estimates.
+        """
+        if not self._steady_state:
+            self._update_gain()
+        update, predict = self._coefficients
+        filtered = np.concatenate([self._state, signals], axis=1) @ update
+        self._state[:] = np.concatenate(
+            [filtered, signals[:, :self.nu]], axis=1) @ predict
+        if not self._steady_state:
+            self._propagate_covariance()
+        return filtered
+
+    def _i2o(self):
+        """Update and predict the states with a sample.
+
+        Returns
+        -------
+        float or array
+            The filtered state estimates of each estimator.
+        """
+        signals = np.broadcast_to(self.inputs, self.ninput).reshape(
+            self._nbatch, -1)
+        filtered = self._step(signals)
+        output = filtered.ravel()
+        if self.noutput == 1:
+            return output[0]
+        return output
+
+    def process(self, inputs):
+        """Estimate the states over a chunk of samples.
+
+        Parameters
+        ----------
+        inputs : array
+            (ninput, n) array of n samples of each input.
+
+        Returns
+        -------
+        array
+            (noutput, n) array of the filtered state estimates.
+        """
+        signals = np.atleast_2d(np.asarray(inputs, dtype=self.dtype))
+        if len(signals) != self.ninput:
+            raise ValueError("expected {} inputs, got {}"
+                             "".format(self.ninput, len(signals)))
+        n = signals.shape[1]
+        if n == 0:
+            return np.empty((self.noutput, 0), dtype=self.dtype)
+        self.inputs = signals[:, -1]
+        ## (n, nbatch, nu+ny)
+        signals = signals.reshape(self._nbatch, -1, n).transpose(2, 0, 1)
+        if not self._steady_state:
+            filtered = np.empty((n, self._nbatch, self.nx),
+                                dtype=self.dtype)
+            for k in range(n):
+                filtered[k] = self._step(signals[k])
+            return filtered.transpose(1, 2, 0).reshape(self.noutput, n)
+
+        update, predict = self._coefficients
+        nx = self.nx
+        correction, inputs_gain = update[:nx], update[nx:]
+        state_matrix, input_matrix = predict[:nx], predict[nx:]
+        ## x[k|k] = x[k|k-1] @ correction + driven[k]
+        ## x[k+1|k] = x[k|k-1] @ transition + forced[k]
+        driven = signals @ inputs_gain
+        transition = correction @ state_matrix
+        forced = driven @ state_matrix + signals[..., :self.nu] @ input_matrix
+        forced[0] += self._state @ transition
+        predicted = _linear_scan(forced, transition)
+        priors = np.concatenate([self._state[np.newaxis], predicted[:-1]])
+        self._state[:] = predicted[-1]
+        filtered = priors @ correction + driven
+        return filtered.transpose(1, 2, 0).reshape(self.noutput, n)
+
+    def initialize_steady_state(self, inputs):
+        """Set the estimates to the equilibrium for constant inputs.
+
+        Parameters
+        ----------
+        inputs : float or array
+            The constant value of each input.
+
+        Returns
+        -------
+        array
+            The steady-state filtered state estimates.
+        """
+        signals = np.broadcast_to(np.ravel(np.asarray(inputs, dtype=float)),
+                                  self.ninput).reshape(self._nbatch, -1)
+        A, B = self.A, self.B
+        gain = self._gain
+        nx, nu = self.nx, self.nu
+        update = np.concatenate([np.identity(nx) - gain @ self.C,
+                                 -gain @ self.D, gain], axis=1)
+        transition = A @ update[:, :nx]
+        forced = signals @ (A @ update[:, nx:]).T + signals[:, :nu] @ B.T
+        state = np.linalg.solve(np.identity(nx) - transition, forced.T).T
+        self._state[:] = state
+        self.inputs = signals.ravel()
+        filtered = state @ update[:, :nx].T + signals @ update[:, nx:].T
+        return filtered.ravel()
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        parameters = {key.lower(): value
+                      for key, value in self._matrices.items()}
+        parameters.update(steady_state=int(self._steady_state),
+                          nbatch=self._nbatch)
+        return parameters
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        model = tuple(np.asarray(parameters[key]) for key in "abcd")
+        return cls(model, np.asarray(parameters["q"]),
+                   np.asarray(parameters["r"]),
+                   steady_state=bool(parameters["steady_state"]),
+                   nbatch=int(parameters["nbatch"]), label=label)
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        if self._state is None:
+            return {}
+        states = {"state": self._state}
+        if not self._steady_state:
+            states["covariance"] = self._covariance
+        return states
+
+
+def _linear_scan(forced, transition, size=128):
+    """Solve x[k] = x[k-1] @ transition + forced[k] with x[-1] = 0.
+
+    Parameters
+    ----------
+    forced : array
+        (n, nbatch, nx) array of the forcing terms.
+    transition : array
+        (nx, nx) transition matrix, applied on the right.
+    size : int, optional
+        Size of the blocks of samples times nx.
+        Defaults to 128.
+
+    Returns
+    -------
+    array
+        (n, nbatch, nx) array of the solution.
+
+    Note
+    ----
+    The samples are solved in blocks of L samples at once with a block
+    Toeplitz matrix of the powers of transition, and the values at the
+    ends of the blocks are carried over with a Hillis-Steele scan, so
+    the whole chunk only costs a few matrix products instead of n.
+    """
+    n, nbatch, nx = forced.shape
+    length = max(1, min(n, size // nx))
+    nblock = -(-n // length)
+    powers = [np.identity(nx, dtype=transition.dtype)]
+    for _ in range(length):
+        powers.append(powers[-1] @ transition)
+    ## block (i, j) is transition**(j-i) for i <= j
+    toeplitz = np.zeros((length, nx, length, nx), dtype=transition.dtype)
+    for i in range(length):
+        for j in range(i, length):
+            toeplitz[i, :, j] = powers[j-i]
+    toeplitz = toeplitz.reshape(length*nx, length*nx)
+    ## rows of the L samples of a block and estimator
+    forced = np.concatenate([forced, np.zeros((nblock*length - n, nbatch, nx),
+                                              dtype=forced.dtype)])
+    rows = forced.reshape(nblock, length, nbatch, nx).transpose(0, 2, 1, 3)
+    local = rows.reshape(nblock*nbatch, length*nx) @ toeplitz
+    ## values at the ends of the blocks
+    ends = local[:, -nx:].copy()
+    power = powers[-1]
+    shift = nbatch
+    while shift < len(ends):
+        ends[shift:] += ends[:-shift] @ power
+        power = power @ power
+        shift *= 2
+    local[nbatch:] += ends[:-nbatch] @ np.concatenate(powers[1:], axis=1)
+    solution = local.reshape(nblock, nbatch, length, nx).transpose(0, 2, 1, 3)
+    return solution.reshape(nblock*length, nbatch, nx)[:n]
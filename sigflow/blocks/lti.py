@@ -1,12 +1,20 @@
 """A linear time invariant system block.
 """
+import collections
+
 import control
 import numpy as np
 import scipy
+import scipy.signal
 
+from sigflow.core.memory import share
+from sigflow.core.utils import rational_response
 from .base import Block
 
 
+REALIZATIONS = ("companion", "modal", "balanced")
+
+
 class LTI(Block):
     """An LTI system class
 
@@ -19,8 +27,32 @@ class LTI(Block):
     label : str, optional
         Label for this filter.
         Defaults to None.
+    realization : str, optional
+        State space realization of tf, "companion", "modal" or
+        "balanced", see LTI.realization.
+        Defaults to "companion".
+    keep_control : bool, optional
+        Keep the python-control objects of the block, see
+        LTI.keep_control.
+        Defaults to True.
+
+    Note
+    ----
+    The input is linearly interpolated between samples.
+    The state space realization is discretized once when ``tf`` or ``dt``
+    is set, so each call only costs a few matrix-vector products.
+    The discretization is always computed in float64 and cast to
+    ``dtype`` afterwards.
     """
-    def __init__(self, tf, dt, label=None):
+    __slots__ = ("_tf", "_num", "_den", "_dt", "_state_space", "_a", "_b",
+                 "_c", "_d", "_ad", "_bd0", "_bd1", "_coefficients",
+                 "_banded", "_modes", "_dt_resolution", "_dt_cache_size",
+                 "_propagators", "_state_vector", "_state_vector_now",
+                 "_input_vector", "_realization", "_keep_control")
+    _BANDED_STATES = 64  # modal state updates are banded above this order
+
+    def __init__(self, tf, dt, label=None, realization="companion",
+                 keep_control=True):
         """Constructor
 
         Parameters
@@ -32,29 +64,68 @@ class LTI(Block):
         label : str, optional
             Label for this filter.
             Defaults to None.
+        realization : str, optional
+            State space realization of tf, "companion", "modal" or
+            "balanced", see LTI.realization.
+            Defaults to "companion".
+        keep_control : bool, optional
+            Keep the python-control objects of the block, see
+            LTI.keep_control.
+            Defaults to True.
         """
+        self._keep_control = bool(keep_control)
         self._tf = None
+        self._num = None  # Numerator and denominator of self.tf
+        self._den = None
         self._dt = None
-        self._t = np.zeros(2)  # Dummy. Passed to control.forced_response
-        
+        self._state_space = None
+
+        # Continuous state space matrices and their discretization
+        # x[k+1] = ad @ x[k] + bd0 @ u[k] + bd1 @ u[k+1]
+        # y[k+1] = c @ x[k+1] + d @ u[k+1]
+        self._a = None
+        self._b = None
+        self._c = None
+        self._d = None
+        self._ad = None
+        self._bd0 = None
+        self._bd1 = None
+        self._coefficients = None  # (ad, bd0, bd1, c, d) cast to dtype.
+        self._banded = None  # (diagonals of ad) of large modal realizations
+        self._modes = None  # complex modes of the modal realization
+        ## variable steps: propagators (ad, bd0, bd1) cast to dtype, by
+        ## time step in units of dt_resolution, most recently used last,
+        ## or None until the first time step
+        self._dt_resolution = 1e-9
+        self._dt_cache_size = 256
+        self._propagators = None
+
         self._state_vector = None  # States. Size depends on the system.
         self._state_vector_now = None # States now.
-        # self._state_vector: States passed to control.passed response.
+        # self._state_vector: States at the previous sample.
         # This is set to self._state_vector_now when new self.input is set.
-        # self._state_vector_now: Contains the states returned from
-        # control.forced_response
-        
-        self._input = 0
-        self._input_vector = np.zeros(2)  # Past input and current input buffer
+        # self._state_vector_now: Contains the states propagated to the
+        # current sample.
+
+        self._input_vector = np.zeros(2, dtype=self.dtype)  # Past input and current input buffer
+        if realization not in REALIZATIONS:
+            raise ValueError("realization must be one of {}."
+                             "".format(", ".join(REALIZATIONS)))
+        self._realization = realization
         self.tf = tf
         self.dt = dt
         super().__init__(label=label)
-    
+
     @property
     def tf(self):
         """The transfer function represenstation of the LTI system"""
+        if self._tf is None and self._num is not None:
+            tf = control.tf(self._num, self._den)
+            if not self._keep_control:
+                return tf
+            self._tf = tf
         return self._tf
-    
+
     @tf.setter
     def tf(self, _tf):
         """tf.setter"""
@@ -64,49 +135,277 @@ class LTI(Block):
             raise ValueError("tf must be a proper transfer function.")
         if np.any(_tf.pole().real >= 0):
             raise ValueError("tf must be a stable transfer function.")
-        self._tf = _tf
-        self._state_space = control.tf2ss(_tf)
-        n_states = len(self._state_space.A[1])
-        # n_states = np.shape(self._state_space)[1]
-        self._state_vector = np.zeros(n_states)
-        # print(self._state_vector)
-    
+        self._tf = _tf if self._keep_control else None
+        self._num = np.array(_tf.num[0][0], dtype=float)
+        self._den = np.array(_tf.den[0][0], dtype=float)
+        self._realize()
+        ## keep the states if the number of states is unchanged
+        n_states = len(self._a)
+        rebound = (self._state_vector is None
+                   or len(self._state_vector) != n_states)
+        if rebound:
+            self._state_vector = np.zeros(n_states, dtype=self.dtype)
+            self._state_vector_now = np.zeros(n_states, dtype=self.dtype)
+        self._discretize()
+        self._notify(states=rebound)
+
+    @property
+    def realization(self):
+        """State space realization of the transfer function.
+
+        Note
+        ----
+        "companion" is the controllable canonical form of control.tf2ss,
+        whose dense state matrix makes each update O(n^2) and is poorly
+        conditioned for high orders.
+        "modal" is the real block-diagonal modal form, with a 1x1 block
+        per real pole and a 2x2 block per complex pole pair.
+        Chunks are then processed with a first-order recursion per
+        mode, and, above 64 states, each sample costs O(n).
+        It requires distinct poles.
+        "balanced" is the balanced realization, with equal and diagonal
+        controllability and observability gramians, computed from the
+        modal form.
+        It requires distinct poles and a minimal realization.
+        Setting the realization resets the states.
+        """
+        return self._realization
+
+    @realization.setter
+    def realization(self, realization):
+        """realization.setter"""
+        if realization not in REALIZATIONS:
+            raise ValueError("realization must be one of {}."
+                             "".format(", ".join(REALIZATIONS)))
+        self._realization = realization
+        self._realize()
+        self._state_vector[:] = 0
+        self._state_vector_now[:] = 0
+        self._discretize()
+        self._notify()
+
+    def _realize(self):
+        """Realize the transfer function in the form of self.realization.
+        """
+        if self._realization == "companion":
+            state_space = control.tf2ss(self.tf)
+            a = np.array(state_space.A, dtype=float)
+            b = np.array(state_space.B, dtype=float)
+            c = np.array(state_space.C, dtype=float)
+            d = np.array(state_space.D, dtype=float)
+        else:
+            a, b, c, d = _modal_form(self._num, self._den)
+            if self._realization == "balanced" and len(a):
+                a, b, c = _balanced_form(a, b, c)
+            state_space = control.ss(a, b, c, d)
+        self._state_space = state_space if self._keep_control else None
+        self._a = a
+        self._b = b
+        self._c = c
+        self._d = d
+
+    @property
+    def keep_control(self):
+        """Keep the python-control objects of the block.
+
+        Note
+        ----
+        If False, the transfer function and state space objects are
+        dropped after the realization, and LTI.tf builds a new transfer
+        function from the coefficients on each access.
+        This saves a few kilobytes per block, most of the memory of
+        small blocks, see System.memory_report.
+        Defaults to True.
+        """
+        return self._keep_control
+
+    @keep_control.setter
+    def keep_control(self, keep_control):
+        """keep_control.setter"""
+        self._keep_control = bool(keep_control)
+        if not self._keep_control:
+            self._tf = None
+            self._state_space = None
+        elif self._state_space is None and self._a is not None:
+            self._state_space = control.ss(self._a, self._b, self._c,
+                                           self._d)
+
+    def _compact(self, shared):
+        """Drop the python-control objects and share the coefficients,
+        see Block._compact."""
+        self.keep_control = False
+        for name in ["_num", "_den", "_a", "_b", "_c", "_d", "_ad", "_bd0",
+                     "_bd1"]:
+            setattr(self, name, share(getattr(self, name), shared))
+        ad, bd0, bd1, c, d = self._coefficients
+        self._coefficients = (share(ad, shared), share(bd0, shared),
+                              share(bd1, shared), share(c, shared), d)
+        if self._banded is not None:
+            self._banded = tuple(share(diagonal, shared)
+                                 for diagonal in self._banded)
+        if self._modes is not None:
+            self._modes = tuple(share(coefficient, shared)
+                                for coefficient in self._modes)
+
     @property
     def dt(self):
         """Sampling time"""
         return self._dt
-    
+
     @dt.setter
     def dt(self, _dt):
         self._dt = _dt
-        self._t[1] = _dt
+        self._discretize()
+        self._notify()
+
+    @property
+    def dt_resolution(self):
+        """Resolution of the time steps of LTI.process, in seconds.
+
+        Note
+        ----
+        Time steps are rounded to a multiple of the resolution, and the
+        propagators of the rounded time steps are cached.
+        Defaults to 1e-9, exact for timestamps in nanoseconds.
+        """
+        return self._dt_resolution
+
+    @dt_resolution.setter
+    def dt_resolution(self, dt_resolution):
+        """dt_resolution.setter"""
+        if not dt_resolution > 0:
+            raise ValueError("dt_resolution must be positive.")
+        self._dt_resolution = float(dt_resolution)
+        self._propagators = None
+
+    @property
+    def dt_cache_size(self):
+        """Maximum number of time steps whose propagators are cached.
+
+        Note
+        ----
+        The least recently used propagator is dropped first.
+        Defaults to 256.
+        """
+        return self._dt_cache_size
+
+    @dt_cache_size.setter
+    def dt_cache_size(self, dt_cache_size):
+        """dt_cache_size.setter"""
+        if int(dt_cache_size) < 1:
+            raise ValueError("dt_cache_size must be a positive integer.")
+        self._dt_cache_size = int(dt_cache_size)
+        while (self._propagators is not None
+               and len(self._propagators) > self._dt_cache_size):
+            self._propagators.popitem(last=False)
 
     @property
     def input(self):
         """Input of the LTI system"""
-        return self._input
-   
+        return self._input_vector[1]
+
     @input.setter
     def input(self, _input):
         """input.setter
-        
+
         Parameters
         ----------
         _input : float
             Input to the LTI system.
         """
-        self._input_vector[0] = self.input
-        self._input = _input
+        self._input_vector[0] = self._input_vector[1]
         self._input_vector[1] = _input
-        if self._state_vector_now is not None:
-            self._state_vector = self._state_vector_now
+        self._state_vector[:] = self._state_vector_now
         #FIXME if self.input is changed multiple times before calling
         #self._i2o, it's gonna act funny since the state vector doesn't
         #change but the input vector changed.
 
+    @property
+    def inputs(self):
+        """Input of the block."""
+        return np.atleast_1d(self.input)
+
+    @inputs.setter
+    def inputs(self, _inputs):
+        """inputs.setter, same as input.setter"""
+        self.input = np.asarray(_inputs).item()
+
+    def _discretize(self):
+        """Discretize the state space realization with sampling time dt.
+
+        The input is linearly interpolated between samples.
+        """
+        if self._a is None or self.dt is None:
+            return
+        self._ad, self._bd0, self._bd1 = self._propagator(self.dt)
+        self._cast_coefficients()
+
+    def _propagator(self, dt):
+        """Discretization of the state space realization.
+
+        Parameters
+        ----------
+        dt : float
+            The time step.
+
+        Returns
+        -------
+        ad, bd0, bd1 : array
+            The discrete state transition and input matrices, with the
+            input linearly interpolated over the time step.
+        """
+        a = self._a
+        b = self._b
+        n_states = len(a)
+        n_inputs = b.shape[1]
+        # Integrate xdot = A x + B u, udot = (u1 - u0) / dt, u(0) = u0.
+        m = np.block([[a*dt, b*dt, np.zeros((n_states, n_inputs))],
+                      [np.zeros((n_inputs, n_states+n_inputs)),
+                       np.identity(n_inputs)],
+                      [np.zeros((n_inputs, n_states+2*n_inputs))]])
+        exp_m = scipy.linalg.expm(m)
+        ad = exp_m[:n_states, :n_states]
+        if self._realization == "modal":
+            ## keep the block-diagonal structure exact
+            ad = np.where(_block_mask(a), ad, 0.)
+        bd1 = exp_m[:n_states, n_states+n_inputs:]
+        bd0 = exp_m[:n_states, n_states:n_states+n_inputs] - bd1
+        return ad, bd0, bd1
+
+    def _cast_coefficients(self):
+        """Cast the discretized matrices to self.dtype."""
+        if self._ad is None:
+            return
+        dtype = self.dtype
+        self._coefficients = (
+            self._ad.astype(dtype, copy=False),
+            self._bd0[:, 0].astype(dtype, copy=False),
+            self._bd1[:, 0].astype(dtype, copy=False),
+            self._c[0].astype(dtype, copy=False),
+            self._d[0, 0].astype(dtype))
+        self._banded = None
+        self._modes = None
+        self._propagators = None
+        if self._realization != "modal":
+            return
+        ad = self._coefficients[0]
+        if len(ad) > self._BANDED_STATES:
+            self._banded = (np.diag(ad).copy(), np.diag(ad, 1).copy(),
+                            np.diag(ad, -1).copy())
+        complex_dtype = np.result_type(dtype, np.complex64)
+        self._modes = tuple(
+            coefficient.astype(complex_dtype)
+            for coefficient in _complex_modes(self._ad, self._bd0[:, 0],
+                                              self._bd1[:, 0], self._c[0]))
+
+    def _cast(self):
+        """Cast the states and coefficients, see Block._cast."""
+        self._cast_coefficients()
+        super()._cast()
+
     def _i2o(self):
         """Pass value through the LTI system and returns the output
-        
+
         Returns
         -------
         float
@@ -114,9 +413,367 @@ class LTI(Block):
         """
         #TODO Add functionality to check if the execution time
         #exceeds the sampling time self.dt.
-        _, y, x = control.forced_response(
-            self._state_space, U=self._input_vector, T=self._t,
-            X0=self._state_vector, return_x=True)
-        self._state_vector_now = x[:, 1]
-        output = y[-1]
+        u0, u1 = self._input_vector
+        ad, bd0, bd1, c, d = self._coefficients
+        state_vector = self._state_vector
+        state_vector_now = self._state_vector_now
+        if self._banded is None:
+            state_vector_now[:] = ad @ state_vector + bd0*u0 + bd1*u1
+        else:
+            diagonal, upper, lower = self._banded
+            state_vector_now[:] = diagonal*state_vector + bd0*u0 + bd1*u1
+            state_vector_now[:-1] += upper*state_vector[1:]
+            state_vector_now[1:] += lower*state_vector[:-1]
+        output = c @ state_vector_now + d*u1
         return output
+
+    def process(self, inputs, dt=None):
+        """Process a chunk of samples.
+
+        Parameters
+        ----------
+        inputs : array
+            (1, n) array of n samples of the input.
+            A 1-D array is taken as n samples.
+        dt : float or array, optional
+            Time step of each sample since the previous one, in seconds,
+            for irregularly sampled inputs.
+            A float is used for all the samples.
+            Defaults to None, meaning the sampling time self.dt.
+
+        Returns
+        -------
+        array
+            (1, n) array of n samples of the output.
+
+        Note
+        ----
+        With the modal realization, each mode is a first-order recursion
+        z[k+1] = p z[k] + g0 u[k] + g1 u[k+1], complex for complex pole
+        pairs, run over the chunk with scipy.signal.lfilter.
+        The outputs match calling the block sample by sample up to
+        rounding errors.
+        Other realizations are processed sample by sample.
+
+        With time steps, the samples are propagated one by one, with
+        the exact discretization of each time step rounded to
+        dt_resolution.
+        The discretizations are cached, see dt_cache_size, so that
+        repeated time steps cost no matrix exponential.
+        """
+        if dt is not None:
+            return self._process_steps(inputs, dt)
+        if self._modes is None:
+            return super().process(inputs)
+        inputs = np.atleast_2d(inputs)
+        n = inputs.shape[1]
+        if n == 0:
+            return np.empty((1, 0), dtype=self.dtype)
+        u = inputs[0].astype(self.dtype, copy=False)
+        poles, g0, g1, left, right, h = self._modes
+        d = self._coefficients[4]
+        u_past = self._input_vector[1]
+        z_past = left @ self._state_vector_now
+        modes = np.empty((len(poles), n), dtype=poles.dtype)
+        for m in range(len(poles)):
+            modes[m], _ = scipy.signal.lfilter(
+                [g1[m], g0[m]], [1, -poles[m]], u,
+                zi=[g0[m]*u_past + poles[m]*z_past[m]])
+        outputs = (h @ modes).real + d*u
+        ## leave the states as if called sample by sample
+        if n > 1:
+            self._state_vector[:] = (right @ modes[:, -2]).real
+            self._input_vector[0] = u[-2]
+        else:
+            self._state_vector[:] = self._state_vector_now
+            self._input_vector[0] = u_past
+        self._state_vector_now[:] = (right @ modes[:, -1]).real
+        self._input_vector[1] = u[-1]
+        return outputs[np.newaxis].astype(self.dtype, copy=False)
+
+    def _process_steps(self, inputs, dt):
+        """Process samples with a time step each, see process."""
+        inputs = np.atleast_2d(inputs)
+        n = inputs.shape[1]
+        u = inputs[0].astype(self.dtype, copy=False)
+        steps = np.broadcast_to(np.asarray(dt, dtype=float), (n,))
+        keys = np.rint(steps / self._dt_resolution).astype(np.int64)
+        if np.any(keys < 0):
+            raise ValueError("dt must not be negative.")
+        outputs = np.empty(n, dtype=self.dtype)
+        _, _, _, c, d = self._coefficients
+        input_vector = self._input_vector
+        state_vector = self._state_vector
+        state_vector_now = self._state_vector_now
+        last_key = None
+        for k in range(n):
+            key = keys[k]
+            if key != last_key:
+                ad, bd0, bd1 = self._step_propagator(key)
+                last_key = key
+            input_vector[0] = input_vector[1]
+            input_vector[1] = u[k]
+            state_vector[:] = state_vector_now
+            state_vector_now[:] = (ad @ state_vector + bd0*input_vector[0]
+                                   + bd1*input_vector[1])
+            outputs[k] = c @ state_vector_now + d*input_vector[1]
+        return outputs[np.newaxis]
+
+    def _step_propagator(self, key):
+        """Cached propagator of a time step of key*dt_resolution.
+
+        Returns
+        -------
+        ad, bd0, bd1 : array
+            The propagator, cast to dtype, bd0 and bd1 as 1-D arrays.
+        """
+        propagators = self._propagators
+        if propagators is None:
+            propagators = self._propagators = collections.OrderedDict()
+        propagator = propagators.get(key)
+        if propagator is not None:
+            propagators.move_to_end(key)
+            return propagator
+        ad, bd0, bd1 = self._propagator(key * self._dt_resolution)
+        dtype = self.dtype
+        propagator = (ad.astype(dtype), bd0[:, 0].astype(dtype),
+                      bd1[:, 0].astype(dtype))
+        propagators[key] = propagator
+        if len(propagators) > self._dt_cache_size:
+            propagators.popitem(last=False)
+        return propagator
+
+    def initialize_steady_state(self, inputs):
+        """Set the states to the equilibrium for a constant input.
+
+        Parameters
+        ----------
+        inputs : float or array
+            The constant input.
+
+        Returns
+        -------
+        array
+            The steady-state output.
+
+        Note
+        ----
+        The equilibrium is solved from (I - ad) x = (bd0 + bd1) u with
+        the float64 discretization.
+        """
+        u = np.asarray(inputs, dtype=float).item()
+        n_states = len(self._ad)
+        x = np.linalg.solve(np.identity(n_states) - self._ad,
+                            (self._bd0 + self._bd1)[:, 0] * u)
+        self._state_vector[:] = x
+        self._state_vector_now[:] = x
+        self._input_vector[:] = u
+        return np.atleast_1d(self._c[0] @ x + self._d[0, 0]*u)
+
+    def frequency_response(self, freqs):
+        """Frequency response of the transfer function.
+
+        Parameters
+        ----------
+        freqs : array
+            Frequencies in Hz.
+
+        Returns
+        -------
+        array
+            (n_freq, 1, 1) complex array of tf evaluated at 2j*pi*freqs.
+        """
+        return rational_response(self._num, self._den, freqs)
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        return {"num": self._num, "den": self._den, "dt": self.dt,
+                "a": self._a, "b": self._b, "c": self._c, "d": self._d,
+                "ad": self._ad, "bd0": self._bd0, "bd1": self._bd1,
+                "realization": np.array(self._realization)}
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block without realizing or discretizing tf."""
+        lti = cls.__new__(cls)
+        lti._keep_control = True
+        lti._tf = None
+        lti._state_space = None
+        for name in ["num", "den", "a", "b", "c", "d", "ad", "bd0", "bd1"]:
+            setattr(lti, "_"+name, parameters[name])
+        lti._dt = float(parameters["dt"])
+        lti._realization = str(parameters.get("realization", "companion"))
+        lti._dt_resolution = 1e-9
+        lti._dt_cache_size = 256
+        lti._propagators = None
+        n_states = len(lti._a)
+        lti._state_vector = np.zeros(n_states)
+        lti._state_vector_now = np.zeros(n_states)
+        lti._input_vector = np.zeros(2)
+        lti._cast_coefficients()
+        Block.__init__(lti, label=label)
+        return lti
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        return {"state_vector": self._state_vector,
+                "state_vector_now": self._state_vector_now,
+                "input_vector": self._input_vector}
+
+
+def _blocks(a):
+    """(start, size) of the 1x1 and 2x2 diagonal blocks of a modal
+    state matrix."""
+    blocks = []
+    i = 0
+    while i < len(a):
+        size = 2 if i+1 < len(a) and a[i, i+1] != 0 else 1
+        blocks.append((i, size))
+        i += size
+    return blocks
+
+
+def _block_mask(a):
+    """Mask of the diagonal blocks of a modal state matrix."""
+    mask = np.zeros(a.shape, dtype=bool)
+    for i, size in _blocks(a):
+        mask[i:i+size, i:i+size] = True
+    return mask
+
+
+def _modal_form(num, den):
+    """Real block-diagonal modal realization of a transfer function.
+
+    Parameters
+    ----------
+    num, den : array
+        Coefficients of the numerator and denominator polynomials.
+
+    Returns
+    -------
+    a, b, c, d : array
+        The realization, with a 1x1 block per real pole and a 2x2 block
+        [[sigma, omega], [-omega, sigma]] per complex pole pair.
+
+    Note
+    ----
+    The modes are built from the poles and residues rather than by
+    diagonalizing a companion realization, whose eigenvectors are too
+    ill-conditioned for high orders.
+    """
+    den = np.trim_zeros(np.asarray(den, dtype=float), "f")
+    num = np.trim_zeros(np.asarray(num, dtype=float), "f")
+    n_states = len(den) - 1
+    d = num[0] / den[0] if len(num) == len(den) else 0.
+    remainder = np.polysub(num, d*den)
+    if n_states == 0:
+        ## static gain, as the companion realization
+        return (np.zeros((0, 0)), np.zeros((0, 1)), np.zeros((1, 0)),
+                np.array([[d]]))
+    remainder = np.trim_zeros(remainder[-n_states:], "f")
+    poles = np.roots(den)
+    scale = max(np.max(np.abs(poles)), 1.)
+    tolerance = np.sqrt(np.finfo(float).eps) * scale
+    gaps = np.abs(poles[:, np.newaxis] - poles)
+    if np.any(gaps[~np.eye(n_states, dtype=bool)] <= tolerance):
+        raise ValueError("the modal realization requires distinct "
+                         "poles.")
+    ## one pole per conjugate pair, the one with positive imaginary part
+    real = poles[np.abs(poles.imag) <= tolerance]
+    upper = poles[poles.imag > tolerance]
+    modes = np.concatenate([real.real, upper])
+    modes = modes[np.argsort(np.abs(modes))]
+    zeros = np.roots(remainder) if len(remainder) else None
+    a = np.zeros((n_states, n_states))
+    b = np.zeros((n_states, 1))
+    c = np.zeros((1, n_states))
+    i = 0
+    for pole in modes:
+        ## residue of the strictly proper part at the pole
+        if zeros is None:
+            residue = 0.
+        else:
+            residue = remainder[0] * np.prod(pole - zeros)
+            residue /= den[0] * np.prod(
+                pole - poles[np.abs(poles - pole) > tolerance])
+        ## balance the input and output gains of each mode
+        gain = np.sqrt(2*abs(residue)) if pole.imag else np.sqrt(abs(residue))
+        if gain == 0:
+            gain = 1.
+        if pole.imag:
+            a[i:i+2, i:i+2] = [[pole.real, pole.imag],
+                               [-pole.imag, pole.real]]
+            b[i, 0] = gain
+            c[0, i:i+2] = [2*residue.real/gain, 2*residue.imag/gain]
+            i += 2
+        else:
+            a[i, i] = pole.real
+            b[i, 0] = gain
+            c[0, i] = np.real(residue)/gain
+            i += 1
+    if i != n_states:
+        raise ValueError("the modal realization requires poles in "
+                         "conjugate pairs.")
+    return a, b, c, np.array([[d]])
+
+
+def _balanced_form(a, b, c):
+    """Balanced form of a state space realization.
+
+    Returns
+    -------
+    a, b, c : array
+        The realization with equal diagonal gramians.
+    """
+    controllability = scipy.linalg.solve_continuous_lyapunov(a, -b @ b.T)
+    observability = scipy.linalg.solve_continuous_lyapunov(a.T, -c.T @ c)
+    try:
+        lc = scipy.linalg.cholesky(controllability, lower=True)
+        lo = scipy.linalg.cholesky(observability, lower=True)
+    except np.linalg.LinAlgError:
+        raise ValueError("the balanced realization requires a minimal "
+                         "realization.")
+    u, hankel, vt = scipy.linalg.svd(lo.T @ lc)
+    transform = lc @ vt.T / np.sqrt(hankel)
+    inverse = (u / np.sqrt(hankel)).T @ lo.T
+    return inverse @ a @ transform, inverse @ b, c @ transform
+
+
+def _complex_modes(ad, bd0, bd1, c):
+    """First-order complex recursions of a discretized modal
+    realization.
+
+    Returns
+    -------
+    poles : array
+        Discrete pole of each mode, one per complex pole pair.
+    g0, g1 : array
+        Gains of the past and current inputs of each mode.
+    left : array
+        (n_modes, n_states) projection of the states on the modes.
+    right : array
+        (n_states, n_modes) array, the states being the real part of
+        right @ modes.
+    h : array
+        Output gains of the modes, the output being the real part of
+        h @ modes.
+    """
+    blocks = _blocks(ad)
+    n_states = len(ad)
+    poles = np.zeros(len(blocks), dtype=complex)
+    left = np.zeros((len(blocks), n_states), dtype=complex)
+    right = np.zeros((n_states, len(blocks)), dtype=complex)
+    for m, (i, size) in enumerate(blocks):
+        modes = slice(i, i+size)
+        if size == 1:
+            poles[m] = ad[i, i]
+            left[m, i] = 1
+            right[i, m] = 1
+            continue
+        values, vectors = np.linalg.eig(ad[modes, modes])
+        k = np.argmax(values.imag)
+        poles[m] = values[k]
+        left[m, modes] = np.linalg.inv(vectors)[k]
+        ## the conjugate mode adds the conjugate
+        right[modes, m] = 2*vectors[:, k]
+    return poles, left @ bd0, left @ bd1, left, right, c @ right
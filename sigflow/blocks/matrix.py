@@ -2,6 +2,7 @@
 """
 import numpy as np
 
+from sigflow.core.memory import share
 from .base import Block
 
 
@@ -24,7 +25,12 @@ class Matrix(Block):
     noutput : input
         The number of outputs defined by the number of rows of the matrix.
         Calculated, can't set.
+    pure : bool
+        True, the block has no states.
     """
+    __slots__ = ("_matrix",)
+    pure = True
+
     def __init__(self, matrix=None, label=None):
         """Constructor
 
@@ -58,6 +64,45 @@ class Matrix(Block):
                              "".format(len(self.inputs), self.ninput))
         return self.matrix @ self.inputs
 
+    def process(self, inputs):
+        """Process a chunk of samples, see Block.process."""
+        inputs = np.atleast_2d(np.asarray(inputs, dtype=self.dtype))
+        if len(inputs) != self.ninput:
+            raise ValueError("Number of inputs:{} doesn't match"
+                             " that of the matrix:{}"
+                             "".format(len(inputs), self.ninput))
+        return self.matrix @ inputs
+
+    def frequency_response(self, freqs):
+        """Constant gains of the matrix, see Block.frequency_response."""
+        freqs = np.atleast_1d(freqs)
+        return np.broadcast_to(self.matrix, freqs.shape+self.matrix.shape
+                               ).astype(complex)
+
+    def _cast(self):
+        """Cast the matrix to self.dtype, see Block._cast."""
+        if self._matrix is not None:
+            self._matrix = self._matrix.astype(self.dtype, copy=False)
+        super()._cast()
+
+    def _compact(self, shared):
+        """Share the matrix, see Block._compact."""
+        if self._matrix is not None:
+            self._matrix = share(self._matrix, shared)
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        if self._matrix is None:
+            return {}
+        return {"matrix": self._matrix}
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        matrix = cls(label=label)
+        matrix.matrix = parameters.get("matrix")
+        return matrix
+
     @property
     def ninput(self):
         """Number of inputs"""
@@ -99,4 +144,7 @@ class Matrix(Block):
             pass
         elif mat.ndim != 2:
             raise ValueError("matrix must be a 2-D array.")
+        else:
+            mat = mat.astype(self.dtype, copy=False)
         self._matrix = mat
+        self._notify()
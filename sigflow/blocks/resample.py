@@ -0,0 +1,235 @@
+"""Rational resampler block.
+"""
+import fractions
+import math
+
+import numpy as np
+import scipy.signal
+
+from .base import Block
+
+
+class Resampler(Block):
+    """A polyphase rational resampler block
+
+    Changes the sampling rate by up/down: the input is upsampled by
+    inserting up-1 zeros between samples, filtered by a lowpass FIR
+    filter and downsampled by keeping one sample out of down.
+
+    Parameters
+    ----------
+    up : int
+        Upsampling factor.
+    down : int
+        Downsampling factor.
+    taps : array or None, optional
+        Impulse response of the lowpass filter at the upsampled rate.
+        Defaults to None, meaning the filter of scipy.signal.resample_poly,
+        or no filter if up == down.
+    window : str or tuple, optional
+        Window of the default filter, see scipy.signal.firwin.
+        Defaults to ("kaiser", 5.0).
+    label : str, optional
+        Label for this block.
+        Defaults to None.
+
+    Attributes
+    ----------
+    rate : fractions.Fraction
+        up/down, reduced.
+
+    Note
+    ----
+    The filter is split into up polyphase branches, and each output
+    sample only computes the branch of its phase with the inputs it
+    needs, so the cost is len(taps)/up multiplications per output
+    sample, whatever the factors.
+    The filter is causal: the outputs are those of
+    scipy.signal.upfirdn(taps, x, up, down), delayed by
+    (len(taps)-1)/2 samples at the upsampled rate for the default
+    filter.
+    The input history and the phase of the next output are carried
+    across chunks, so ``Resampler.process`` returns a varying number of
+    samples per chunk, n*up/down on average.
+    Downstream blocks of a System then process chunks at the output
+    rate, see System.process.
+    The block can only be called sample by sample when up == down.
+    """
+    def __init__(self, up, down, taps=None, window=("kaiser", 5.0),
+                 label=None):
+        """Constructor
+
+        Parameters
+        ----------
+        up : int
+            Upsampling factor.
+        down : int
+            Downsampling factor.
+        taps : array or None, optional
+            Impulse response of the lowpass filter at the upsampled rate.
+            Defaults to None, meaning the filter of
+            scipy.signal.resample_poly.
+        window : str or tuple, optional
+            Window of the default filter, see scipy.signal.firwin.
+            Defaults to ("kaiser", 5.0).
+        label : str, optional
+            Label for this block.
+            Defaults to None.
+        """
+        up, down = int(up), int(down)
+        if up < 1 or down < 1:
+            raise ValueError("up and down must be positive integers.")
+        divisor = math.gcd(up, down)
+        self._up = up // divisor
+        self._down = down // divisor
+        if taps is None and self._up == self._down:
+            taps = np.ones(1)
+        elif taps is None:
+            fastest = max(self._up, self._down)
+            taps = scipy.signal.firwin(20*fastest + 1, 1/fastest,
+                                       window=window) * self._up
+        taps = np.asarray(taps, dtype=float)
+        if taps.ndim != 1 or len(taps) == 0:
+            raise ValueError("taps must be a non-empty 1-D array.")
+        self._taps = taps
+        self._polyphase = None
+        self._history = None
+        # Position of the next output at the upsampled rate, relative to
+        # the next input, and the last output.
+        self._phase = np.zeros(1, dtype=np.int64)
+        self._last = np.zeros(1, dtype=self.dtype)
+        self._split_taps()
+        super().__init__(label=label)
+
+    @property
+    def up(self):
+        """Upsampling factor."""
+        return self._up
+
+    @property
+    def down(self):
+        """Downsampling factor."""
+        return self._down
+
+    @property
+    def rate(self):
+        """Number of output samples per input sample."""
+        return fractions.Fraction(self._up, self._down)
+
+    @property
+    def taps(self):
+        """Impulse response of the lowpass filter at the upsampled rate."""
+        return self._taps
+
+    def _split_taps(self):
+        """Polyphase branches of the filter."""
+        up = self._up
+        nbranch = -(-len(self._taps) // up)
+        padded = np.zeros(nbranch*up)
+        padded[:len(self._taps)] = self._taps
+        # Branch p holds taps[p], taps[p+up], ..., applied to the inputs
+        # from the newest.
+        self._polyphase = padded.reshape(nbranch, up).T.astype(self.dtype)
+        if self._history is None or len(self._history) != nbranch - 1:
+            self._history = np.zeros(nbranch - 1, dtype=self.dtype)
+            self._notify(states=True)
+
+    @Block.inputs.setter
+    def inputs(self, _inputs):
+        """inputs.setter, resample the sample."""
+        self._inputs = np.atleast_1d(np.asarray(_inputs, dtype=self.dtype))
+        if hasattr(self, "_ninput"):
+            if self.rate != 1:
+                raise ValueError("blocks changing the rate only process "
+                                 "chunks, see Resampler.process")
+            self.process(self._inputs[:1])
+
+    def _i2o(self):
+        """The last output sample.
+
+        Returns
+        -------
+        float
+        """
+        return self._last[0]
+
+    def process(self, inputs):
+        """Resample a chunk of samples.
+
+        Parameters
+        ----------
+        inputs : array
+            (1, n) array of n samples.
+
+        Returns
+        -------
+        array
+            (1, m) array of the output samples whose latest input is in
+            the chunk.
+        """
+        x = np.atleast_2d(np.asarray(inputs, dtype=self.dtype))[0]
+        n = len(x)
+        up, down = self._up, self._down
+        phase = int(self._phase[0])
+        ## positions of the outputs at the upsampled rate, from the
+        ## first input of the chunk
+        positions = np.arange(phase, n*up, down)
+        latest, branch = np.divmod(positions, up)
+        nbranch = self._polyphase.shape[1]
+        full = np.concatenate([self._history, x])
+        y = np.empty(len(positions), dtype=self.dtype)
+        if len(y):
+            ## inputs of each output, oldest first, without copies
+            windows = np.lib.stride_tricks.sliding_window_view(full,
+                                                               nbranch)
+        ## outputs r, r+up, ... use the same branch, down inputs apart
+        for r in range(min(up, len(positions))):
+            y[r::up] = (windows[latest[r]::down][:len(y[r::up])]
+                        @ self._polyphase[branch[r], ::-1])
+        if nbranch > 1:
+            self._history[:] = full[-(nbranch-1):]
+        self._phase[0] = phase + len(positions)*down - n*up
+        if len(y):
+            self._last[0] = y[-1]
+        return y.reshape(1, -1)
+
+    def initialize_steady_state(self, inputs):
+        """Fill the history with a constant input.
+
+        Parameters
+        ----------
+        inputs : float or array
+            The constant input.
+
+        Returns
+        -------
+        array
+            The steady-state output of the next phase.
+        """
+        u = np.asarray(inputs, dtype=float).item()
+        self._history[:] = u
+        branch = int(self._phase[0]) % self._up
+        self._last[0] = u * self._polyphase[branch].sum()
+        return np.atleast_1d(self._last[0])
+
+    def _cast(self):
+        """Cast the filter and states, see Block._cast."""
+        self._polyphase = self._polyphase.astype(self.dtype)
+        super()._cast()
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        return {"up": self._up, "down": self._down, "taps": self._taps}
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        return cls(int(parameters["up"]), int(parameters["down"]),
+                   taps=np.asarray(parameters["taps"]), label=label)
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        if self._history is None:
+            return {}
+        return {"history": self._history, "phase": self._phase,
+                "last": self._last}
@@ -0,0 +1,408 @@
+"""Spectral density probe block.
+"""
+import numpy as np
+import scipy.fft
+import scipy.signal
+
+from .base import Block
+
+
+AVERAGINGS = ("linear", "exponential")
+
+
+class SpectrumProbe(Block):
+    """A probe estimating the spectral densities of its inputs
+
+    The inputs are passed through unchanged, while the power and cross
+    spectral densities are estimated with Welch's method as the samples
+    arrive.
+
+    Parameters
+    ----------
+    dt : float
+        The sampling time in seconds.
+    nperseg : int, optional
+        Number of samples per segment.
+        Defaults to 256.
+    noverlap : int or None, optional
+        Number of samples overlapping between segments.
+        Defaults to None, meaning nperseg // 2.
+    window : str or tuple or array, optional
+        The window, see scipy.signal.get_window.
+        Defaults to "hann".
+    averaging : str, optional
+        "linear" or "exponential", see SpectrumProbe.averaging.
+        Defaults to "linear".
+    averages : int or None, optional
+        Number of segments averaged, see SpectrumProbe.averaging.
+        Defaults to None.
+    ninput : int, optional
+        Number of inputs.
+        Defaults to 1.
+    detrend : str or False, optional
+        "constant" to remove the mean of each segment, or False.
+        Defaults to "constant".
+    scaling : str, optional
+        "density" for V**2/Hz or "spectrum" for V**2.
+        Defaults to "density".
+    label : str, optional
+        Label for this block.
+        Defaults to None.
+
+    Note
+    ----
+    The memory used is constant: the samples of the incomplete segment
+    and the averaged spectra.
+    A chunk is processed with one batched FFT of all its segments and
+    inputs, and the cross spectra of all pairs of inputs are averaged
+    at once.
+    The estimates are those of scipy.signal.csd with average="mean" for
+    linear averaging of all segments.
+    """
+    def __init__(self, dt, nperseg=256, noverlap=None, window="hann",
+                 averaging="linear", averages=None, ninput=1,
+                 detrend="constant", scaling="density", label=None):
+        """Constructor
+
+        Parameters
+        ----------
+        dt : float
+            The sampling time in seconds.
+        nperseg : int, optional
+            Number of samples per segment.
+            Defaults to 256.
+        noverlap : int or None, optional
+            Number of samples overlapping between segments.
+            Defaults to None, meaning nperseg // 2.
+        window : str or tuple or array, optional
+            The window, see scipy.signal.get_window.
+            Defaults to "hann".
+        averaging : str, optional
+            "linear" or "exponential".
+            Defaults to "linear".
+        averages : int or None, optional
+            Number of segments averaged.
+            Defaults to None.
+        ninput : int, optional
+            Number of inputs.
+            Defaults to 1.
+        detrend : str or False, optional
+            "constant" to remove the mean of each segment, or False.
+            Defaults to "constant".
+        scaling : str, optional
+            "density" for V**2/Hz or "spectrum" for V**2.
+            Defaults to "density".
+        label : str, optional
+            Label for this block.
+            Defaults to None.
+        """
+        nperseg = int(nperseg)
+        if nperseg < 1:
+            raise ValueError("nperseg must be a positive integer.")
+        if noverlap is None:
+            noverlap = nperseg // 2
+        noverlap = int(noverlap)
+        if not 0 <= noverlap < nperseg:
+            raise ValueError("noverlap must be less than nperseg.")
+        if averaging not in AVERAGINGS:
+            raise ValueError("averaging must be one of {}."
+                             "".format(", ".join(AVERAGINGS)))
+        if averages is not None:
+            averages = int(averages)
+            if averages < 1:
+                raise ValueError("averages must be a positive integer.")
+        elif averaging == "exponential":
+            raise ValueError("averages must be set for exponential "
+                             "averaging.")
+        if detrend not in ("constant", False):
+            raise ValueError('detrend must be "constant" or False.')
+        if scaling not in ("density", "spectrum"):
+            raise ValueError('scaling must be "density" or "spectrum".')
+        self._dt = float(dt)
+        self._nperseg = nperseg
+        self._noverlap = noverlap
+        self._window_parameter = window
+        self._averaging = averaging
+        self._averages = averages
+        self._detrend = detrend
+        self._scaling = scaling
+        if isinstance(window, (str, tuple)):
+            window = scipy.signal.get_window(window, nperseg)
+        window = np.asarray(window, dtype=float)
+        if window.shape != (nperseg,):
+            raise ValueError("window must have nperseg samples.")
+        if scaling == "density":
+            scale = 1 / (np.sum(window**2) / self._dt)
+        else:
+            scale = 1 / np.sum(window)**2
+        ## one-sided spectra, doubled except at 0 and the Nyquist frequency
+        nfreq = nperseg//2 + 1
+        self._scale = np.full(nfreq, 2*scale)
+        self._scale[0] = scale
+        if nperseg % 2 == 0:
+            self._scale[-1] = scale
+        self._window = window
+        self._buffer = None
+        super().__init__(label=label)
+        self.ninput = ninput
+        self.noutput = ninput
+
+    @property
+    def ninput(self):
+        """Number of inputs"""
+        return self._ninput
+
+    @ninput.setter
+    def ninput(self, ninput):
+        """ninput setter, resets the estimates if changed."""
+        ninput = int(ninput)
+        if ninput < 1:
+            raise ValueError("ninput must be a positive integer.")
+        self._ninput = ninput
+        if self._buffer is None or len(self._buffer) != ninput:
+            nfreq = self._nperseg//2 + 1
+            self._buffer = np.zeros((ninput, self._nperseg),
+                                    dtype=self.dtype)
+            # Complex spectra stored as pairs of floats.
+            self._average = np.zeros((ninput, ninput, 2*nfreq),
+                                     dtype=self.dtype)
+            self._estimate = np.zeros_like(self._average)
+            # Samples in the buffer, segments in the average, complete
+            # averages of the linear averaging.
+            self._counts = np.zeros(3, dtype=np.int64)
+            self._notify(states=True)
+        else:
+            self._notify()
+
+    @property
+    def dt(self):
+        """Sampling time"""
+        return self._dt
+
+    @property
+    def averaging(self):
+        """Averaging of the segments, "linear" or "exponential".
+
+        Note
+        ----
+        With linear averaging, the estimate is the mean of all segments
+        if averages is None.
+        Otherwise, the estimate is the mean of the last complete group of
+        averages segments, and the mean of the segments so far until the
+        first group is complete.
+        With exponential averaging, each segment has a weight of
+        1/averages, or 1/n for the first averages segments, so that the
+        estimate follows slow changes of the spectra.
+        """
+        return self._averaging
+
+    @property
+    def averages(self):
+        """Number of segments averaged, see SpectrumProbe.averaging."""
+        return self._averages
+
+    @property
+    def frequencies(self):
+        """Frequencies of the estimates in Hz."""
+        return scipy.fft.rfftfreq(self._nperseg, self._dt)
+
+    @property
+    def segments(self):
+        """Number of segments in the current average."""
+        return int(self._counts[1])
+
+    @property
+    def csd(self):
+        """Cross spectral densities of the inputs.
+
+        Returns
+        -------
+        array
+            (ninput, ninput, nfreq) complex array, where csd[i, j] is the
+            cross spectral density of inputs i and j, see
+            scipy.signal.csd.
+            The diagonal is the power spectral densities.
+        """
+        if self._averaging == "linear" and self._counts[2] > 0:
+            spectra = self._estimate
+        else:
+            spectra = self._average
+        return spectra.view(self._complex_dtype).copy()
+
+    @property
+    def psd(self):
+        """Power spectral densities of the inputs.
+
+        Returns
+        -------
+        array
+            (ninput, nfreq) array, see scipy.signal.welch.
+        """
+        csd = self.csd
+        return np.stack([csd[i, i].real for i in range(self.ninput)])
+
+    def reset(self):
+        """Discard the samples and segments averaged so far."""
+        self._buffer[:] = 0
+        self._average[:] = 0
+        self._estimate[:] = 0
+        self._counts[:] = 0
+
+    @property
+    def _complex_dtype(self):
+        """Complex data type with the precision of self.dtype."""
+        return np.promote_types(self.dtype, np.complex64)
+
+    @Block.inputs.setter
+    def inputs(self, _inputs):
+        """inputs.setter, append the sample to the current segment."""
+        self._inputs = np.ravel(np.asarray(_inputs, dtype=self.dtype))
+        if self._buffer is None:
+            return
+        filled = int(self._counts[0])
+        self._buffer[:, filled] = self._inputs
+        filled += 1
+        if filled == self._nperseg:
+            self._accumulate(self._buffer[:, np.newaxis])
+            hop = self._nperseg - self._noverlap
+            self._buffer[:, :self._noverlap] = self._buffer[:, hop:]
+            filled = self._noverlap
+        self._counts[0] = filled
+
+    def _i2o(self):
+        """Pass the inputs through.
+
+        Returns
+        -------
+        float or array
+            The inputs.
+        """
+        if self.ninput == 1:
+            return self._inputs[0]
+        return self._inputs
+
+    def process(self, inputs):
+        """Pass a chunk of samples through and average its segments.
+
+        Parameters
+        ----------
+        inputs : array
+            (ninput, n) array of n samples of each input.
+
+        Returns
+        -------
+        array
+            The inputs.
+        """
+        inputs = np.atleast_2d(np.asarray(inputs, dtype=self.dtype))
+        if len(inputs) != self.ninput:
+            raise ValueError("expected {} inputs, got {}"
+                             "".format(self.ninput, len(inputs)))
+        if inputs.shape[1] == 0:
+            return inputs
+        nperseg = self._nperseg
+        hop = nperseg - self._noverlap
+        filled = int(self._counts[0])
+        data = np.concatenate([self._buffer[:, :filled], inputs], axis=1)
+        nseg = max((data.shape[1] - nperseg) // hop + 1, 0)
+        if nseg:
+            segments = np.lib.stride_tricks.as_strided(
+                data, shape=(len(data), nseg, nperseg),
+                strides=(data.strides[0], hop*data.strides[1],
+                         data.strides[1]), writeable=False)
+            self._accumulate(segments)
+        rest = data[:, nseg*hop:]
+        self._buffer[:, :rest.shape[1]] = rest
+        self._counts[0] = rest.shape[1]
+        self._inputs = inputs[:, -1].copy()
+        return inputs
+
+    def initialize_steady_state(self, inputs):
+        """Pass constant inputs through, see Block.initialize_steady_state.
+
+        The estimates are not changed.
+        """
+        inputs = np.ravel(np.asarray(inputs, dtype=self.dtype))
+        self._inputs = np.broadcast_to(inputs, self.ninput).copy()
+        return self._inputs.copy()
+
+    def _accumulate(self, segments):
+        """Average the cross spectra of segments.
+
+        Parameters
+        ----------
+        segments : array
+            (ninput, nseg, nperseg) array of the segments of each input.
+        """
+        if self._detrend == "constant":
+            segments = segments - segments.mean(axis=-1, keepdims=True)
+        spectra = scipy.fft.rfft(segments * self._window.astype(self.dtype),
+                                 axis=-1)
+        conjugate = spectra.conj()
+        average = self._average.view(self._complex_dtype)
+        count = int(self._counts[1])
+        nseg = spectra.shape[1]
+        scale = self._scale.astype(self.dtype)
+        if self._averaging == "exponential":
+            ## weight of each segment in the new average
+            rates = 1 / np.minimum(count + np.arange(1, nseg+1),
+                                   self._averages)
+            kept = np.cumprod((1 - rates)[::-1])[::-1]
+            weights = rates * np.append(kept[1:], 1.)
+            average *= kept[0]
+            average += np.einsum("s,isf,jsf->ijf", weights, conjugate,
+                                 spectra) * scale
+            self._counts[1] = count + nseg
+            return
+        start = 0
+        while start < nseg:
+            ## up to the end of the current group of segments
+            stop = nseg
+            if self._averages is not None:
+                stop = min(nseg, start + self._averages - count)
+            total = np.einsum("isf,jsf->ijf", conjugate[:, start:stop],
+                              spectra[:, start:stop]) * scale
+            average *= count / (count + stop - start)
+            average += total / (count + stop - start)
+            count += stop - start
+            if count == self._averages:
+                self._estimate[:] = self._average
+                self._counts[2] += 1
+                average[:] = 0
+                count = 0
+            start = stop
+        self._counts[1] = count
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        parameters = {"dt": self.dt, "nperseg": self._nperseg,
+                      "noverlap": self._noverlap, "window": self._window,
+                      "averaging": self._averaging, "ninput": self.ninput,
+                      "detrend": self._detrend or "none",
+                      "scaling": self._scaling}
+        if self._averages is not None:
+            parameters["averages"] = self._averages
+        return parameters
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        averages = parameters.get("averages")
+        if averages is not None:
+            averages = int(averages)
+        detrend = str(parameters["detrend"])
+        return cls(float(parameters["dt"]),
+                   nperseg=int(parameters["nperseg"]),
+                   noverlap=int(parameters["noverlap"]),
+                   window=np.asarray(parameters["window"]),
+                   averaging=str(parameters["averaging"]),
+                   averages=averages, ninput=int(parameters["ninput"]),
+                   detrend=False if detrend == "none" else detrend,
+                   scaling=str(parameters["scaling"]), label=label)
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        if self._buffer is None:
+            return {}
+        return {"buffer": self._buffer, "average": self._average,
+                "estimate": self._estimate, "counts": self._counts}
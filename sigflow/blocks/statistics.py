@@ -0,0 +1,633 @@
+"""Moving statistics blocks.
+"""
+import numpy as np
+import scipy.signal
+
+from .base import Block
+
+
+STATISTICS = ("mean", "variance", "std", "rms")
+
+
+class _MovingWindow(Block):
+    """Base class of the blocks keeping the last samples of each input
+
+    Parameters
+    ----------
+    window : int
+        Number of samples in the window.
+    ninput : int
+        Number of inputs.
+    history : bool
+        True to keep the samples of the window.
+    label : str
+        Label for this block.
+    """
+    def __init__(self, window, ninput, history, label):
+        window = int(window)
+        if window < 1:
+            raise ValueError("window must be a positive integer.")
+        ninput = int(ninput)
+        if ninput < 1:
+            raise ValueError("ninput must be a positive integer.")
+        self._window = window
+        # Circular buffer of the samples in the window.
+        self._history = np.zeros((ninput, window if history else 0),
+                                 dtype=self.dtype)
+        # Samples in the window, and position of the next sample in the
+        # circular buffer.
+        self._counts = np.zeros(2, dtype=np.int64)
+        super().__init__(label=label)
+        self.ninput = ninput
+        self.noutput = ninput
+
+    @property
+    def window(self):
+        """Number of samples in the window."""
+        return self._window
+
+    @Block.inputs.setter
+    def inputs(self, _inputs):
+        """inputs.setter, update the states with the sample."""
+        self._inputs = np.ravel(np.asarray(_inputs, dtype=self.dtype))
+        if hasattr(self, "_ninput"):
+            self._push(np.broadcast_to(self._inputs, self.ninput))
+
+    def _push(self, x):
+        """Update the states with a sample of each input."""
+        raise NotImplementedError
+
+    def _ordered_history(self):
+        """Samples in the window, oldest first.
+
+        Returns
+        -------
+        array
+            (ninput, window) array, the samples before the first ones
+            are not valid.
+        int
+            Number of valid samples, at the end.
+        """
+        position = int(self._counts[1])
+        return (np.roll(self._history, -position, axis=1),
+                int(self._counts[0]))
+
+    def _store_history(self, data, filled):
+        """Keep the last samples in the circular buffer.
+
+        Parameters
+        ----------
+        data : array
+            (ninput, n) array of the samples, oldest first.
+        filled : int
+            Number of valid samples, at the end of data.
+        """
+        window = self._window
+        filled = min(filled, window)
+        if filled == window:
+            self._history[:] = data[:, -window:]
+        elif filled:
+            self._history[:, :filled] = data[:, -filled:]
+        self._counts[:] = filled, filled % window
+
+    def _output(self, values):
+        """Output of a sample, a float for a single input."""
+        if self.ninput == 1:
+            return values[0]
+        return np.array(values)
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        return {"window": self.window, "ninput": self.ninput}
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        return {"history": self._history, "counts": self._counts}
+
+
+class MovingStatistic(_MovingWindow):
+    """A block computing a moving statistic of each input
+
+    Parameters
+    ----------
+    window : int
+        Number of samples in the sliding window, or time constant of the
+        exponential averaging in samples.
+    statistic : str, optional
+        "mean", "variance", "std" for the standard deviation, or "rms"
+        for the root mean square.
+        Defaults to "mean".
+    averaging : str, optional
+        "sliding" for the statistic of the last window samples, or
+        "exponential" for exponentially weighted samples.
+        Defaults to "sliding".
+    ninput : int, optional
+        Number of inputs, each with its own output.
+        Defaults to 1.
+    label : str, optional
+        Label for this block.
+        Defaults to None.
+
+    Note
+    ----
+    The variance is the population variance of the samples in the
+    window, or of the samples so far until the window is full.
+    With exponential averaging, a sample has a weight of 1/window, or
+    1/n for the first window samples, and the mean and variance follow
+    the exponentially weighted Welford recursions.
+    Calling the block updates the mean and variance of each input in
+    O(1).
+    ``MovingStatistic.process`` computes the sliding moments of a chunk
+    with cumulative sums restarted every window samples and combined
+    with Chan's formula, so the rounding errors do not grow with the
+    length of the chunk.
+    Exponential moments are filtered with scipy.signal.lfilter.
+    For a band-limited RMS, filter the inputs with an LTI or FIR block
+    first.
+    """
+    def __init__(self, window, statistic="mean", averaging="sliding",
+                 ninput=1, label=None):
+        """Constructor
+
+        Parameters
+        ----------
+        window : int
+            Number of samples in the sliding window, or time constant of
+            the exponential averaging in samples.
+        statistic : str, optional
+            "mean", "variance", "std" or "rms".
+            Defaults to "mean".
+        averaging : str, optional
+            "sliding" or "exponential".
+            Defaults to "sliding".
+        ninput : int, optional
+            Number of inputs, each with its own output.
+            Defaults to 1.
+        label : str, optional
+            Label for this block.
+            Defaults to None.
+        """
+        if statistic not in STATISTICS:
+            raise ValueError("statistic must be one of {}."
+                             "".format(", ".join(STATISTICS)))
+        if averaging not in ("sliding", "exponential"):
+            raise ValueError('averaging must be "sliding" or '
+                             '"exponential".')
+        self._statistic = statistic
+        self._averaging = averaging
+        # Mean, and sum of squared deviations for sliding windows or
+        # variance for exponential averaging.
+        self._moments = np.zeros((2, int(ninput)), dtype=self.dtype)
+        super().__init__(window, ninput, averaging == "sliding", label)
+
+    @property
+    def statistic(self):
+        """The statistic, "mean", "variance", "std" or "rms"."""
+        return self._statistic
+
+    @statistic.setter
+    def statistic(self, statistic):
+        """statistic.setter, the moments are kept."""
+        if statistic not in STATISTICS:
+            raise ValueError("statistic must be one of {}."
+                             "".format(", ".join(STATISTICS)))
+        self._statistic = statistic
+        self._notify()
+
+    @property
+    def averaging(self):
+        """Averaging, "sliding" or "exponential"."""
+        return self._averaging
+
+    def _push(self, x):
+        """Update the moments with a sample, see _MovingWindow._push."""
+        mean, spread = self._moments
+        filled, position = (int(count) for count in self._counts)
+        window = self._window
+        if self._averaging == "exponential":
+            filled = min(filled + 1, window)
+            rate = 1 / filled
+            deviation = x - mean
+            mean += rate * deviation
+            spread *= 1 - rate
+            spread += (1 - rate) * rate * deviation**2
+            self._counts[0] = filled
+            return
+        if filled < window:
+            ## Welford update
+            filled += 1
+            deviation = x - mean
+            mean += deviation / filled
+            spread += deviation * (x - mean)
+        else:
+            ## replace the oldest sample
+            oldest = self._history[:, position].copy()
+            previous = mean.copy()
+            mean += (x - oldest) / window
+            spread += (x - oldest) * (x - mean + oldest - previous)
+            np.maximum(spread, 0, out=spread)
+        self._history[:, position] = x
+        self._counts[:] = filled, (position + 1) % window
+
+    def _statistics(self, mean, variance):
+        """The statistic from the mean and variance."""
+        if self._statistic == "mean":
+            return mean
+        if self._statistic == "variance":
+            return variance
+        if self._statistic == "std":
+            return np.sqrt(variance)
+        return np.sqrt(variance + mean**2)
+
+    def _variance(self):
+        """Current variance of each input."""
+        spread = self._moments[1]
+        if self._averaging == "exponential":
+            return spread
+        return spread / max(self._counts[0], 1)
+
+    def _i2o(self):
+        """The statistic of the window of each input.
+
+        Returns
+        -------
+        float or array
+            The statistic, a float for a single input.
+        """
+        return self._output(self._statistics(self._moments[0],
+                                             self._variance()))
+
+    def process(self, inputs):
+        """Compute the statistic of a chunk of samples, see Block.process.
+        """
+        x = np.atleast_2d(np.asarray(inputs, dtype=self.dtype))
+        if len(x) != self.ninput:
+            raise ValueError("expected {} inputs, got {}"
+                             "".format(self.ninput, len(x)))
+        if x.shape[1] == 0:
+            return np.empty((self.ninput, 0), dtype=self.dtype)
+        if self._averaging == "exponential":
+            mean, variance = self._exponential_moments(x)
+        else:
+            mean, variance = self._sliding_moments(x)
+        self._inputs = x[:, -1].copy()
+        return self._statistics(mean, variance).astype(self.dtype,
+                                                       copy=False)
+
+    def _sliding_moments(self, x):
+        """Moments of the sliding windows ending at each sample of x.
+
+        Returns
+        -------
+        array
+            (ninput, n) array of the means.
+        array
+            (ninput, n) array of the variances.
+        """
+        window = self._window
+        n = x.shape[1]
+        history, filled = self._ordered_history()
+        data = np.concatenate([history, x], axis=1)
+        self._store_history(data, filled + n)
+        valid = np.zeros(data.shape[1], dtype=bool)
+        valid[window-filled:] = True
+        ## blocks of window samples, the windows end in the second one on
+        nblock = -(-data.shape[1] // window)
+        pad = nblock*window - data.shape[1]
+        data = np.pad(data, ((0, 0), (0, pad)))
+        valid = np.pad(valid, (0, pad))
+        data = data.reshape(len(data), nblock, window)
+        valid = valid.reshape(nblock, window)
+        ## shift by the mean of each block
+        counts = valid.sum(axis=1)
+        shift = (data*valid).sum(axis=2) / np.maximum(counts, 1)
+        y = (data - shift[..., np.newaxis]) * valid
+        sums = [np.cumsum(valid, axis=1), np.cumsum(y, axis=2),
+                np.cumsum(y**2, axis=2)]
+        ## window ending at offset i of block b: the samples after offset
+        ## i in block b-1 and up to offset i in block b
+        tail = [s[..., -1:] - s for s in sums]
+        tail = [t[..., :-1, :] for t in tail]
+        head = [s[..., 1:, :] for s in sums]
+        mean_head, spread_head = _moments(*head, shift[:, 1:])
+        mean_tail, spread_tail = _moments(*tail, shift[:, :-1])
+        count_head, count_tail = head[0], tail[0]
+        total = np.maximum(count_head + count_tail, 1)
+        delta = mean_head - mean_tail
+        mean = (count_head*mean_head + count_tail*mean_tail) / total
+        spread = (spread_head + spread_tail
+                  + delta**2 * count_head*count_tail / total)
+        mean = mean.reshape(len(mean), -1)[:, :n]
+        spread = np.maximum(spread.reshape(len(spread), -1)[:, :n], 0)
+        counts = np.minimum(filled + np.arange(1, n+1), window)
+        variance = spread / counts
+
+        self._moments[0] = mean[:, -1]
+        self._moments[1] = spread[:, -1]
+        return mean, variance
+
+    def _exponential_moments(self, x):
+        """Exponentially weighted moments up to each sample of x.
+
+        Returns
+        -------
+        array
+            (ninput, n) array of the means.
+        array
+            (ninput, n) array of the variances.
+        """
+        window = self._window
+        n = x.shape[1]
+        filled = int(self._counts[0])
+        previous, variance = self._moments
+        means = np.empty(x.shape)
+        variances = np.empty(x.shape)
+        ## cumulative moments until the window is reached
+        ramp = min(window - filled, n)
+        if ramp:
+            shift = previous if filled else x[:, 0]
+            y = x[:, :ramp] - shift[:, np.newaxis]
+            count = np.arange(1, ramp+1)
+            total = filled + count
+            sum_y = np.cumsum(y, axis=1)
+            mean_y = sum_y / count
+            spread = np.cumsum(y**2, axis=1) - sum_y*mean_y
+            delta = mean_y - (previous - shift)[:, np.newaxis]
+            means[:, :ramp] = (filled*(previous - shift)[:, np.newaxis]
+                               + sum_y) / total + shift[:, np.newaxis]
+            variances[:, :ramp] = np.maximum(
+                filled*variance[:, np.newaxis] + spread
+                + delta**2 * filled*count / total, 0) / total
+            previous = means[:, ramp-1]
+            variance = variances[:, ramp-1]
+        if ramp < n:
+            rate = 1 / window
+            a = [1, rate - 1]
+            means[:, ramp:], _ = scipy.signal.lfilter(
+                [rate], a, x[:, ramp:], axis=1,
+                zi=(1 - rate)*previous[:, np.newaxis])
+            before = np.concatenate([previous[:, np.newaxis],
+                                     means[:, ramp:-1]], axis=1)
+            variances[:, ramp:], _ = scipy.signal.lfilter(
+                [(1 - rate)*rate], a, (x[:, ramp:] - before)**2, axis=1,
+                zi=(1 - rate)*variance[:, np.newaxis])
+        self._moments[0] = means[:, -1]
+        self._moments[1] = variances[:, -1]
+        self._counts[0] = min(filled + n, window)
+        return means, variances
+
+    def initialize_steady_state(self, inputs):
+        """Fill the window with constant inputs.
+
+        Parameters
+        ----------
+        inputs : float or array
+            The constant value of each input.
+
+        Returns
+        -------
+        array
+            The steady-state statistic of each input.
+        """
+        u = np.broadcast_to(np.ravel(np.asarray(inputs, dtype=self.dtype)),
+                            self.ninput)
+        self._history[:] = u[:, np.newaxis]
+        self._moments[0] = u
+        self._moments[1] = 0
+        self._counts[:] = self._window, 0
+        self._inputs = u.copy()
+        return np.atleast_1d(self._i2o())
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        parameters = super()._parameters()
+        parameters.update(statistic=self._statistic,
+                          averaging=self._averaging)
+        return parameters
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        return cls(int(parameters["window"]),
+                   statistic=str(parameters["statistic"]),
+                   averaging=str(parameters["averaging"]),
+                   ninput=int(parameters["ninput"]), label=label)
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        states = super()._states()
+        states["moments"] = self._moments
+        return states
+
+
+class MovingExtremum(_MovingWindow):
+    """A block computing the sliding maximum or minimum of each input
+
+    Parameters
+    ----------
+    window : int
+        Number of samples in the sliding window.
+    extremum : str, optional
+        "max" or "min".
+        Defaults to "max".
+    ninput : int, optional
+        Number of inputs, each with its own output.
+        Defaults to 1.
+    label : str, optional
+        Label for this block.
+        Defaults to None.
+
+    Note
+    ----
+    Calling the block updates a monotonic queue of the samples that can
+    still become the extremum of each input, in O(1) amortized.
+    ``MovingExtremum.process`` computes a chunk with the van Herk/Gil-
+    Werman algorithm, i.e. running extrema over blocks of window samples
+    in both directions, vectorized over the inputs.
+    """
+    def __init__(self, window, extremum="max", ninput=1, label=None):
+        """Constructor
+
+        Parameters
+        ----------
+        window : int
+            Number of samples in the sliding window.
+        extremum : str, optional
+            "max" or "min".
+            Defaults to "max".
+        ninput : int, optional
+            Number of inputs, each with its own output.
+            Defaults to 1.
+        label : str, optional
+            Label for this block.
+            Defaults to None.
+        """
+        if extremum not in ("max", "min"):
+            raise ValueError('extremum must be "max" or "min".')
+        self._extremum = extremum
+        # Positions in the circular buffer of the samples that can still
+        # be the extremum, and the start and length of the queue.
+        self._queue = np.zeros((int(ninput), int(window)), dtype=np.int64)
+        self._ends = np.zeros((2, int(ninput)), dtype=np.int64)
+        super().__init__(window, ninput, True, label)
+
+    @property
+    def extremum(self):
+        """The extremum, "max" or "min"."""
+        return self._extremum
+
+    @property
+    def _sign(self):
+        """1 for the maximum, -1 for the minimum."""
+        return 1 if self._extremum == "max" else -1
+
+    def _push(self, x):
+        """Update the queues with a sample, see _MovingWindow._push."""
+        window = self._window
+        filled, position = (int(count) for count in self._counts)
+        signed = self._sign * x
+        for i in range(self.ninput):
+            queue, history = self._queue[i], self._history[i]
+            start, length = int(self._ends[0, i]), int(self._ends[1, i])
+            ## the sample being replaced leaves the window
+            if length and int(queue[start]) == position:
+                start = (start + 1) % window
+                length -= 1
+            ## the samples it dominates can no longer be the extremum
+            while length and (self._sign*history[
+                    int(queue[(start + length - 1) % window])] <= signed[i]):
+                length -= 1
+            queue[(start + length) % window] = position
+            self._ends[:, i] = start, length + 1
+        self._history[:, position] = x
+        self._counts[:] = min(filled + 1, window), (position + 1) % window
+
+    def _i2o(self):
+        """The extremum of the window of each input.
+
+        Returns
+        -------
+        float or array
+            The extremum, a float for a single input.
+        """
+        rows = np.arange(self.ninput)
+        first = self._queue[rows, self._ends[0]]
+        return self._output(self._history[rows, first])
+
+    def process(self, inputs):
+        """Compute the extremum of a chunk of samples, see Block.process."""
+        x = np.atleast_2d(np.asarray(inputs, dtype=self.dtype))
+        if len(x) != self.ninput:
+            raise ValueError("expected {} inputs, got {}"
+                             "".format(self.ninput, len(x)))
+        window = self._window
+        n = x.shape[1]
+        if n == 0:
+            return np.empty((self.ninput, 0), dtype=self.dtype)
+        history, filled = self._ordered_history()
+        data = self._sign * np.concatenate([history, x], axis=1)
+        data[:, :window-filled] = -np.inf
+        ## running extrema forward and backward in blocks of window
+        nblock = -(-data.shape[1] // window)
+        pad = nblock*window - data.shape[1]
+        blocks = np.pad(data, ((0, 0), (0, pad)),
+                        constant_values=-np.inf).reshape(len(data), nblock,
+                                                         window)
+        forward = np.maximum.accumulate(blocks, axis=2)
+        backward = np.maximum.accumulate(blocks[..., ::-1], axis=2)[..., ::-1]
+        backward = np.concatenate(
+            [backward[..., 1:], np.full(backward.shape[:2] + (1,), -np.inf)],
+            axis=2)
+        ## window ending at offset i of block b: after offset i in block
+        ## b-1, and up to offset i in block b
+        outputs = np.maximum(forward[:, 1:], backward[:, :-1])
+        outputs = self._sign * outputs.reshape(len(data), -1)[:, :n]
+
+        filled = min(filled + n, window)
+        self._store_history(self._sign * data[:, -filled:], filled)
+        self._rebuild_queues()
+        self._inputs = x[:, -1].copy()
+        return outputs.astype(self.dtype, copy=False)
+
+    def _rebuild_queues(self):
+        """Monotonic queues of the samples in the window."""
+        window = self._window
+        history, filled = self._ordered_history()
+        signed = self._sign * history
+        signed[:, :window-filled] = -np.inf
+        ## the samples larger than all the later ones
+        later = np.maximum.accumulate(signed[:, ::-1], axis=1)[:, ::-1]
+        later = np.concatenate([later[:, 1:],
+                                np.full((len(later), 1), -np.inf)], axis=1)
+        position = int(self._counts[1])
+        for i, keep in enumerate(signed > later):
+            slots = (np.flatnonzero(keep) + position) % window
+            self._queue[i, :len(slots)] = slots
+            self._ends[:, i] = 0, len(slots)
+
+    def initialize_steady_state(self, inputs):
+        """Fill the window with constant inputs.
+
+        Parameters
+        ----------
+        inputs : float or array
+            The constant value of each input.
+
+        Returns
+        -------
+        array
+            The steady-state extremum of each input.
+        """
+        u = np.broadcast_to(np.ravel(np.asarray(inputs, dtype=self.dtype)),
+                            self.ninput)
+        self._history[:] = u[:, np.newaxis]
+        self._counts[:] = self._window, 0
+        self._rebuild_queues()
+        self._inputs = u.copy()
+        return np.atleast_1d(self._i2o())
+
+    def _parameters(self):
+        """Parameters of the block, see Block._parameters."""
+        parameters = super()._parameters()
+        parameters["extremum"] = self._extremum
+        return parameters
+
+    @classmethod
+    def _from_parameters(cls, parameters, label=None):
+        """Construct the block, see Block._from_parameters."""
+        return cls(int(parameters["window"]),
+                   extremum=str(parameters["extremum"]),
+                   ninput=int(parameters["ninput"]), label=label)
+
+    def _states(self):
+        """States of the block, see Block._states."""
+        states = super()._states()
+        states.update(queue=self._queue, ends=self._ends)
+        return states
+
+
+def _moments(counts, sums, squares, shift):
+    """Mean and sum of squared deviations from shifted sums.
+
+    Parameters
+    ----------
+    counts : array
+        Number of samples.
+    sums : array
+        Sums of the samples minus shift.
+    squares : array
+        Sums of the squares of the samples minus shift.
+    shift : array
+        The shift of the samples, broadcast against sums.
+
+    Returns
+    -------
+    array
+        The means, 0 without samples.
+    array
+        The sums of squared deviations from the means.
+    """
+    safe = np.maximum(counts, 1)
+    mean = sums / safe
+    return (mean + shift[..., np.newaxis]) * (counts > 0), \
+        np.maximum(squares - sums*mean, 0)
@@ -0,0 +1,362 @@
+"""The sigflow command: run, benchmark and inspect saved systems.
+
+.. code-block:: bash
+
+   sigflow run model.npz --in data.npy --out result.npy --chunk 4096
+   producer | sigflow run model.npz --raw-dtype float32 | consumer
+   sigflow bench model.npz
+   sigflow info model.npz
+"""
+import argparse
+import collections
+import json
+import sys
+import time
+
+import numpy as np
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        prog="sigflow", description="Run, benchmark and inspect systems "
+                                    "saved with sigflow.System.save.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser(
+        "run", help="Process a signal with a system.",
+        description="Process a signal with a system. "
+                    ".npy files hold (ninput, n) or (noutput, n) arrays. "
+                    "Otherwise, samples are raw binary frames of "
+                    "interleaved channels.")
+    run.add_argument("model", help="Path of the saved system.")
+    run.add_argument("--in", dest="input", default="-",
+                     help="Input .npy file, raw binary file, or - for "
+                          "raw binary on stdin. Defaults to -.")
+    run.add_argument("--out", dest="output", default="-",
+                     help="Output .npy file, raw binary file, or - for "
+                          "raw binary on stdout. Defaults to -.")
+    run.add_argument("--chunk", type=int, default=4096,
+                     help="Number of samples processed at once. "
+                          "Defaults to 4096.")
+    run.add_argument("--raw-dtype", default="float64",
+                     help="Data type of raw binary samples. "
+                          "Defaults to float64.")
+    run.add_argument("--dtype", default=None,
+                     help="Data type the system runs in, e.g. float32. "
+                          "Defaults to the saved one.")
+    run.add_argument("--steady-state", action="store_true",
+                     help="Start settled at the first input sample.")
+    _add_load_arguments(run)
+
+    bench = subparsers.add_parser(
+        "bench", help="Report the throughput and latency of a system.")
+    bench.add_argument("model", help="Path of the saved system.")
+    bench.add_argument("--chunk", type=int, default=4096,
+                       help="Number of samples processed at once, 1 for "
+                            "calling the system sample by sample. "
+                            "Defaults to 4096.")
+    bench.add_argument("--samples", type=int, default=65536,
+                       help="Number of samples to process. "
+                            "Defaults to 65536.")
+    bench.add_argument("--dtype", default=None,
+                       help="Data type the system runs in, e.g. float32. "
+                            "Defaults to the saved one.")
+    bench.add_argument("--json", action="store_true",
+                       help="Print the report as JSON.")
+    _add_load_arguments(bench)
+
+    info = subparsers.add_parser(
+        "info", help="Print the blocks, connections and execution plan "
+                     "of a system.")
+    info.add_argument("model", help="Path of the saved system.")
+    _add_load_arguments(info)
+    return parser
+
+
+def _add_load_arguments(subparser):
+    subparser.add_argument("--mmap", action="store_true",
+                           help="Memory-map the block parameters.")
+
+
+def main(args=None):
+
+    from sigflow.system import System
+
+    options = parser().parse_args(args)
+    system = System.load(options.model,
+                         mmap_mode="r" if options.mmap else None)
+    if getattr(options, "dtype", None) is not None:
+        system.dtype = options.dtype
+    if options.command == "run":
+        run(system, options)
+    elif options.command == "bench":
+        report = bench(system, options.chunk, options.samples)
+        if options.json:
+            print(json.dumps(report))
+        else:
+            print(format_report(report))
+    else:
+        print(info(system))
+
+
+def run(system, options):
+    """Process the input of the run command with the system.
+
+    Parameters
+    ----------
+    system : sigflow.System
+        The system.
+    options : argparse.Namespace
+        Parsed arguments of the run command.
+    """
+    if system.ninput < 1:
+        raise SystemExit("sigflow: the system has no input.")
+    if options.chunk < 1:
+        raise SystemExit("sigflow: --chunk must be a positive integer.")
+    raw_dtype = np.dtype(options.raw_dtype)
+    chunks = _Reader(options.input, system.ninput, options.chunk,
+                     raw_dtype)
+    ## the output is created even if the input is empty
+    writer = _Writer(options.output, system.noutput, chunks.total,
+                     raw_dtype, system.dtype)
+    try:
+        first = True
+        for chunk in chunks:
+            if first and options.steady_state:
+                system.initialize_steady_state(chunk[:, 0])
+            first = False
+            writer.write(system.process(chunk))
+    finally:
+        writer.close()
+
+
+class _Reader:
+    """Iterator over (ninput, n) chunks of a .npy or raw binary input."""
+    def __init__(self, path, ninput, chunk, raw_dtype):
+        self.ninput = ninput
+        self.chunk = chunk
+        self.raw_dtype = raw_dtype
+        self.array = None
+        self.stream = None
+        self.total = None  # number of samples, if known
+        if path != "-" and path.endswith(".npy"):
+            array = np.load(path, mmap_mode="r")
+            if array.ndim == 1:
+                array = array.reshape(1, -1)
+            if array.ndim != 2 or len(array) != ninput:
+                raise SystemExit("sigflow: expected an input of shape "
+                                 "({}, n), got {}".format(ninput,
+                                                          array.shape))
+            self.array = array
+            self.total = array.shape[1]
+        elif path == "-":
+            self.stream = sys.stdin.buffer
+        else:
+            self.stream = open(path, "rb")
+
+    def __iter__(self):
+        if self.array is not None:
+            for start in range(0, self.total, self.chunk):
+                yield np.asarray(self.array[:, start:start+self.chunk])
+            return
+        ## reuse one buffer of whole frames and read into it in bulk
+        frames = np.empty((self.chunk, self.ninput), dtype=self.raw_dtype)
+        frame_size = frames.itemsize * self.ninput
+        try:
+            while True:
+                nbytes = _read_into(self.stream, frames)
+                n = nbytes // frame_size
+                if nbytes % frame_size:
+                    print("sigflow: ignoring a partial frame of {} bytes at "
+                          "the end of the input".format(nbytes % frame_size),
+                          file=sys.stderr)
+                if n > 0:
+                    yield frames[:n].T
+                if nbytes < frames.nbytes:
+                    return
+        finally:
+            if self.stream is not sys.stdin.buffer:
+                self.stream.close()
+
+
+def _read_into(stream, array):
+    """Fill an array from a stream.
+
+    Returns
+    -------
+    int
+        Number of bytes read, less than array.nbytes at the end of the
+        stream.
+    """
+    view = memoryview(array).cast("B")
+    total = 0
+    while total < len(view):
+        n = stream.readinto(view[total:])
+        if not n:
+            break
+        total += n
+    return total
+
+
+class _Writer:
+    """Writer of (noutput, n) chunks to a .npy or raw binary output.
+
+    .npy outputs hold the dtype of the system, raw outputs raw_dtype.
+    """
+    def __init__(self, path, noutput, total, raw_dtype, dtype):
+        self.raw_dtype = raw_dtype
+        self.dtype = np.dtype(dtype)
+        self.noutput = noutput
+        self.array = None
+        self.stream = None
+        self.position = 0
+        if path != "-" and path.endswith(".npy"):
+            if total is None:
+                ## length unknown until the end
+                self.path = path
+                self.chunks = []
+            else:
+                self.array = np.lib.format.open_memmap(
+                    path, mode="w+", dtype=self.dtype,
+                    shape=(noutput, total))
+        elif path == "-":
+            self.stream = sys.stdout.buffer
+        else:
+            self.stream = open(path, "wb")
+
+    def write(self, outputs):
+        if self.array is not None:
+            n = outputs.shape[1]
+            self.array[:, self.position:self.position+n] = outputs
+            self.position += n
+        elif self.stream is not None:
+            frames = np.ascontiguousarray(outputs.T, dtype=self.raw_dtype)
+            self.stream.write(memoryview(frames).cast("B"))
+        else:
+            self.chunks.append(outputs.astype(self.dtype))
+
+    def close(self):
+        if self.array is not None:
+            self.array.flush()
+            del self.array
+        elif self.stream is sys.stdout.buffer:
+            self.stream.flush()
+        elif self.stream is not None:
+            self.stream.close()
+        else:
+            np.save(self.path, np.concatenate(
+                [np.empty((self.noutput, 0), dtype=self.dtype)]
+                + self.chunks, axis=1))
+
+
+def bench(system, chunk=4096, samples=65536):
+    """Measure the throughput and latency of a system.
+
+    Parameters
+    ----------
+    system : sigflow.System
+        The system.
+    chunk : int, optional
+        Number of samples processed at once, 1 for calling the system
+        sample by sample.
+        Defaults to 4096.
+    samples : int, optional
+        Number of samples to process.
+        Defaults to 65536.
+
+    Returns
+    -------
+    dict
+        "samples_per_second", and the "latency_seconds" of the steps as
+        {"p50", "p90", "p99", "max"}, plus the settings.
+    """
+    rng = np.random.default_rng(0)
+    inputs = rng.normal(size=(system.ninput, samples))
+    latencies = []
+    start = time.perf_counter()
+    for k in range(0, samples, chunk):
+        step_start = time.perf_counter()
+        if chunk == 1:
+            system(inputs[:, k])
+        else:
+            system.process(inputs[:, k:k+chunk])
+        latencies.append(time.perf_counter() - step_start)
+    elapsed = time.perf_counter() - start
+    latencies = np.array(latencies)
+    return {"samples": samples, "chunk": chunk,
+            "samples_per_second": samples / elapsed,
+            "latency_seconds": {
+                "p50": float(np.percentile(latencies, 50)),
+                "p90": float(np.percentile(latencies, 90)),
+                "p99": float(np.percentile(latencies, 99)),
+                "max": float(latencies.max())}}
+
+
+def format_report(report):
+    """Format the report of bench."""
+    lines = ["samples: {}, chunk: {}".format(report["samples"],
+                                             report["chunk"]),
+             "throughput: {:.4g} samples/s".format(
+                 report["samples_per_second"]),
+             "latency per step:"]
+    for name, seconds in report["latency_seconds"].items():
+        lines.append("  {:<4} {:10.2f} us".format(name, seconds*1e6))
+    return "\n".join(lines)
+
+
+def info(system):
+    """Describe the blocks, connections and execution plan of a system.
+
+    Parameters
+    ----------
+    system : sigflow.System
+        The system.
+
+    Returns
+    -------
+    str
+        The description.
+    """
+    from sigflow.system import System
+
+    types = collections.Counter()
+    n_edges = 0
+    n_systems = 0
+    stack = [system]
+    while stack:
+        current = stack.pop()
+        n_edges += len(current._graph)
+        for block in current.blocks.values():
+            if isinstance(block, System):
+                n_systems += 1
+                stack.append(block)
+            else:
+                types[type(block).__name__] += 1
+
+    lines = ["inputs: {}, outputs: {}, dtype: {}".format(
+                 system.ninput, system.noutput, system.dtype),
+             "blocks: {}".format(sum(types.values())),
+             "nested systems: {}".format(n_systems),
+             "edges: {}".format(n_edges)]
+    for name, count in sorted(types.items()):
+        lines.append("  {:<12} {}".format(name, count))
+
+    input_routes, steps, _, feedback = system._flat_plan()
+    names = {}
+    for path, block, pending, key, _ in steps:
+        names[id(pending), key] = "/".join(system._path_names(path))
+    names[id(system._pending), "output"] = "output"
+
+    def targets(routes):
+        return ", ".join("{} -> {}:{}".format(
+            from_port, names.get((id(pending), key), key), to_port)
+            for from_port, pending, key, to_port in routes)
+
+    lines.append("plan{}:".format(" (with feedback)" if feedback else ""))
+    lines.append("  input: " + targets(input_routes))
+    for k, (path, block, pending, key, routes) in enumerate(steps):
+        name = "/".join(system._path_names(path))
+        kind = "inputs of" if block is None else type(block).__name__
+        lines.append("  {:>3} {} {}: {}".format(
+            k, kind, name, targets(routes)))
+    return "\n".join(lines)
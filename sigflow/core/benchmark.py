@@ -0,0 +1,264 @@
+"""Speed and accuracy benchmarks of the blocks.
+"""
+import time
+
+import control
+import numpy as np
+import scipy.signal
+
+
+def block_cases():
+    """Blocks to benchmark, one or more per block type.
+
+    Returns
+    -------
+    dict
+        {name: (factory, ninput)}, where factory() returns a new block.
+    """
+    from sigflow.blocks import FIR, LTI, Junction, Matrix
+    from sigflow.blocks.filter import Filter
+
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(8, 8))
+    taps_short = rng.normal(size=32) / 32
+    taps_long = rng.normal(size=4096) / 64
+    tf = control.tf([1, 10], [1, 2, 100]) * control.tf([100], [1, 14, 100])
+    return {
+        "Matrix": (lambda: Matrix(matrix), 8),
+        "Junction": (lambda: Junction("+-+"), 3),
+        "LTI": (lambda: LTI(tf, dt=1/1024), 1),
+        "Filter": (lambda: Filter(tf, fs=1024), 1),
+        "FIR direct": (lambda: FIR(taps_short), 1),
+        "FIR overlap-save": (lambda: FIR(taps_long), 1),
+        "FIR partitioned": (lambda: FIR(taps_long, partition=256), 1),
+    }
+
+
+def dtype_tradeoff(dtypes=("float64", "float32"), n=16384, chunk=1024,
+                   repeat=3, cases=None):
+    """Compare the speed and error of blocks running in different dtypes.
+
+    Parameters
+    ----------
+    dtypes : iterable of str or numpy.dtype, optional
+        The dtypes to compare.
+        The first one is the reference for the errors.
+        Defaults to ("float64", "float32").
+    n : int, optional
+        Number of samples to process.
+        Defaults to 16384.
+    chunk : int, optional
+        Number of samples per Block.process call.
+        Defaults to 1024.
+    repeat : int, optional
+        The time is the best of this many runs.
+        Defaults to 3.
+    cases : dict, optional
+        Blocks to compare, see block_cases.
+        Defaults to None, meaning all of block_cases().
+
+    Returns
+    -------
+    list of dict
+        A row per block and dtype with keys "block", "dtype",
+        "seconds" (per sample) and "error" (the maximum absolute error
+        relative to the peak of the reference output).
+    """
+    if cases is None:
+        cases = block_cases()
+    rng = np.random.default_rng(1)
+    rows = []
+    for name, (factory, ninput) in cases.items():
+        inputs = rng.normal(size=(ninput, n))
+        reference = None
+        for dtype in dtypes:
+            best = np.inf
+            for _ in range(repeat):
+                block = factory()
+                block.dtype = dtype
+                start = time.perf_counter()
+                outputs = np.concatenate(
+                    [block.process(inputs[:, k:k+chunk])
+                     for k in range(0, n, chunk)], axis=1)
+                best = min(best, time.perf_counter()-start)
+            outputs = outputs.astype(float)
+            if reference is None:
+                reference = outputs
+            scale = max(np.max(np.abs(reference)), np.finfo(float).tiny)
+            rows.append({"block": name, "dtype": np.dtype(dtype).name,
+                         "seconds": best / n,
+                         "error": np.max(np.abs(outputs-reference)) / scale})
+    return rows
+
+
+def format_rows(rows):
+    """Format benchmark rows as a table.
+
+    Parameters
+    ----------
+    rows : list of dict
+        Rows returned by dtype_tradeoff.
+
+    Returns
+    -------
+    str
+        The table.
+    """
+    lines = ["{:<18} {:<8} {:>12} {:>10}".format(
+        "block", "dtype", "ns/sample", "error")]
+    for row in rows:
+        lines.append("{:<18} {:<8} {:>12.1f} {:>10.2e}".format(
+            row["block"], row["dtype"], row["seconds"]*1e9, row["error"]))
+    return "\n".join(lines)
+
+
+def resonant_tf(order, low=1., high=100., damping=0.05):
+    """Stable transfer function of unit DC gain with spread resonances.
+
+    Parameters
+    ----------
+    order : int
+        Number of poles.
+        Pairs of poles are lightly damped resonances at log-spaced
+        frequencies, plus a real pole at low if order is odd.
+    low, high : float, optional
+        Range of the natural frequencies in rad/s.
+        Defaults to 1 and 100.
+    damping : float, optional
+        Damping ratio of the resonances.
+        Defaults to 0.05.
+
+    Returns
+    -------
+    control.TransferFunction
+        The transfer function.
+    """
+    frequencies = np.geomspace(low, high, max(order // 2, 1))[:order // 2]
+    poles = []
+    for w in frequencies:
+        pole = w * (-damping + 1j*np.sqrt(1-damping**2))
+        poles += [pole, pole.conjugate()]
+    if order % 2:
+        poles.append(-low)
+    num, den = scipy.signal.zpk2tf([], poles, 1)
+    return control.tf(np.real(num) * np.real(den[-1]), np.real(den))
+
+
+def realization_tradeoff(orders=(2, 4, 8, 16, 24, 32, 40),
+                         realizations=("companion", "modal", "balanced"),
+                         dt=1/1024, n=2048, chunk=1024, repeat=3):
+    """Compare the speed and accuracy of the realizations of LTI.
+
+    Parameters
+    ----------
+    orders : iterable of int, optional
+        Orders of the transfer functions, see resonant_tf.
+        Defaults to (2, 4, 8, 16, 24, 32, 40).
+    realizations : iterable of str, optional
+        The realizations to compare, see LTI.realization.
+        Defaults to ("companion", "modal", "balanced").
+    dt : float, optional
+        The sampling time in seconds.
+        Defaults to 1/1024.
+    n : int, optional
+        Number of samples to process.
+        Defaults to 2048.
+    chunk : int, optional
+        Number of samples per LTI.process call.
+        Defaults to 1024.
+    repeat : int, optional
+        The time is the best of this many runs.
+        Defaults to 3.
+
+    Returns
+    -------
+    list of dict
+        A row per order and realization with keys "order",
+        "realization", "sample_seconds" (per call of the block),
+        "chunk_seconds" (per sample processed in chunks) and
+        "dc_error" (the absolute error of the DC gain of the
+        discretized realization, which should be 1), or "failed"
+        with the error message if the realization is not possible.
+    """
+    from sigflow.blocks import LTI
+
+    inputs = np.random.default_rng(1).normal(size=n)
+    rows = []
+    for order in orders:
+        tf = resonant_tf(order)
+        for realization in realizations:
+            row = {"order": order, "realization": realization}
+            rows.append(row)
+            try:
+                lti = LTI(tf, dt=dt, realization=realization)
+            except (ValueError, np.linalg.LinAlgError) as error:
+                row["failed"] = str(error)
+                continue
+            sample_seconds = chunk_seconds = np.inf
+            ## unstable discretizations of the companion form overflow
+            with np.errstate(all="ignore"):
+                dc_gain = _dc_gain(lti)
+                for _ in range(repeat):
+                    lti.initialize_steady_state(0.)
+                    start = time.perf_counter()
+                    for u in inputs:
+                        lti(u)
+                    sample_seconds = min(sample_seconds,
+                                         time.perf_counter()-start)
+                    lti.initialize_steady_state(0.)
+                    start = time.perf_counter()
+                    for k in range(0, n, chunk):
+                        lti.process(inputs[k:k+chunk])
+                    chunk_seconds = min(chunk_seconds,
+                                        time.perf_counter()-start)
+            row["sample_seconds"] = sample_seconds / n
+            row["chunk_seconds"] = chunk_seconds / n
+            row["dc_error"] = abs(dc_gain - 1)
+    return rows
+
+
+def _dc_gain(lti):
+    """DC gain of the discretized realization of an LTI block."""
+    n_states = len(lti._ad)
+    state = np.linalg.solve(np.eye(n_states)-lti._ad,
+                            (lti._bd0+lti._bd1)[:, 0])
+    return lti._c[0] @ state + lti._d[0, 0]
+
+
+def format_realization_rows(rows):
+    """Format the rows of realization_tradeoff as a table.
+
+    Parameters
+    ----------
+    rows : list of dict
+        Rows returned by realization_tradeoff.
+
+    Returns
+    -------
+    str
+        The table, in reStructuredText.
+    """
+    header = ("order", "realization", "us/sample", "ns/sample (chunks)",
+              "DC gain error")
+    widths = [5, 11, 9, 18, 13]
+    rule = " ".join("="*width for width in widths)
+    lines = [rule, " ".join(name.ljust(width) for name, width
+                            in zip(header, widths)).rstrip(), rule]
+    for row in rows:
+        if "failed" in row:
+            values = ["failed", "", ""]
+        else:
+            values = ["{:.2f}".format(row["sample_seconds"]*1e6),
+                      "{:.0f}".format(row["chunk_seconds"]*1e9),
+                      "{:.1e}".format(row["dc_error"])]
+        cells = [str(row["order"]), row["realization"]] + values
+        lines.append(" ".join(cell.ljust(width) for cell, width
+                              in zip(cells, widths)).rstrip())
+    lines.append(rule)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    print(format_rows(dtype_tradeoff()))
+    print()
+    print(format_realization_rows(realization_tradeoff()))
@@ -0,0 +1,68 @@
+"""Reading and writing arrays.
+"""
+import struct
+import zipfile
+
+import numpy as np
+
+
+def load_npz(path, mmap_mode=None):
+    """Load all arrays of a .npz file.
+
+    Parameters
+    ----------
+    path : str or path-like
+        Path of the .npz file.
+    mmap_mode : str or None, optional
+        If not None, memory-map the arrays with this mode,
+        see ``numpy.memmap``.
+        Only arrays stored uncompressed, as written by ``numpy.savez``,
+        can be memory-mapped. The others are read into memory.
+        Defaults to None.
+
+    Returns
+    -------
+    dict
+        Arrays keyed by their names in the file.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            if not info.filename.endswith(".npy"):
+                continue
+            key = info.filename[:-len(".npy")]
+            array = None
+            if (mmap_mode is not None
+                    and info.compress_type == zipfile.ZIP_STORED):
+                array = _memmap_member(path, f, info, mmap_mode)
+            if array is None:
+                with archive.open(info) as member:
+                    array = np.lib.format.read_array(member,
+                                                     allow_pickle=False)
+            arrays[key] = array
+    return arrays
+
+
+def _memmap_member(path, f, info, mmap_mode):
+    """Memory-map an uncompressed .npy member of a zip file.
+
+    Returns
+    -------
+    numpy.memmap or None
+        None if the member can't be memory-mapped.
+    """
+    # Local file header: 30 bytes followed by the file name and extra field.
+    f.seek(info.header_offset)
+    header = f.read(30)
+    name_length, extra_length = struct.unpack("<HH", header[26:30])
+    f.seek(info.header_offset + 30 + name_length + extra_length)
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    if dtype.hasobject or len(shape) == 0 or 0 in shape:
+        return None
+    order = "F" if fortran_order else "C"
+    return np.memmap(path, dtype=dtype, mode=mmap_mode, offset=f.tell(),
+                     shape=shape, order=order)
@@ -0,0 +1,100 @@
+"""Memory footprint of objects and shared read-only arrays.
+"""
+import gc
+import sys
+import types
+import weakref
+
+import numpy as np
+
+
+## objects owned by the interpreter rather than by the measured object
+_NOT_OWNED = (type, types.ModuleType, types.FunctionType,
+              types.BuiltinFunctionType, types.MethodType, weakref.ref,
+              weakref.WeakSet, weakref.WeakValueDictionary,
+              weakref.WeakKeyDictionary)
+
+
+def share(array, shared):
+    """Read-only array shared by all arrays of the same content.
+
+    Parameters
+    ----------
+    array : array
+        The array to share.
+    shared : dict
+        The arrays shared so far, by content, updated with array if its
+        content is new.
+
+    Returns
+    -------
+    array
+        A read-only array equal to array, the same object for all the
+        arrays with the same dtype, shape and values passed with the
+        same shared dictionary.
+
+    Note
+    ----
+    The first array of a content is copied, so that the arrays of the
+    caller stay writeable.
+    Memory-mapped arrays are returned as is, their data being on disk.
+    """
+    if isinstance(array, np.memmap):
+        return array
+    array = np.asarray(array)
+    key = (array.dtype.str, array.shape, array.tobytes())
+    if key not in shared:
+        copy = np.array(array)
+        copy.setflags(write=False)
+        shared[key] = copy
+    return shared[key]
+
+
+def sizeof(obj, seen=None, skip=()):
+    """Bytes used by an object and the objects it holds.
+
+    Parameters
+    ----------
+    obj : object
+        The object to measure.
+    seen : set or None, optional
+        IDs of the objects already counted, which are not counted again.
+        Updated with the objects counted.
+        Defaults to None, meaning an empty set.
+    skip : tuple of type, optional
+        Types of the objects held by obj which are not counted, e.g.
+        other blocks.
+        Defaults to ().
+
+    Returns
+    -------
+    int
+        Bytes of obj, of the items of containers, of the attributes of
+        objects and of the data of arrays, with the data of views counted
+        with the array they view.
+
+    Note
+    ----
+    Classes, modules, functions and weak references are not counted.
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, _NOT_OWNED):
+            continue
+        if current is not obj and isinstance(current, skip):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, np.ndarray):
+            if current.base is not None:
+                stack.append(current.base)
+            continue
+        ## the items of containers and the attributes of objects
+        stack.extend(gc.get_referents(current))
+        if hasattr(current, "__dict__"):
+            stack.append(current.__dict__)
+    return size
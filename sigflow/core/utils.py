@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.signal
 
 def to_array(value, types=None):
     """Converts value to a list of values
@@ -27,5 +28,33 @@ def to_array(value, types=None):
     return value
 
 
+def rational_response(num, den, freqs, dt=None):
+    """Frequency response of a rational transfer function.
 
+    Parameters
+    ----------
+    num, den : array
+        Coefficients of the numerator and denominator polynomials, in
+        decreasing powers of s, or in increasing powers of z^-1 if dt is
+        given.
+    freqs : array
+        Frequencies in Hz.
+    dt : float or None, optional
+        Sampling time of a discrete transfer function.
+        Defaults to None, meaning a continuous transfer function.
 
+    Returns
+    -------
+    array
+        (n_freq, 1, 1) complex array of the transfer function evaluated
+        at s = 2j*pi*freqs, or at z = exp(2j*pi*freqs*dt).
+    """
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+    if dt is None:
+        s = 2j * np.pi * freqs
+        response = np.polyval(num, s) / np.polyval(den, s)
+    else:
+        _, response = scipy.signal.freqz(np.asarray(num, dtype=float),
+                                         np.asarray(den, dtype=float),
+                                         worN=2*np.pi*freqs*dt)
+    return response.reshape(-1, 1, 1)
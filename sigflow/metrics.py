@@ -0,0 +1,490 @@
+"""Metrics of running systems.
+
+Counters, gauges and histograms with fixed buckets, exported in the
+Prometheus text format or as a dict.
+
+.. code-block:: python
+
+   from sigflow.metrics import registry
+
+   system.metrics = registry
+   registry.serve(port=9100)  # or registry.write_prometheus(path)
+"""
+import bisect
+import http.server
+import math
+import os
+import re
+import tempfile
+import threading
+
+
+__all__ = ["Counter", "Gauge", "Histogram", "Registry", "registry",
+           "DEFAULT_BUCKETS"]
+
+## Exponential buckets from 1 us to 10 s, suitable for step latencies.
+DEFAULT_BUCKETS = tuple(m * 10.**e for e in range(-6, 1) for m in (1, 2.5, 5)
+                        ) + (10.,)
+
+_NAME = re.compile(r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+
+
+class _CounterChild:
+    """Value of a counter for one combination of labels."""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.
+
+    def inc(self, amount=1.):
+        """Increase the counter.
+
+        Parameters
+        ----------
+        amount : float, optional
+            A non-negative amount.
+            Defaults to 1.
+        """
+        if amount < 0:
+            raise ValueError("counters can only be increased.")
+        self.value += amount
+
+
+class _GaugeChild:
+    """Value of a gauge for one combination of labels."""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.
+
+    def set(self, value):
+        """Set the gauge."""
+        self.value = value
+
+    def inc(self, amount=1.):
+        """Increase the gauge."""
+        self.value += amount
+
+    def dec(self, amount=1.):
+        """Decrease the gauge."""
+        self.value -= amount
+
+
+class _HistogramChild:
+    """Bucket counts of a histogram for one combination of labels."""
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds)+1)  # the last one is +Inf
+        self.sum = 0.
+
+    def observe(self, value):
+        """Count a value in its bucket."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        """Number of values observed."""
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Estimate a quantile from the buckets.
+
+        Parameters
+        ----------
+        q : float
+            The quantile, between 0 and 1.
+
+        Returns
+        -------
+        float
+            The quantile, interpolated linearly within its bucket.
+            nan if no value was observed.
+
+        Note
+        ----
+        This is the same estimate as Prometheus' histogram_quantile.
+        """
+        counts = list(self.counts)
+        total = sum(counts)
+        if total == 0:
+            return math.nan
+        rank = q * total
+        cumulative = 0
+        for i, count in enumerate(counts):
+            if cumulative + count >= rank and count > 0:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i-1] if i > 0 else 0.
+                return lower + (self.bounds[i]-lower) * (rank-cumulative)/count
+            cumulative += count
+        return self.bounds[-1]
+
+
+class _Metric:
+    """A metric with children for each combination of labels."""
+    type = None
+    _child = None
+
+    def __init__(self, name, help="", labelnames=()):
+        """Constructor
+
+        Parameters
+        ----------
+        name : str
+            Name of the metric.
+        help : str, optional
+            Description of the metric.
+            Defaults to "".
+        labelnames : iterable of str, optional
+            Names of the labels.
+            Defaults to ().
+        """
+        if not _NAME.match(name):
+            raise ValueError("invalid metric name {}".format(name))
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        for label in self.labelnames:
+            if not _NAME.match(label) or label.startswith("__"):
+                raise ValueError("invalid label name {}".format(label))
+        self._children = {}
+
+    def labels(self, *values, **labels):
+        """Child of the metric for some label values.
+
+        Parameters
+        ----------
+        *values : str
+            Values of the labels, in the order of labelnames.
+        **labels : str
+            Values of the labels by name.
+
+        Returns
+        -------
+        object
+            The child, whose methods update the metric.
+            Keep a reference to it on hot paths.
+        """
+        if labels:
+            if values:
+                raise ValueError("give the label values either by position "
+                                 "or by name.")
+            values = tuple(labels[name] for name in self.labelnames)
+        values = tuple(str(value) for value in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError("expected {} label values, got {}".format(
+                len(self.labelnames), len(values)))
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        return self._child()
+
+    def _default(self):
+        """Child of a metric without labels."""
+        if self.labelnames:
+            raise ValueError("metric {} has labels, use labels() first."
+                             "".format(self.name))
+        return self.labels()
+
+    def _samples(self):
+        """(suffix, labels, value) of the children."""
+        for values, child in list(self._children.items()):
+            yield "", dict(zip(self.labelnames, values)), child.value
+
+
+class Counter(_Metric):
+    """A monotonically increasing value, e.g. a number of samples."""
+    type = "counter"
+    _child = _CounterChild
+
+    def inc(self, amount=1.):
+        """Increase the counter of a metric without labels."""
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """A value that can go up and down, e.g. a queue depth."""
+    type = "gauge"
+    _child = _GaugeChild
+
+    def set(self, value):
+        """Set the gauge of a metric without labels."""
+        self._default().set(value)
+
+    def inc(self, amount=1.):
+        """Increase the gauge of a metric without labels."""
+        self._default().inc(amount)
+
+    def dec(self, amount=1.):
+        """Decrease the gauge of a metric without labels."""
+        self._default().dec(amount)
+
+
+class Histogram(_Metric):
+    """Counts of values in fixed buckets, e.g. of latencies."""
+    type = "histogram"
+
+    def __init__(self, name, help="", labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        """Constructor
+
+        Parameters
+        ----------
+        name : str
+            Name of the metric.
+        help : str, optional
+            Description of the metric.
+            Defaults to "".
+        labelnames : iterable of str, optional
+            Names of the labels.
+            Defaults to ().
+        buckets : iterable of float, optional
+            Upper bounds of the buckets, in increasing order.
+            A +Inf bucket is always added.
+            Defaults to DEFAULT_BUCKETS, from 1 us to 10 s.
+        """
+        super().__init__(name, help, labelnames)
+        buckets = [float(bound) for bound in buckets]
+        if buckets and buckets[-1] == math.inf:
+            buckets = buckets[:-1]
+        if not buckets or buckets != sorted(set(buckets)):
+            raise ValueError("buckets must be increasing.")
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        """Count a value of a metric without labels."""
+        self._default().observe(value)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            counts = list(child.counts)
+            cumulative = 0
+            for bound, count in zip(self.buckets+(math.inf,), counts):
+                cumulative += count
+                yield "_bucket", dict(labels, le=_format_value(bound)), \
+                    cumulative
+            yield "_sum", labels, child.sum
+            yield "_count", labels, cumulative
+
+
+class Registry:
+    """A collection of metrics.
+
+    Note
+    ----
+    Metrics are updated without locks, so each child of a metric should
+    be updated by one thread at a time, as a System is.
+    Exports read the values while they are updated and may be a sample
+    behind.
+    """
+    def __init__(self):
+        """Constructor"""
+        self._metrics = {}
+        self._lock = threading.Lock()  # only for registration
+
+    def counter(self, name, help="", labelnames=()):
+        """Get or create a counter, see Counter."""
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help="", labelnames=()):
+        """Get or create a gauge, see Gauge."""
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help="", labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        """Get or create a histogram, see Histogram."""
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        """Get a metric, creating it if it doesn't exist."""
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, help, labelnames, **kwargs)
+                self._metrics[name] = metric
+            elif (type(metric) is not cls
+                    or metric.labelnames != tuple(labelnames)):
+                raise ValueError("metric {} already exists as a {} with "
+                                 "labels {}".format(name, metric.type,
+                                                    metric.labelnames))
+            return metric
+
+    def __getitem__(self, name):
+        """Metric by name."""
+        return self._metrics[name]
+
+    def __contains__(self, name):
+        return name in self._metrics
+
+    def unregister(self, name):
+        """Remove a metric."""
+        with self._lock:
+            del self._metrics[name]
+
+    def snapshot(self):
+        """Values of all metrics.
+
+        Returns
+        -------
+        dict
+            {name: {"type": str, "help": str, "samples": list}}, where
+            the samples are dicts with "labels" and "value".
+            For histograms, the value is a dict with the cumulative
+            "buckets" {upper bound: count}, "sum" and "count".
+        """
+        snapshot = {}
+        for name, metric in list(self._metrics.items()):
+            samples = []
+            for values, child in list(metric._children.items()):
+                labels = dict(zip(metric.labelnames, values))
+                if isinstance(metric, Histogram):
+                    counts = list(child.counts)
+                    cumulative = 0
+                    buckets = {}
+                    for bound, count in zip(metric.buckets+(math.inf,),
+                                            counts):
+                        cumulative += count
+                        buckets[bound] = cumulative
+                    value = {"buckets": buckets, "sum": child.sum,
+                             "count": cumulative}
+                else:
+                    value = child.value
+                samples.append({"labels": labels, "value": value})
+            snapshot[name] = {"type": metric.type, "help": metric.help,
+                              "samples": samples}
+        return snapshot
+
+    def to_prometheus(self):
+        """Metrics in the Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+            The text.
+        """
+        lines = []
+        for name, metric in list(self._metrics.items()):
+            lines.append("# HELP {} {}".format(name, _escape_help(
+                metric.help)))
+            lines.append("# TYPE {} {}".format(name, metric.type))
+            for suffix, labels, value in metric._samples():
+                lines.append("{}{}{} {}".format(name, suffix,
+                                                _format_labels(labels),
+                                                _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the metrics to a file in the Prometheus text format.
+
+        Parameters
+        ----------
+        path : str or path-like
+            Path of the file, e.g. for node_exporter's textfile
+            collector.
+
+        Note
+        ----
+        The file is replaced atomically, so readers never see a
+        partially written file.
+        """
+        path = os.fspath(path)
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def http_handler(self):
+        """HTTP request handler serving the metrics.
+
+        Returns
+        -------
+        type
+            A http.server.BaseHTTPRequestHandler subclass answering GET
+            requests with the metrics in the Prometheus text format.
+        """
+        registry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
+
+    def serve(self, port=0, host="127.0.0.1"):
+        """Serve the metrics over HTTP in a background thread.
+
+        Parameters
+        ----------
+        port : int, optional
+            Port to listen on.
+            Defaults to 0, meaning any free port.
+        host : str, optional
+            Address to listen on.
+            Defaults to "127.0.0.1", i.e. local connections only.
+
+        Returns
+        -------
+        http.server.ThreadingHTTPServer
+            The server.
+            Its address is ``server.server_address`` and it is stopped
+            with ``server.shutdown()``.
+        """
+        server = http.server.ThreadingHTTPServer((host, port),
+                                                 self.http_handler())
+        thread = threading.Thread(target=server.serve_forever,
+                                  name="sigflow-metrics", daemon=True)
+        thread.start()
+        return server
+
+
+def _format_value(value):
+    """Format a sample value."""
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    return repr(float(value))
+
+
+def _escape_help(text):
+    return text.replace("\\", r"\\").replace("\n", r"\n")
+
+
+def _format_labels(labels):
+    """Format labels as {name="value",...}."""
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", r"\\")
+                         .replace("\n", r"\n").replace('"', r'\"'))
+        for name, value in labels.items()) + "}"
+
+
+## The default registry.
+registry = Registry()
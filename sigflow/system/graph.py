@@ -0,0 +1,352 @@
+"""Array-backed adjacency store of a block diagram.
+"""
+import numpy as np
+
+
+INPUT = -1
+OUTPUT = -2
+
+
+class Graph:
+    """Edge table with array-backed adjacency lists.
+
+    Nodes are non-negative integer IDs, plus ``INPUT`` and ``OUTPUT``
+    which denote the boundary of the system.
+    Every edge is a row of (from_id, from_port, to_id, to_port) in an
+    edge table.
+    The edges leaving and entering a node are chained in doubly linked
+    lists whose pointers are stored in arrays, so adding and removing an
+    edge costs O(1) and removing a node costs O(degree).
+
+    Compressed sparse row (CSR) views of the graph are compiled on
+    demand and cached until the graph is modified.
+
+    Attributes
+    ----------
+    version : int
+        Counter incremented each time the graph is modified.
+    """
+    def __init__(self, capacity=16):
+        """Constructor
+
+        Parameters
+        ----------
+        capacity : int, optional
+            Number of edges to preallocate.
+            Defaults to 16.
+        """
+        capacity = max(int(capacity), 1)
+        self._edges = np.zeros((capacity, 4), dtype=np.int32)
+        self._seq = np.zeros(capacity, dtype=np.int64)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._next_out = np.full(capacity, -1, dtype=np.int32)
+        self._prev_out = np.full(capacity, -1, dtype=np.int32)
+        self._next_in = np.full(capacity, -1, dtype=np.int32)
+        self._prev_in = np.full(capacity, -1, dtype=np.int32)
+        ## list heads indexed by node+2, so that OUTPUT and INPUT are 0, 1.
+        self._head_out = np.full(2, -1, dtype=np.int32)
+        self._head_in = np.full(2, -1, dtype=np.int32)
+        self._free = []
+        self._size = 0  # high-water mark of the edge table
+        self._count = 0  # number of edges ever added
+        self._nedge = 0
+        self._csr = {}
+        self.version = 0
+
+    def __len__(self):
+        """Number of edges"""
+        return self._nedge
+
+    @property
+    def nbytes(self):
+        """Bytes used by the arrays of the graph."""
+        arrays = [self._edges, self._seq, self._alive,
+                  self._next_out, self._prev_out,
+                  self._next_in, self._prev_in,
+                  self._head_out, self._head_in]
+        return sum(array.nbytes for array in arrays)
+
+    def add_node(self, node):
+        """Make room for the node in the adjacency lists.
+
+        Parameters
+        ----------
+        node : int
+            ID of the node.
+        """
+        self._grow_nodes(node+3)
+
+    def add_edge(self, from_id, from_port, to_id, to_port):
+        """Add an edge.
+
+        Parameters
+        ----------
+        from_id : int
+            Node to connect from.
+        from_port : int
+            Output port to connect from.
+        to_id : int
+            Node to connect to.
+        to_port : int
+            Input port to connect to.
+
+        Returns
+        -------
+        int
+            Slot of the edge in the edge table.
+        """
+        self._grow_nodes(max(from_id, to_id)+3)
+        if self._free:
+            slot = self._free.pop()
+        else:
+            self._grow_edges(self._size+1)
+            slot = self._size
+            self._size += 1
+        self._edges[slot] = (from_id, from_port, to_id, to_port)
+        self._seq[slot] = self._count
+        self._alive[slot] = True
+        self._count += 1
+        self._nedge += 1
+        self._link(slot, from_id+2, self._head_out,
+                   self._next_out, self._prev_out)
+        self._link(slot, to_id+2, self._head_in,
+                   self._next_in, self._prev_in)
+        self._modified()
+        return slot
+
+    def add_edges(self, edges):
+        """Add many edges at once.
+
+        Parameters
+        ----------
+        edges : array of int
+            (E, 4) array of (from_id, from_port, to_id, to_port).
+
+        Note
+        ----
+        The adjacency lists are linked with vectorized operations
+        instead of adding the edges one by one.
+        """
+        edges = np.asarray(edges, dtype=np.int32).reshape(-1, 4)
+        n = len(edges)
+        if n == 0:
+            return
+        self._grow_nodes(int(edges[:, [0, 2]].max())+3)
+        self._grow_edges(self._size+n)
+        slots = np.arange(self._size, self._size+n, dtype=np.int32)
+        self._size += n
+        self._edges[slots] = edges
+        self._seq[slots] = np.arange(self._count, self._count+n)
+        self._alive[slots] = True
+        self._count += n
+        self._nedge += n
+        self._link_many(slots, edges[:, 0]+2, self._head_out,
+                        self._next_out, self._prev_out)
+        self._link_many(slots, edges[:, 2]+2, self._head_in,
+                        self._next_in, self._prev_in)
+        self._modified()
+
+    def find_edge(self, from_id, from_port, to_id, to_port):
+        """Find the slot of an edge.
+
+        Returns
+        -------
+        int
+            Slot of the edge, -1 if the edge doesn't exist.
+        """
+        edge = (from_id, from_port, to_id, to_port)
+        for slot in self.out_edges(from_id):
+            if tuple(self._edges[slot].tolist()) == edge:
+                return slot
+        return -1
+
+    def remove_edge(self, from_id, from_port, to_id, to_port):
+        """Remove an edge.
+
+        Raises
+        ------
+        KeyError
+            If the edge doesn't exist.
+        """
+        slot = self.find_edge(from_id, from_port, to_id, to_port)
+        if slot < 0:
+            raise KeyError("edge {} doesn't exist".format(
+                (from_id, from_port, to_id, to_port)))
+        self._unlink(slot)
+        self._modified()
+
+    def remove_node(self, node):
+        """Remove all the edges connected to a node."""
+        if node+2 >= len(self._head_out):
+            return
+        slots = set(self.out_edges(node)) | set(self.in_edges(node))
+        for slot in slots:
+            self._unlink(slot)
+        if slots:
+            self._modified()
+
+    def clear(self):
+        """Remove all edges."""
+        self._edges[:self._size] = 0
+        self._alive[:] = False
+        for array in [self._next_out, self._prev_out,
+                      self._next_in, self._prev_in,
+                      self._head_out, self._head_in]:
+            array[:] = -1
+        self._free = []
+        self._size = 0
+        self._nedge = 0
+        self._modified()
+
+    def out_edges(self, node):
+        """Slots of the edges leaving a node."""
+        return self._walk(node+2, self._head_out, self._next_out)
+
+    def in_edges(self, node):
+        """Slots of the edges entering a node."""
+        return self._walk(node+2, self._head_in, self._next_in)
+
+    def driver(self, to_id, to_port):
+        """Slot of the edge connected to an input port.
+
+        Returns
+        -------
+        int
+            Slot of the edge, -1 if the port isn't connected.
+        """
+        for slot in self.in_edges(to_id):
+            if self._edges[slot, 3] == to_port:
+                return slot
+        return -1
+
+    def edges(self):
+        """Edge table in insertion order.
+
+        Returns
+        -------
+        array of int
+            (E, 4) array of (from_id, from_port, to_id, to_port).
+        """
+        slots = np.flatnonzero(self._alive)
+        slots = slots[np.argsort(self._seq[slots], kind="stable")]
+        return self._edges[slots]
+
+    def csr(self, reverse=False):
+        """Compressed sparse row view of the graph.
+
+        Parameters
+        ----------
+        reverse : bool, optional
+            Group the edges by the node they enter instead of the node
+            they leave.
+            Defaults to False.
+
+        Returns
+        -------
+        indptr : array of int
+            The edges of node ``i`` are ``edges[indptr[i+2]:indptr[i+3]]``.
+        edges : array of int
+            (E, 4) array of (from_id, from_port, to_id, to_port), sorted
+            by node, then port, then insertion order.
+        """
+        if reverse not in self._csr:
+            col = 2 if reverse else 0
+            slots = np.flatnonzero(self._alive)
+            edges = self._edges[slots]
+            order = np.lexsort((self._seq[slots], edges[:, col+1],
+                                edges[:, col]))
+            edges = edges[order]
+            counts = np.bincount(edges[:, col]+2,
+                                 minlength=len(self._head_out))
+            indptr = np.zeros(len(counts)+1, dtype=np.intp)
+            np.cumsum(counts, out=indptr[1:])
+            self._csr[reverse] = (indptr, edges)
+        return self._csr[reverse]
+
+    def _modified(self):
+        """Invalidate cached views."""
+        self._csr = {}
+        self.version += 1
+
+    def _walk(self, index, head, next_):
+        """Follow a linked list from its head."""
+        slots = []
+        if index >= len(head):
+            return slots
+        slot = head[index]
+        while slot >= 0:
+            slots.append(int(slot))
+            slot = next_[slot]
+        return slots
+
+    def _link(self, slot, index, head, next_, prev):
+        """Push an edge to the front of a linked list."""
+        first = head[index]
+        next_[slot] = first
+        prev[slot] = -1
+        if first >= 0:
+            prev[first] = slot
+        head[index] = slot
+
+    def _link_many(self, slots, index, head, next_, prev):
+        """Push many edges to the front of their linked lists."""
+        order = np.argsort(index, kind="stable")
+        index = index[order]
+        slots = slots[order]
+        same = index[1:] == index[:-1]
+        first = np.concatenate([[True], ~same])
+        last = np.concatenate([~same, [True]])
+        next_[slots[:-1]] = np.where(same, slots[1:], -1)
+        prev[slots[1:]] = np.where(same, slots[:-1], -1)
+        ## chain the old lists after the new edges
+        old_first = head[index[last]]
+        next_[slots[last]] = old_first
+        prev[slots[first]] = -1
+        linked = old_first >= 0
+        prev[old_first[linked]] = slots[last][linked]
+        head[index[first]] = slots[first]
+
+    def _unlink(self, slot):
+        """Remove an edge from its linked lists and free its slot."""
+        from_id, _, to_id, _ = self._edges[slot]
+        for index, head, next_, prev in [
+                (from_id+2, self._head_out, self._next_out, self._prev_out),
+                (to_id+2, self._head_in, self._next_in, self._prev_in)]:
+            p = prev[slot]
+            n = next_[slot]
+            if p >= 0:
+                next_[p] = n
+            else:
+                head[index] = n
+            if n >= 0:
+                prev[n] = p
+        self._alive[slot] = False
+        self._free.append(slot)
+        self._nedge -= 1
+
+    def _grow_nodes(self, n):
+        """Grow the list heads to hold at least n entries."""
+        size = len(self._head_out)
+        if n > size:
+            size = max(n, 2*size)
+            for name in ["_head_out", "_head_in"]:
+                head = np.full(size, -1, dtype=np.int32)
+                old = getattr(self, name)
+                head[:len(old)] = old
+                setattr(self, name, head)
+
+    def _grow_edges(self, n):
+        """Grow the edge table to hold at least n edges."""
+        size = len(self._alive)
+        if n > size:
+            size = max(n, 2*size)
+            for name in ["_edges", "_seq", "_alive"]:
+                old = getattr(self, name)
+                new = np.zeros((size,)+old.shape[1:], dtype=old.dtype)
+                new[:len(old)] = old
+                setattr(self, name, new)
+            for name in ["_next_out", "_prev_out", "_next_in", "_prev_in"]:
+                old = getattr(self, name)
+                new = np.full(size, -1, dtype=old.dtype)
+                new[:len(old)] = old
+                setattr(self, name, new)
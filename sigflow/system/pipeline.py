@@ -0,0 +1,1099 @@
+"""Pipelined execution of a System.
+
+The blocks of a system are partitioned into stages.
+With Pipeline, each stage runs in its own process and passes its
+signals to the later stages through single-producer single-consumer
+ring buffers in shared memory, so the samples are never pickled.
+With ThreadPipeline, see also System.process_pipelined, the stages run
+in threads of this process and hand their chunks over through double
+buffers.
+
+.. code-block:: python
+
+   from sigflow.system.pipeline import Pipeline
+
+   with Pipeline(system, nstages=3, chunk=4096) as pipeline:
+       outputs = pipeline.process(inputs)
+       print(pipeline.report())
+
+   outputs = system.process_pipelined(inputs, nstages=3)
+"""
+import copy
+import multiprocessing
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .system import System
+
+
+__all__ = ["Pipeline", "Ring", "ThreadPipeline", "estimate_costs",
+           "partition"]
+
+
+class Ring:
+    """Single-producer single-consumer ring buffer of chunks in shared
+    memory.
+
+    Each message is a (nchannel, n) chunk of samples.
+    The producer and the consumer may be in different processes.
+
+    Parameters
+    ----------
+    nchannel : int
+        Number of channels of the chunks.
+    capacity : int
+        Number of samples of each channel the ring holds.
+    dtype : numpy.dtype, optional
+        Data type of the samples.
+        Defaults to float64.
+    slots : int, optional
+        Number of messages the ring holds.
+        Defaults to 64.
+    name : str or None, optional
+        Name of an existing ring to attach to, see Ring.spec.
+        Defaults to None, meaning a new ring is created.
+    lock : multiprocessing.Lock or None, optional
+        Lock of the counters, shared by the producer and the consumer.
+        Defaults to None, meaning a new lock.
+
+    Note
+    ----
+    The samples are copied without holding the lock.
+    The producer publishes a message by advancing its counters after
+    copying the samples, and the consumer frees the space by advancing
+    its own counters, each counter being written by one side only.
+    The counters are only read and written under the lock, whose
+    acquire and release are memory barriers on every platform, so that
+    the other side sees the samples before the counters move.
+    """
+    _HEADER = 16  # int64 words: producer counters, then consumer counters
+
+    def __init__(self, nchannel, capacity, dtype=np.float64, slots=64,
+                 name=None, lock=None):
+        """Constructor
+
+        Parameters
+        ----------
+        nchannel : int
+            Number of channels of the chunks.
+        capacity : int
+            Number of samples of each channel the ring holds.
+        dtype : numpy.dtype, optional
+            Data type of the samples.
+            Defaults to float64.
+        slots : int, optional
+            Number of messages the ring holds.
+            Defaults to 64.
+        name : str or None, optional
+            Name of an existing ring to attach to, see Ring.spec.
+            Defaults to None, meaning a new ring is created.
+        lock : multiprocessing.Lock or None, optional
+            Lock of the counters, shared by the producer and the
+            consumer.
+            Defaults to None, meaning a new lock.
+        """
+        self.nchannel = int(nchannel)
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        self.slots = int(slots)
+        self._lock = multiprocessing.Lock() if lock is None else lock
+        header_size = (self._HEADER+self.slots) * 8
+        header_size += -header_size % 64
+        data_size = self.capacity * self.nchannel * self.dtype.itemsize
+        if name is None:
+            self._shm = shared_memory.SharedMemory(
+                create=True, size=header_size+max(data_size, 1))
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        buffer = self._shm.buf
+        ## producer: [0] samples, [1] messages, [2] closed
+        ## consumer: [8] samples, [9] messages
+        self._header = np.ndarray((self._HEADER,), dtype=np.int64,
+                                  buffer=buffer)
+        self._sizes = np.ndarray((self.slots,), dtype=np.int64,
+                                 buffer=buffer, offset=self._HEADER*8)
+        self._data = np.ndarray((self.capacity, self.nchannel),
+                                dtype=self.dtype, buffer=buffer,
+                                offset=header_size)
+        if name is None:
+            self._header[:] = 0
+
+    @property
+    def spec(self):
+        """Arguments attaching to this ring from another process."""
+        return (self.nchannel, self.capacity, self.dtype.str, self.slots,
+                self._shm.name, self._lock)
+
+    @classmethod
+    def attach(cls, spec):
+        """Attach to a ring from its Ring.spec."""
+        return cls(*spec)
+
+    @property
+    def closed(self):
+        """True if the producer closed the ring."""
+        with self._lock:
+            return bool(self._header[2])
+
+    def close(self):
+        """Signal the consumer that no more messages follow."""
+        with self._lock:
+            self._header[2] = 1
+
+    def try_write(self, chunk):
+        """Write a chunk if there is space for it.
+
+        Parameters
+        ----------
+        chunk : array
+            (nchannel, n) array of samples.
+
+        Returns
+        -------
+        bool
+            True if the chunk was written.
+        """
+        header = self._header
+        n = chunk.shape[1]
+        if n > self.capacity:
+            raise ValueError("chunk of {} samples is larger than the "
+                             "capacity {}".format(n, self.capacity))
+        with self._lock:
+            written, messages, read, consumed = header[[0, 1, 8, 9]].tolist()
+        if (written - read + n > self.capacity
+                or messages - consumed >= self.slots):
+            return False
+        start = written % self.capacity
+        first = min(n, self.capacity-start)
+        self._data[start:start+first] = chunk[:, :first].T
+        self._data[:n-first] = chunk[:, first:].T
+        self._sizes[messages % self.slots] = n
+        ## publish the samples and the message
+        with self._lock:
+            header[0] = written + n
+            header[1] = messages + 1
+        return True
+
+    def write(self, chunk):
+        """Write a chunk, waiting for space."""
+        spins = 0
+        while not self.try_write(chunk):
+            spins = _backoff(spins)
+
+    def try_read(self):
+        """Read the next chunk if there is one.
+
+        Returns
+        -------
+        array or None
+            (nchannel, n) array of samples, None if there is no message.
+        """
+        header = self._header
+        with self._lock:
+            published, read, messages = header[[1, 8, 9]].tolist()
+        if published == messages:
+            return None
+        n = int(self._sizes[messages % self.slots])
+        start = read % self.capacity
+        first = min(n, self.capacity-start)
+        chunk = np.empty((self.nchannel, n), dtype=self.dtype)
+        chunk[:, :first] = self._data[start:start+first].T
+        chunk[:, first:] = self._data[:n-first].T
+        ## free the space and the message slot
+        with self._lock:
+            header[8] = read + n
+            header[9] = messages + 1
+        return chunk
+
+    def read(self):
+        """Read the next chunk, waiting for it.
+
+        Returns
+        -------
+        array or None
+            (nchannel, n) array of samples, None if the ring is closed
+            and empty.
+        """
+        spins = 0
+        while True:
+            closed = self.closed
+            chunk = self.try_read()
+            if chunk is not None or closed:
+                return chunk
+            spins = _backoff(spins)
+
+    def release(self):
+        """Detach from the shared memory."""
+        self._header = self._sizes = self._data = None
+        self._shm.close()
+
+    def unlink(self):
+        """Detach from and free the shared memory."""
+        self.release()
+        self._shm.unlink()
+
+
+def _backoff(spins):
+    """Wait a bit longer each time nothing could be done."""
+    if spins < 64:
+        time.sleep(0)
+    else:
+        time.sleep(50e-6)
+    return spins + 1
+
+
+def estimate_costs(system, chunk=1024):
+    """Estimate the processing time of the blocks of a system.
+
+    Parameters
+    ----------
+    system : System
+        The system.
+    chunk : int, optional
+        Number of samples processed by each block.
+        Defaults to 1024.
+
+    Returns
+    -------
+    dict
+        {block_id: seconds per sample}.
+
+    Note
+    ----
+    The blocks are timed on copies, so their states are not changed.
+    """
+    costs = {}
+    for block_id, block in system.blocks.items():
+        block = copy.deepcopy(block)
+        inputs = np.zeros((block.ninput, chunk))
+        block.process(inputs)  # warm up
+        start = time.perf_counter()
+        block.process(inputs)
+        costs[block_id] = (time.perf_counter()-start) / chunk
+    return costs
+
+
+def _profiled_costs(system, order):
+    """Time spent in each block while profiling, None if a block in
+    order was not timed."""
+    costs = dict.fromkeys(system.blocks, 0.)
+    for path, seconds in system._profile.items():
+        costs[path[0]] += seconds
+    if any(costs[i] == 0 for i in order):
+        return None
+    return costs
+
+
+def _topology(system):
+    """Execution order and connections of the blocks of a system.
+
+    Returns
+    -------
+    order : list of int
+        Block IDs in execution order.
+    edges : list of tuple
+        (from_id, from_port, to_id, to_port), with from_id "input" and
+        to_id "output" for the system's input and output.
+    """
+    input_edges, steps = system._compile()
+    order = [block_id for block_id, _, _ in steps]
+    edges = [("input", from_port, to_id, to_port)
+             for from_port, to_id, to_port in input_edges]
+    for block_id, _, block_edges in steps:
+        edges.extend((block_id, from_port, to_id, to_port)
+                     for from_port, to_id, to_port in block_edges)
+    return order, edges
+
+
+def partition(system, nstages, costs=None, slack=0.1):
+    """Partition the blocks of a system into pipeline stages.
+
+    Parameters
+    ----------
+    system : System
+        The system.
+    nstages : int
+        Maximum number of stages.
+    costs : dict or None, optional
+        {block_id: seconds per sample}, or any time proportional to it.
+        Defaults to None, meaning the times recorded while profiling
+        the system if all blocks were timed, see System.profiling,
+        otherwise the costs estimated with estimate_costs.
+    slack : float, optional
+        Fraction by which the load of a stage may exceed the smallest
+        possible bottleneck, to cut fewer connections.
+        Defaults to 0.1.
+
+    Returns
+    -------
+    list of list of int
+        The block IDs of each stage, in execution order.
+
+    Note
+    ----
+    Stages are contiguous runs of the execution schedule, so signals
+    only flow to later stages.
+    Feedback connections, i.e. connections to a block scheduled at or
+    before their source, are never cut.
+    The stages first minimize the load of the most loaded stage, then,
+    within the slack, the number of signals crossing between stages.
+    Blocks not in the schedule are never executed and are left out.
+    """
+    order, edges = _topology(system)
+    if costs is None:
+        costs = _profiled_costs(system, order) or estimate_costs(system)
+    m = len(order)
+    if m == 0:
+        return []
+    position = {block_id: k for k, block_id in enumerate(order)}
+    load = np.concatenate([[0.], np.cumsum([costs[i] for i in order])])
+
+    ## boundary b cuts between the blocks at positions b-1 and b
+    forbidden = np.zeros(m+2, dtype=int)
+    last_use = {}
+    for from_id, from_port, to_id, _ in edges:
+        if from_id == "input" or to_id == "output":
+            continue
+        source, target = position[from_id], position[to_id]
+        if target <= source:
+            forbidden[target+1] += 1
+            forbidden[source+1] -= 1
+        else:
+            channel = (source, from_port)
+            last_use[channel] = max(last_use.get(channel, 0), target)
+    allowed = np.cumsum(forbidden)[:m+1] == 0
+    allowed[0] = allowed[m] = True
+    crossing = np.zeros(m+2)
+    for (source, _), target in last_use.items():
+        crossing[source+1] += 1
+        crossing[target+1] -= 1
+    crossing = np.cumsum(crossing)[:m+1]
+
+    ## smallest bottleneck, by greedily filling the stages
+    def nstage_needed(limit):
+        count, start, last = 1, 0, 0
+        for b in range(1, m+1):
+            if load[b]-load[start] > limit:
+                if last == start:
+                    return np.inf
+                count, start = count+1, last
+                if load[b]-load[start] > limit:
+                    return np.inf
+            if allowed[b]:
+                last = b
+        return count
+
+    starts = np.flatnonzero(allowed[:m])
+    candidates = np.unique(np.concatenate(
+        [load[a+1:]-load[a] for a in starts]))
+    lo, hi = 0, len(candidates)-1
+    while lo < hi:
+        mid = (lo+hi) // 2
+        if nstage_needed(candidates[mid]) <= nstages:
+            hi = mid
+        else:
+            lo = mid+1
+    limit = candidates[lo] * (1+slack)
+
+    ## fewest crossings with stage loads within the limit
+    boundaries = np.flatnonzero(allowed)[1:].tolist()
+    previous = {0: (0., [])}  # boundary: (crossings, cuts)
+    best = None
+    for _ in range(nstages):
+        layer = {}
+        for b in boundaries:
+            options = [(cost + (crossing[b] if b < m else 0.), cuts + [b])
+                       for a, (cost, cuts) in previous.items()
+                       if a < b and load[b]-load[a] <= limit]
+            if options:
+                layer[b] = min(options, key=lambda option: option[0])
+        if m in layer and (best is None or layer[m][0] <= best[0]):
+            best = layer.pop(m)
+        previous = layer
+    cuts = [0] + best[1]
+    return [order[a:b] for a, b in zip(cuts[:-1], cuts[1:])]
+
+
+def _split(system, stages):
+    """Split a system into the systems of its stages.
+
+    Parameters
+    ----------
+    system : System
+        The system.
+    stages : list of list of int
+        The block IDs of each stage.
+
+    Returns
+    -------
+    stages : list of list of int
+        The block IDs of each stage in execution order, without the
+        blocks which are never executed.
+    channels : dict
+        {(from_stage, to_stage): channels} of the signals passed between
+        the stages, with -1 for the system's input and len(stages) for
+        the system's output.
+        Channels are (from_id, from_port), or ((from_id, from_port),
+        output port) to the system's output.
+        The inputs and outputs of the stage systems are the channels in
+        the order of the keys.
+    direct : list of tuple
+        (input port, output port) of the connections from the system's
+        input to its output.
+    systems : list of System
+        The system of each stage, containing the blocks of the system.
+
+    Note
+    ----
+    Stages pass chunks of the same size, so blocks changing the rate
+    are not supported.
+    """
+    if system._multirate():
+        raise ValueError("pipelines do not support blocks changing "
+                         "the rate")
+    order, edges = _topology(system)
+    position = {block_id: k for k, block_id in enumerate(order)}
+    stage_of = {}
+    for s, stage in enumerate(stages):
+        for block_id in stage:
+            if block_id not in system.blocks:
+                raise LookupError("block {} doesn't exist in the "
+                                  "system".format(block_id))
+            if block_id in stage_of:
+                raise ValueError("block {} is in more than one stage"
+                                 "".format(block_id))
+            if block_id in position:
+                stage_of[block_id] = s
+    missing = [i for i in order if i not in stage_of]
+    if missing:
+        raise ValueError("blocks {} are not in any stage".format(missing))
+    stages = [sorted((i for i in stage if i in position), key=position.get)
+              for stage in stages]
+    nstage = len(stages)
+
+    channels = {}
+    consumers = {}  # (stage, channel): [(to_id, to_port)]
+    direct = []
+    for from_id, from_port, to_id, to_port in edges:
+        source = -1 if from_id == "input" else stage_of[from_id]
+        target = nstage if to_id == "output" else stage_of[to_id]
+        if source == -1 and target == nstage:
+            direct.append((from_port, to_port))
+            continue
+        if source == target:
+            continue
+        if source > target or (
+                source >= 0 and target < nstage
+                and position[to_id] <= position[from_id]):
+            raise ValueError(
+                "the connection from block {} to block {} goes "
+                "against the order of the stages".format(from_id, to_id))
+        channel_list = channels.setdefault((source, target), [])
+        if target == nstage:
+            ## one channel per output port
+            channel_list.append(((from_id, from_port), to_port))
+            continue
+        if (from_id, from_port) not in channel_list:
+            channel_list.append((from_id, from_port))
+        consumers.setdefault((target, (from_id, from_port)), []).append(
+            (to_id, to_port))
+
+    systems = []
+    for s, stage in enumerate(stages):
+        local = {block_id: k for k, block_id in enumerate(stage)}
+        stage_edges = []
+        nin = 0
+        for key in sorted(k for k in channels if k[1] == s):
+            for channel in channels[key]:
+                for to_id, to_port in consumers[s, channel]:
+                    stage_edges.append((-1, nin, local[to_id], to_port))
+                nin += 1
+        for from_id, from_port, to_id, to_port in edges:
+            if from_id in local and to_id != "output" and to_id in local:
+                stage_edges.append((local[from_id], from_port,
+                                    local[to_id], to_port))
+        nout = 0
+        for key in sorted(k for k in channels if k[0] == s):
+            for channel in channels[key]:
+                if key[1] == nstage:
+                    channel = channel[0]
+                from_id, from_port = channel
+                stage_edges.append((local[from_id], from_port, -1, nout))
+                nout += 1
+        stage_system = System.from_edges(
+            [system.blocks[i] for i in stage], stage_edges, nin, nout)
+        stage_system._dtype = system.dtype
+        stage_system._compile(order=list(range(len(stage))))
+        systems.append(stage_system)
+    return stages, channels, direct, systems
+
+
+def _run_stage(index, arrays, pending, input_specs, output_specs,
+               stats_name, per_sample):
+    """Worker process of a pipeline stage."""
+    stage = System._from_arrays(arrays)
+    for block_id, values in pending.items():
+        stage._pending[block_id][:] = values
+    inputs = [Ring.attach(spec) for spec in input_specs]
+    outputs = [Ring.attach(spec) for spec in output_specs]
+    stats_memory = shared_memory.SharedMemory(name=stats_name)
+    ## busy nanoseconds and samples processed by this stage
+    stats = np.ndarray((2,), dtype=np.int64, buffer=stats_memory.buf,
+                       offset=16*index)
+    try:
+        while True:
+            chunks = [ring.read() for ring in inputs]
+            if chunks[0] is None:
+                break
+            start = time.perf_counter_ns()
+            chunk = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+            if per_sample:
+                results = stage._process_samples(chunk)
+            else:
+                results = stage.process(chunk)
+            stats[0] += time.perf_counter_ns() - start
+            stats[1] += chunk.shape[1]
+            offset = 0
+            for ring in outputs:
+                ring.write(results[offset:offset+ring.nchannel])
+                offset += ring.nchannel
+    finally:
+        for ring in outputs:
+            ring.close()
+        for ring in inputs + outputs:
+            ring.release()
+        del stats
+        stats_memory.close()
+
+
+class Pipeline:
+    """Execution of a system by stages in parallel processes.
+
+    Parameters
+    ----------
+    system : System
+        The system.
+    stages : list of list of int, optional
+        The block IDs of each stage.
+        Defaults to None, meaning the blocks are partitioned with
+        partition.
+    nstages : int, optional
+        Number of stages to partition the system into, if stages is
+        None.
+        Defaults to 2.
+    chunk : int, optional
+        Number of samples passed between the stages at once.
+        Defaults to 4096.
+    capacity : int, optional
+        Number of samples the ring buffers between stages hold.
+        Defaults to 4 chunks.
+    costs : dict or None, optional
+        {block_id: seconds per sample}, see partition.
+        Defaults to None, meaning the costs are estimated.
+    context : multiprocessing context or str, optional
+        Context starting the worker processes, e.g. "spawn".
+        Defaults to None, meaning the default context.
+
+    Note
+    ----
+    Each stage runs a copy of its blocks, starting from their current
+    states and the values pending on the connections of the system.
+    The system itself is not advanced.
+    The outputs are the same as calling ``system.process`` on
+    successive chunks of ``chunk`` samples, including with feedback
+    connections, which must stay within a stage.
+    Long inputs keep all stages busy, as Pipeline.process waits for
+    its outputs before returning.
+    """
+    def __init__(self, system, stages=None, nstages=2, chunk=4096,
+                 capacity=None, costs=None, context=None):
+        """Constructor
+
+        Parameters
+        ----------
+        system : System
+            The system.
+        stages : list of list of int, optional
+            The block IDs of each stage.
+            Defaults to None, meaning the blocks are partitioned with
+            partition.
+        nstages : int, optional
+            Number of stages to partition the system into, if stages is
+            None.
+            Defaults to 2.
+        chunk : int, optional
+            Number of samples passed between the stages at once.
+            Defaults to 4096.
+        capacity : int, optional
+            Number of samples the ring buffers between stages hold.
+            Defaults to 4 chunks.
+        costs : dict or None, optional
+            {block_id: seconds per sample}, see partition.
+            Defaults to None, meaning the costs are estimated.
+        context : multiprocessing context or str, optional
+            Context starting the worker processes, e.g. "spawn".
+            Defaults to None, meaning the default context.
+        """
+        if chunk < 1:
+            raise ValueError("chunk must be a positive integer.")
+        if capacity is None:
+            capacity = 4 * chunk
+        if capacity < chunk:
+            raise ValueError("capacity must hold at least one chunk.")
+        if costs is None:
+            costs = (_profiled_costs(system, _topology(system)[0])
+                     or estimate_costs(system))
+        if stages is None:
+            stages = partition(system, nstages, costs)
+        if context is None or isinstance(context, str):
+            context = multiprocessing.get_context(context)
+        self.system = system
+        self.chunk = chunk
+        self.capacity = capacity
+        self.ninput = system.ninput
+        self.noutput = system.noutput
+        self.dtype = system.dtype
+        self._context = context
+        self._costs = costs
+        self._plan(stages)
+        self._rings = []
+        self._workers = []
+        self._stats = None
+
+    def _plan(self, stages):
+        """Build the system of each stage."""
+        system = self.system
+        self.stages, self._channels, self._direct, systems = _split(
+            system, stages)
+        self._stage_arrays = []
+        self._stage_pending = []
+        for stage, stage_system in zip(self.stages, systems):
+            self._stage_arrays.append(stage_system._to_arrays())
+            self._stage_pending.append(
+                {k: list(system._pending[i]) for k, i in enumerate(stage)})
+            for block in stage_system.blocks.values():
+                block._remove_owner(stage_system)
+
+    def start(self):
+        """Start the worker processes."""
+        if self._workers:
+            return
+        nstage = len(self.stages)
+        rings = {key: Ring(len(channel_list), self.capacity, self.dtype,
+                           lock=self._context.Lock())
+                 for key, channel_list in self._channels.items()}
+        self._stats_memory = shared_memory.SharedMemory(
+            create=True, size=16*max(nstage, 1))
+        self._stats = np.ndarray((max(nstage, 1), 2), dtype=np.int64,
+                                 buffer=self._stats_memory.buf)
+        self._stats[:] = 0
+        self._rings = list(rings.values())
+        self._inputs = [
+            (rings[key], [port for _, port in self._channels[key]])
+            for key in sorted(k for k in rings if k[0] == -1)]
+        self._outputs = [
+            (rings[key], [port for _, port in self._channels[key]])
+            for key in sorted(k for k in rings if k[1] == nstage)]
+        per_sample = self.system._flat_plan()[3]
+        for s in range(nstage):
+            inputs = [rings[key].spec for key in sorted(rings)
+                      if key[1] == s]
+            outputs = [rings[key].spec for key in sorted(rings)
+                       if key[0] == s]
+            worker = self._context.Process(
+                target=_run_stage, daemon=True,
+                args=(s, self._stage_arrays[s], self._stage_pending[s],
+                      inputs, outputs, self._stats_memory.name, per_sample))
+            worker.start()
+            self._workers.append(worker)
+
+    def process(self, inputs):
+        """Process a chunk of samples.
+
+        Parameters
+        ----------
+        inputs : array
+            (ninput, n) array of n samples of each input of the system.
+
+        Returns
+        -------
+        array
+            (noutput, n) array of n samples of each output of the system.
+            Outputs which are not connected are filled with nan.
+        """
+        self.start()
+        inputs = np.atleast_2d(inputs)
+        if len(inputs) != self.ninput:
+            raise ValueError("expected input size of {} in axis 0, "
+                             "got {} instead".format(self.ninput,
+                                                     len(inputs)))
+        n = inputs.shape[1]
+        outputs = np.full((self.noutput, n), np.nan, dtype=self.dtype)
+        for from_port, to_port in self._direct:
+            outputs[to_port] = inputs[from_port]
+        pieces = [(k, min(k+self.chunk, n)) for k in range(0, n, self.chunk)]
+        written = [0] * len(self._inputs)
+        read = [0] * len(self._outputs)
+        spins = 0
+        while (min(written, default=len(pieces)) < len(pieces)
+               or min(read, default=len(pieces)) < len(pieces)):
+            progress = False
+            for r, (ring, ports) in enumerate(self._inputs):
+                while written[r] < len(pieces):
+                    start, stop = pieces[written[r]]
+                    if not ring.try_write(inputs[ports, start:stop]):
+                        break
+                    written[r] += 1
+                    progress = True
+            for r, (ring, ports) in enumerate(self._outputs):
+                while read[r] < len(pieces):
+                    closed = ring.closed
+                    chunk = ring.try_read()
+                    if chunk is None:
+                        if closed:
+                            raise RuntimeError("a pipeline stage exited")
+                        break
+                    start, stop = pieces[read[r]]
+                    outputs[ports, start:stop] = chunk
+                    read[r] += 1
+                    progress = True
+            if progress:
+                spins = 0
+                continue
+            if any(worker.exitcode is not None for worker in self._workers):
+                raise RuntimeError("a pipeline stage exited")
+            spins = _backoff(spins)
+        return outputs
+
+    def report(self):
+        """Load of the stages and bandwidth between them.
+
+        Returns
+        -------
+        dict
+            "stages": list of {"blocks", "load", "busy", "samples"} of
+            each stage, where load is the estimated time per sample in
+            seconds, and busy and samples are the measured processing
+            time in seconds and the number of samples processed so far.
+            "bandwidth": {(from_stage, to_stage): bytes per sample},
+            where "input" and "output" denote the system's input and
+            output.
+        """
+        nstage = len(self.stages)
+        stages = []
+        for s, stage in enumerate(self.stages):
+            busy, samples = 0, 0
+            if self._stats is not None:
+                busy, samples = self._stats[s].tolist()
+            stages.append({"blocks": list(stage),
+                           "load": sum(self._costs[i] for i in stage),
+                           "busy": busy / 1e9, "samples": samples})
+        itemsize = self.dtype.itemsize
+        names = {-1: "input", nstage: "output"}
+        bandwidth = {(names.get(source, source), names.get(target, target)):
+                     len(channel_list) * itemsize
+                     for (source, target), channel_list
+                     in sorted(self._channels.items())}
+        return {"stages": stages, "bandwidth": bandwidth}
+
+    def close(self):
+        """Stop the worker processes and free the shared memory."""
+        for ring, _ in getattr(self, "_inputs", []):
+            ring.close()
+        for worker in self._workers:
+            worker.join(timeout=5)
+            if worker.exitcode is None:
+                worker.terminate()
+                worker.join()
+        for ring in self._rings:
+            ring.unlink()
+        if self._workers:
+            self._stats = self._stats.copy()  # keep the report
+            self._stats_memory.close()
+            self._stats_memory.unlink()
+        self._rings = []
+        self._workers = []
+        self._inputs = []
+        self._outputs = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _DoubleBuffer:
+    """Handoff of chunks between two threads through two preallocated
+    arrays, one being filled while the other is read."""
+    def __init__(self, nchannel, chunk, dtype):
+        self.nchannel = nchannel
+        self._arrays = [np.empty((nchannel, chunk), dtype=dtype)
+                        for _ in range(2)]
+        self._sizes = [0, 0]
+        self.close()
+
+    def open(self, abort, depth=None):
+        """Empty the buffer before a run.
+
+        Parameters
+        ----------
+        abort : threading.Event
+            Event set when a stage fails.
+        depth : sigflow.metrics.Gauge child, optional
+            Gauge of the chunks waiting.
+        """
+        self._empty = threading.Semaphore(2)
+        self._full = threading.Semaphore(0)
+        self._put = 0
+        self._get = 0
+        self.abort = abort
+        self.depth = depth
+
+    def close(self):
+        """Drop the synchronization objects after a run."""
+        self._empty = self._full = None
+        self.abort = self.depth = None
+
+    def _acquire(self, semaphore):
+        while not semaphore.acquire(timeout=0.1):
+            if self.abort.is_set():
+                raise RuntimeError("another pipeline stage failed")
+
+    def put(self, chunk):
+        """Copy a chunk into the next free array, waiting for one."""
+        self._acquire(self._empty)
+        i = self._put
+        n = chunk.shape[1]
+        self._arrays[i][:, :n] = chunk
+        self._sizes[i] = n
+        self._put = 1 - i
+        if self.depth is not None:
+            self.depth.inc()
+        self._full.release()
+
+    def get(self):
+        """The next chunk, to be handed back with release."""
+        self._acquire(self._full)
+        i = self._get
+        self._get = 1 - i
+        if self.depth is not None:
+            self.depth.dec()
+        return self._arrays[i][:, :self._sizes[i]]
+
+    def release(self):
+        """Hand the array of the chunk read back to the producer."""
+        self._empty.release()
+
+
+class ThreadPipeline:
+    """Execution of a system by stages in parallel threads.
+
+    Stage k processes chunk i while stage k+1 processes chunk i-1.
+    The chunks are handed over between the stages through double
+    buffers preallocated for each pair of stages.
+
+    Parameters
+    ----------
+    system : System
+        The system.
+    stages : list of list of int, optional
+        The block IDs of each stage.
+        Defaults to None, meaning the blocks are partitioned with
+        partition.
+    nstages : int, optional
+        Number of stages to partition the system into, if stages is
+        None.
+        Defaults to 2.
+    chunk : int, optional
+        Number of samples processed by the stages at once.
+        Defaults to 4096.
+    costs : dict or None, optional
+        {block_id: seconds per sample}, see partition.
+        Defaults to None, meaning the costs are estimated.
+
+    Note
+    ----
+    The stages run the blocks of the system, which are advanced as
+    with ``system.process`` on successive chunks of ``chunk`` samples,
+    with the same outputs.
+    Threads run in parallel while the blocks are in numpy and scipy
+    kernels releasing the GIL, such as matrix products, lfilter and
+    FFTs, so long chunks and heavy blocks scale best.
+    When the system has metrics, sigflow_stage_queue_depth gauges the
+    chunks waiting for each stage.
+    """
+    def __init__(self, system, stages=None, nstages=2, chunk=4096,
+                 costs=None):
+        """Constructor
+
+        Parameters
+        ----------
+        system : System
+            The system.
+        stages : list of list of int, optional
+            The block IDs of each stage.
+            Defaults to None, meaning the blocks are partitioned with
+            partition.
+        nstages : int, optional
+            Number of stages to partition the system into, if stages is
+            None.
+            Defaults to 2.
+        chunk : int, optional
+            Number of samples processed by the stages at once.
+            Defaults to 4096.
+        costs : dict or None, optional
+            {block_id: seconds per sample}, see partition.
+            Defaults to None, meaning the costs are estimated.
+        """
+        if chunk < 1:
+            raise ValueError("chunk must be a positive integer.")
+        if stages is None:
+            stages = partition(system, nstages, costs)
+        self.system = system
+        self.chunk = chunk
+        self.stages, channels, self._direct, self._systems = _split(
+            system, stages)
+        nstage = len(self.stages)
+        self._layout = system._layout_version()
+
+        ## (ring key, ports or buffer) of the inputs and outputs of each
+        ## stage, in the order of the ports of the stage systems
+        self._buffers = {}
+        self._sources = [[] for _ in range(nstage)]
+        self._targets = [[] for _ in range(nstage)]
+        for key in sorted(channels):
+            source, target = key
+            channel_list = channels[key]
+            if source == -1:
+                self._sources[target].append(
+                    ("input", [port for _, port in channel_list]))
+            elif target == nstage:
+                self._targets[source].append(
+                    ("output", [port for _, port in channel_list]))
+            else:
+                buffer = _DoubleBuffer(len(channel_list), chunk,
+                                       system.dtype)
+                self._buffers[key] = buffer
+                self._sources[target].append(("buffer", buffer))
+                self._targets[source].append(("buffer", buffer))
+        self._inputs = [np.empty((stage_system.ninput, chunk),
+                                 dtype=system.dtype)
+                        for stage_system in self._systems]
+
+    def process(self, inputs):
+        """Process a chunk of samples.
+
+        Parameters
+        ----------
+        inputs : array
+            (ninput, n) array of n samples of each input of the system.
+
+        Returns
+        -------
+        array
+            (noutput, n) array of n samples of each output of the system.
+            Outputs which are not connected are filled with nan.
+        """
+        system = self.system
+        if system._layout_version() != self._layout:
+            raise RuntimeError("the connections of the system changed "
+                               "since the stages were planned.")
+        inputs = np.atleast_2d(inputs)
+        if len(inputs) != system.ninput:
+            raise ValueError("expected input size of {} in axis 0, "
+                             "got {} instead".format(system.ninput,
+                                                     len(inputs)))
+        meters = system._meters
+        tracer = system._tracer
+        if meters is not None or tracer is not None:
+            step_start = time.perf_counter_ns()
+        n = inputs.shape[1]
+        outputs = np.full((system.noutput, n), np.nan, dtype=system.dtype)
+        for from_port, to_port in self._direct:
+            outputs[to_port] = inputs[from_port]
+        pieces = [(k, min(k+self.chunk, n)) for k in range(0, n, self.chunk)]
+        per_sample = system._flat_plan()[3]
+
+        ## the values pending on the connections within the stages
+        for stage, stage_system in zip(self.stages, self._systems):
+            stage_system.tracer = tracer
+            for k, block_id in enumerate(stage):
+                stage_system._pending[k][:] = system._pending[block_id]
+        abort = threading.Event()
+        depth = None
+        if system._metrics is not None:
+            depth = system._metrics.gauge(
+                "sigflow_stage_queue_depth",
+                "Chunks waiting for a pipeline stage.", ["system", "stage"])
+        for (_, target), buffer in self._buffers.items():
+            buffer.open(abort, None if depth is None else depth.labels(
+                system._metric_label(), str(target)))
+        errors = []
+
+        def run(s):
+            stage_system = self._systems[s]
+            stage_inputs = self._inputs[s]
+            try:
+                for start, stop in pieces:
+                    m = stop - start
+                    row = 0
+                    for kind, source in self._sources[s]:
+                        if kind == "input":
+                            rows = len(source)
+                            stage_inputs[row:row+rows, :m] = (
+                                inputs[source, start:stop])
+                        else:
+                            chunk = source.get()
+                            rows = len(chunk)
+                            stage_inputs[row:row+rows, :m] = chunk
+                            source.release()
+                        row += rows
+                    if per_sample:
+                        results = stage_system._process_samples(
+                            stage_inputs[:, :m])
+                    else:
+                        results = stage_system.process(stage_inputs[:, :m])
+                    row = 0
+                    for kind, target in self._targets[s]:
+                        if kind == "output":
+                            rows = len(target)
+                            outputs[target, start:stop] = (
+                                results[row:row+rows])
+                        else:
+                            rows = target.nchannel
+                            target.put(results[row:row+rows])
+                        row += rows
+            except BaseException as error:
+                errors.append(error)
+                abort.set()
+
+        threads = [threading.Thread(target=run, args=(s,), daemon=True)
+                   for s in range(1, len(self.stages))]
+        for thread in threads:
+            thread.start()
+        if self.stages:
+            run(0)
+        for thread in threads:
+            thread.join()
+        for stage_system in self._systems:
+            stage_system.tracer = None
+        for buffer in self._buffers.values():
+            buffer.close()
+        if errors:
+            raise errors[0]
+
+        for stage, stage_system in zip(self.stages, self._systems):
+            for k, block_id in enumerate(stage):
+                system._pending[block_id][:] = stage_system._pending[k]
+        if system.noutput > 0 and n > 0:
+            last = outputs[:, -1]
+            system._pending["output"] = [
+                None if np.isnan(value) else value for value in last]
+        if meters is not None or tracer is not None:
+            system._end_step(n, step_start)
+        return outputs
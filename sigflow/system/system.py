@@ -1,7 +1,15 @@
+import collections
+import heapq
+import importlib
+import time
+
 import numpy as np
 
 from sigflow.blocks import Block
+from sigflow.core.io import load_npz
+from sigflow.core.memory import sizeof
 from sigflow.core.utils import to_array
+from .graph import Graph, INPUT, OUTPUT
 
 class System(Block):
     """A generic system class that connect blocks.
@@ -10,35 +18,155 @@ class System(Block):
     ----------
     blocks : list of Block objects
         System's blocks which connect to each other.
+    inline : bool
+        Inline the nested systems into the execution plan of this
+        system.
+        Defaults to True.
+    profiling : bool
+        Record the time spent in each block, see System.profile.
+        Defaults to False.
+    metrics : sigflow.metrics.Registry or None
+        Registry to record the execution metrics in, see System.metrics.
+        Defaults to None.
+    tracer : sigflow.tracing.Tracer or None
+        Tracer recording the execution of the blocks, see System.tracer.
+        Defaults to None.
+    deadline : float or None
+        Time budget per sample in seconds.
+        Steps taking longer are counted as overruns in the metrics.
+        Defaults to None.
+    event_driven : bool
+        Only run the pure blocks whose inputs changed when called
+        sample by sample, see System.event_driven.
+        Defaults to False.
+    dtype : numpy.dtype
+        The data type of the signals of the system.
+        Setting it also sets the dtype of all blocks, after which the
+        dtype of individual blocks can be set again.
+        Defaults to float64.
     """
-    def __init__(self, blocks=None, nin=0, nout=0):
+    def __init__(self, blocks=None, nin=0, nout=0, label=None):
         """Constructor.
 
         Parameters
         ----------
         blocks : Block or iterable of Block objects.
             The block to be included in the system.
+        label : str or None, optional
+            Label for this system.
+            Defaults to None
         """
         if blocks is None:
             blocks = []
+        self.label = label
 
         ## node table
         blocks = to_array(blocks, Block)
-        ids = range(len(blocks))
-        self.blocks = dict(enumerate(blocks))
-        self._ids = dict(zip(blocks, ids))
+        self.blocks = {}
+        self._ids = {}
 
-        ## adjacency list
-        out_ports = [[{}]*block.noutput for block in blocks]
-        self._succ = dict(zip(ids, out_ports))
+        ## adjacency store
+        self._graph = Graph()
+        self._plan = None
+        self._plan_version = -1
+        self._feedback = None
+        self._flat = None
+        self._rates = None  # (version, input rates, output rates)
+        self._inline = True
+        self._state_layout = None
+        self._profiling = False
+        self._profile = {}
+        self._metrics = None
+        self._meters = None
+        self._tracer = None
+        self._trace_names = {}
+        self._pipeline = None  # (key, ThreadPipeline) of process_pipelined
+        self.deadline = None
+        self._event_driven = False
+        self._events = None  # (flat plan, routes, stateful, positions)
+        self._dirty = None  # steps to run next call, None for all
+        self._active = 0  # number of blocks run in the last call
 
         self._set = False # indicate if starting block is set.
-        in_ports = [[{}]*block.ninput for block in blocks]
-        self._pred = dict(zip(ids, in_ports))
-        pending = [[0.]*block.ninput for block in blocks]
-        self._pending = dict(zip(ids, pending))
+        self._pending = {}
+        self._changed = set()  # IDs of blocks changed since the last call
+        for i, block in enumerate(blocks):
+            self._insert_block(i, block)
         self.set_ninout(nin, nout)
 
+    @classmethod
+    def from_edges(cls, blocks, edges, nin=0, nout=0):
+        """Construct a system from blocks and an edge table in one go.
+
+        Parameters
+        ----------
+        blocks : Block or iterable of Block objects.
+            The blocks to be included in the system.
+            Block IDs are given by their positions.
+        edges : array of int
+            (E, 4) array of (from_id, from_port, to_id, to_port).
+            A from_id of -1 denotes the system's input and
+            a to_id of -1 denotes the system's output.
+        nin : int, optional
+            Number of inputs of the system.
+            Defaults to 0.
+        nout : int, optional
+            Number of outputs of the system.
+            Defaults to 0.
+
+        Returns
+        -------
+        System
+            The connected system.
+
+        Note
+        ----
+        Ports are validated with vectorized checks and the adjacency
+        lists are built in a single pass over the edges.
+        This is much faster than calling ``add_edge`` repeatedly for
+        large systems.
+        """
+        sys = cls(blocks, nin=nin, nout=nout)
+        edges = np.asarray(edges, dtype=int).reshape(-1, 4)
+        from_id, from_port, to_id, to_port = edges.T
+        nblock = len(sys.blocks)
+
+        ## check valid ids
+        for name, ids in [("from_id", from_id), ("to_id", to_id)]:
+            invalid = (ids < -1) | (ids >= nblock)
+            if np.any(invalid):
+                raise LookupError("{} {} doesn't exist in the system"
+                                  "".format(name, ids[invalid][0]))
+
+        ## check valid ports, index -1 is the system's input/output.
+        noutputs = np.array([block.noutput for block in sys.blocks.values()]
+                            + [nin], dtype=int)
+        ninputs = np.array([block.ninput for block in sys.blocks.values()]
+                           + [nout], dtype=int)
+        invalid = (from_port < 0) | (from_port >= noutputs[from_id])
+        if np.any(invalid):
+            i = np.flatnonzero(invalid)[0]
+            raise ValueError("invalid from port {} for id:{}"
+                             "".format(from_port[i], from_id[i]))
+        invalid = (to_port < 0) | (to_port >= ninputs[to_id])
+        if np.any(invalid):
+            i = np.flatnonzero(invalid)[0]
+            raise ValueError("invalid to port {} for id:{}"
+                             "".format(to_port[i], to_id[i]))
+
+        ## check if an input port is driven more than once
+        _, counts = np.unique(np.column_stack([to_id, to_port]),
+                              axis=0, return_counts=True)
+        if np.any(counts > 1):
+            raise ValueError("an input port is connected to more than"
+                             " one node.")
+
+        ## add edges
+        to_id = np.where(to_id == -1, OUTPUT, to_id)
+        sys._graph.add_edges(np.column_stack([from_id, from_port,
+                                              to_id, to_port]))
+        return sys
+
     def set_ninout(self, ninput, noutput=0):
         """Set the input and output blocks of the system.
         System then behaves like a block, with definite input and output.
@@ -53,11 +181,8 @@ class System(Block):
         """
         self.ninput = ninput
         self.noutput = noutput
-        if ninput > 0:
-            self._succ = {**self._succ, **{"input": [{}]*ninput}}
         if noutput > 0:
-            self._pred = {**self._pred, **{"output": [{}]*noutput}}
-            self._pending = {**self._pending, **{"output": [None]*noutput}}
+            self._pending["output"] = [None]*noutput
         self._set = True
 
     def _i2o(self):
@@ -70,58 +195,1270 @@ class System(Block):
         if not self._set:
             raise ValueError("self.input_blocks is not set."
                              "Set it by using self.set_blocks method.")
+        if self._multirate():
+            raise ValueError("systems with blocks changing the rate only "
+                             "process chunks, see System.process")
+        meters = self._meters
+        tracer = self._tracer
+        step_start = None
+        if meters is not None or tracer is not None:
+            step_start = time.perf_counter_ns()
         ## for short hand
         inputs = self.inputs
-        pending = self._pending
-        visited = {}.fromkeys(self.blocks.keys(), False)
-        ## block waiting to process in breadth first search method,
-        ## may have duplicates
-        queue = []
-        ## reset to block input=list of zero if block mutated
-        for ids, data in pending.items():
-            if ids != "input" and ids != "output":
-                length = self.blocks[ids].ninput
-                if len(data) != length:
-                    pending[ids] = [0.]*length
+        timed = self._profiling or tracer is not None
+        if self._event_driven:
+            return self._propagate_changes(inputs, timed, step_start)
+        input_routes, steps, systems, _ = self._flat_plan()
+        for system in systems:
+            system._refresh_pending()
         ## setting input to the system to blocks' inputs
-        for from_port in range(self.ninput):
-            for target_id, to_port in self._succ["input"][from_port].items():
-                queue.append(target_id)    # add blocks to be run
-                pending[target_id][to_port] = self.inputs[from_port]
-
+        for from_port, target, target_key, to_port in input_routes:
+            target[target_key][to_port] = inputs[from_port]
 
-        while len(queue):
-            current_id = queue.pop(0)
-            if visited[current_id]:
+        for path, current_block, pending, key, routes in steps:
+            values = pending[key]
+            if current_block is None:
+                ## distributing the inputs of a nested system
+                for from_port, target, target_key, to_port in routes:
+                    target[target_key][to_port] = values[from_port]
                 continue
-
-            visited[current_id] = True
-            current_block = self.blocks[current_id]
-
+            if timed:
+                start = time.perf_counter_ns()
             ## setting predessors output as successor's input
             if current_block.ninput > 1:
                 ## setting each element of the input as the same size
-                tmp = np.broadcast(*pending[current_id])
-                pending[current_id] = np.column_stack(tuple(tmp))
-                current_block.inputs = pending[current_id]
+                tmp = np.broadcast(*values)
+                pending[key] = np.column_stack(tuple(tmp))
+                current_block.inputs = pending[key]
             else:
-                current_block.inputs = pending[current_id][0]
+                current_block.inputs = values[0]
             ## process input to output
             tmp_output = current_block.output
+            if not isinstance(tmp_output, list) and np.ndim(tmp_output) == 0:
+                tmp_output = (tmp_output,)
+            if timed:
+                self._record(path, start, time.perf_counter_ns())
+
+            ## caching data
+            for from_port, target, target_key, to_port in routes:
+                target[target_key][to_port] = tmp_output[from_port]
+        if self.noutput > 0:
+            res = self._pending["output"].copy()
+        else:
+            res = None
+        if meters is not None or tracer is not None:
+            self._end_step(1, step_start)
+        return res
+
+    def _propagate_changes(self, inputs, timed, step_start):
+        """System._i2o in event-driven mode, see System.event_driven.
+
+        Parameters
+        ----------
+        inputs : array
+            The inputs of the system.
+        timed : bool
+            Record the time spent in the blocks.
+        step_start : int or None
+            Start time of the step for the metrics, or None.
+
+        Returns
+        -------
+        list
+            The outputs, see System._i2o.
+        """
+        plan = self._flat_plan()
+        input_routes, steps, systems, _ = plan
+        if self._events is None or self._events[0] is not plan:
+            self._events = self._event_plan(plan)
+            self._dirty = None
+        _, routes, stateful, positions = self._events
+
+        ## stateful blocks always step, pure ones only if an input changed
+        if self._dirty is None:
+            queue = list(range(len(steps)))
+        else:
+            ## a stateful block fed back by a changed value is queued once
+            queue = sorted(set(stateful) | self._dirty)
+        queued = set(queue)
+        delayed = set()
+        for system, position in zip(systems, positions):
+            for block_id in system._changed:
+                k = position.get(block_id)
+                if k is not None and k not in queued:
+                    heapq.heappush(queue, k)
+                    queued.add(k)
+            system._refresh_pending()
 
-            ports = self._succ[current_id] # nested dict of target blocks
-            for from_port in range(len(ports)):
-                ## caching data
-                for target_id, to_port in ports[from_port].items():
-                    if target_id != "output":
-                        queue.append(target_id)    # add blocks to be run
-                    pending[target_id][to_port] = tmp_output[from_port]
+        def send(k, value, target, target_key, to_port, target_k):
+            if not _differs(target[target_key][to_port], value):
+                return
+            target[target_key][to_port] = value
+            if target_k is None:
+                return
+            if target_k <= k:
+                ## feedback connections are delayed to the next call
+                delayed.add(target_k)
+            elif target_k not in queued:
+                heapq.heappush(queue, target_k)
+                queued.add(target_k)
+
+        for from_port, target, target_key, to_port, target_k in routes[-1]:
+            send(-1, inputs[from_port], target, target_key, to_port,
+                 target_k)
+        active = 0
+        while queue:
+            k = heapq.heappop(queue)
+            path, current_block, pending, key, _ = steps[k]
+            values = pending[key]
+            if current_block is None:
+                for from_port, target, target_key, to_port, target_k in (
+                        routes[k]):
+                    send(k, values[from_port], target, target_key, to_port,
+                         target_k)
+                continue
+            active += 1
+            if timed:
+                start = time.perf_counter_ns()
+            if current_block.ninput > 1:
+                tmp = np.broadcast(*values)
+                pending[key] = np.column_stack(tuple(tmp))
+                current_block.inputs = pending[key]
+            else:
+                current_block.inputs = values[0]
+            tmp_output = current_block.output
+            if not isinstance(tmp_output, list) and np.ndim(tmp_output) == 0:
+                tmp_output = (tmp_output,)
+            if timed:
+                self._record(path, start, time.perf_counter_ns())
+            for from_port, target, target_key, to_port, target_k in routes[k]:
+                send(k, tmp_output[from_port], target, target_key, to_port,
+                     target_k)
+        self._dirty = delayed
+        self._active = active
         if self.noutput > 0:
-            res = pending["output"].copy()
+            res = self._pending["output"].copy()
         else:
             res = None
+        if step_start is not None:
+            self._end_step(1, step_start)
         return res
 
+    @staticmethod
+    def _event_plan(plan):
+        """Routes of the flat plan annotated for System._propagate_changes.
+
+        Parameters
+        ----------
+        plan : tuple
+            The flat plan, see System._flat_plan.
+
+        Returns
+        -------
+        plan : tuple
+            The flat plan.
+        routes : list of list
+            (from_port, pending, key, to_port, position) of the routes of
+            each step, and of the system's input last, where position is
+            the index of the receiving step, or None for the outputs.
+        stateful : list of int
+            Indices of the steps of blocks which are not pure.
+        positions : list of dict
+            {block_id: index of its step} of each system of the plan.
+        """
+        input_routes, steps, systems, _ = plan
+        position = {(id(pending), key): k
+                    for k, (_, _, pending, key, _) in enumerate(steps)}
+        routes = [[route + (position.get((id(route[1]), route[2])),)
+                   for route in step_routes]
+                  for step_routes in [step[4] for step in steps]
+                  + [input_routes]]
+        stateful = [k for k, step in enumerate(steps)
+                    if step[1] is not None and not step[1].pure]
+        positions = [{key: k for (pending_id, key), k in position.items()
+                      if pending_id == id(system._pending)}
+                     for system in systems]
+        return plan, routes, stateful, positions
+
+    def _compile(self, order=None):
+        """Compile the execution schedule of the system.
+
+        Blocks are scheduled in breadth first search order starting from
+        the system's input.
+        The schedule is cached until the connections are changed.
+
+        Parameters
+        ----------
+        order : list of int, optional
+            Precompiled execution order of the blocks.
+            Defaults to None, meaning the order is searched.
+
+        Returns
+        -------
+        input_edges : list of tuple
+            (from_port, to_id, to_port) of the edges from the system's
+            input.
+        steps : list of tuple
+            (block_id, block, edges) in execution order, where edges are
+            (from_port, to_id, to_port) of the edges from the block.
+            to_id is "output" for the system's output.
+        """
+        graph = self._graph
+        if (order is None and self._plan is not None
+                and self._plan_version == graph.version):
+            return self._plan
+        indptr, edges = graph.csr()
+        from_port = edges[:, 1].tolist()
+        to_id = ["output" if i == OUTPUT else i for i in edges[:, 2].tolist()]
+        to_port = edges[:, 3].tolist()
+
+        def out_edges(node):
+            i = slice(indptr[node+2], indptr[node+3])
+            return list(zip(from_port[i], to_id[i], to_port[i]))
+
+        input_edges = out_edges(INPUT)
+        steps = []
+        if order is not None:
+            queue = collections.deque()
+            steps = [(i, self.blocks[i], out_edges(i)) for i in order]
+        else:
+            queue = collections.deque(
+                target for _, target, _ in input_edges if target != "output")
+        visited = set()
+        while queue:
+            current_id = queue.popleft()
+            if current_id in visited:
+                continue
+            visited.add(current_id)
+            current_edges = out_edges(current_id)
+            steps.append((current_id, self.blocks[current_id],
+                          current_edges))
+            queue.extend(target for _, target, _ in current_edges
+                         if target != "output")
+        self._plan = (input_edges, steps)
+        self._plan_version = graph.version
+        self._feedback = None
+        return self._plan
+
+    def _flat_plan(self):
+        """Execution plan with the nested systems inlined.
+
+        The schedule of each nested system is expanded in place of the
+        nested system in the schedule of its parent, so that the blocks
+        run in the same order as when the nested systems are called.
+        The outputs of the blocks in nested systems are routed directly
+        to the ports they end up at.
+        The plan is cached until the connections of this or a nested
+        system are changed.
+
+        Returns
+        -------
+        input_routes : list of tuple
+            (from_port, pending, key, to_port) of the routes from the
+            system's input, meaning the value is put in
+            ``pending[key][to_port]``.
+        steps : list of tuple
+            (path, block, pending, key, routes) in execution order.
+            The block reads its inputs from ``pending[key]`` and routes
+            its outputs with (from_port, pending, key, to_port).
+            path is the tuple of block IDs from this system.
+            block is None for the steps distributing the inputs of
+            a nested system to its blocks.
+        systems : list of System
+            This and the inlined systems.
+        feedback : bool
+            True if a route goes to a step scheduled at or before its
+            source, i.e. if the system has a feedback connection.
+        """
+        version = self._layout_version()
+        if self._flat is not None and self._flat[0] == version:
+            return self._flat[1]
+        input_edges, _ = self._compile()
+        self._port_rates()
+        outputs = {port: [(self._pending, "output", port)]
+                   for port in range(self.noutput)}
+        steps, systems = self._flatten((), outputs)
+        input_routes = [(from_port,) + sink
+                        for from_port, to_id, to_port in input_edges
+                        for sink in self._sinks(to_id, to_port, outputs)]
+        position = {(id(pending), key): k
+                    for k, (_, _, pending, key, _) in enumerate(steps)}
+        feedback = any(
+            position.get((id(target), target_key), len(steps)) <= k
+            for k, step in enumerate(steps)
+            for _, target, target_key, _ in step[4])
+        plan = (input_routes, steps, systems, feedback)
+        multirate = any(block is not None and block.rate != 1
+                        for _, block, _, _, _ in steps)
+        self._flat = (version, plan, multirate)
+        self._trace_names = {}
+        return plan
+
+    def _flatten(self, path, outputs):
+        """Steps of the flat plan of this system, see System._flat_plan.
+
+        Parameters
+        ----------
+        path : tuple
+            Block IDs from the top system to this system.
+        outputs : dict
+            {output port: list of (pending, key, to_port)} where the
+            outputs of this system go to.
+
+        Returns
+        -------
+        steps : list of tuple
+            The steps, see System._flat_plan.
+        systems : list of System
+            This and the inlined systems.
+        """
+        _, compiled = self._compile()
+        steps = []
+        systems = [self]
+        for current_id, current_block, edges in compiled:
+            block_path = path + (current_id,)
+            routes = [(from_port,) + sink
+                      for from_port, to_id, to_port in edges
+                      for sink in self._sinks(to_id, to_port, outputs)]
+            if not (self.inline and isinstance(current_block, System)):
+                steps.append((block_path, current_block, self._pending,
+                              current_id, routes))
+                continue
+            block_outputs = collections.defaultdict(list)
+            for from_port, *sink in routes:
+                block_outputs[from_port].append(tuple(sink))
+            block_input_edges, _ = current_block._compile()
+            copy = [(from_port,) + sink
+                    for from_port, to_id, to_port in block_input_edges
+                    for sink in current_block._sinks(to_id, to_port,
+                                                     block_outputs)]
+            steps.append((block_path, None, self._pending, current_id, copy))
+            block_steps, block_systems = current_block._flatten(
+                block_path, block_outputs)
+            steps += block_steps
+            systems += block_systems
+        return steps, systems
+
+    def _sinks(self, to_id, to_port, outputs):
+        """Where the value sent to a port of this system ends up.
+
+        Returns
+        -------
+        list of tuple
+            (pending, key, to_port).
+        """
+        if to_id == "output":
+            return outputs.get(to_port, [])
+        return [(self._pending, to_id, to_port)]
+
+    def _feedback_ports(self):
+        """Input ports fed by blocks scheduled after the receiving block.
+
+        The values of these ports are carried over to the next call,
+        i.e. the connections are delayed by one sample.
+
+        Returns
+        -------
+        list of tuple
+            (block_id, to_port) of the ports.
+        """
+        _, steps = self._compile()
+        if self._feedback is None:
+            position = {step[0]: k for k, step in enumerate(steps)}
+            self._feedback = [
+                (target_id, to_port)
+                for current_id, _, edges in steps
+                for _, target_id, to_port in edges
+                if (target_id != "output"
+                    and position[target_id] <= position[current_id])]
+        return self._feedback
+
+    def process(self, inputs):
+        """Process a chunk of samples.
+
+        Parameters
+        ----------
+        inputs : array
+            (ninput, n) array of n samples of each input of the system.
+
+        Returns
+        -------
+        array or list of array
+            (noutput, n) array of n samples of each output of the system.
+            Outputs which are not connected are filled with nan.
+            With blocks changing the rate, e.g. Resampler, the outputs
+            have the number of samples of their rate, and a list of 1-D
+            arrays is returned if the outputs have different rates.
+
+        Note
+        ----
+        Each block processes the whole chunk at once with Block.process,
+        in the order of the schedule.
+        This gives the same result as calling the system sample by
+        sample.
+        Blocks after a block changing the rate process the chunks at the
+        rate of their inputs, which must all have the same rate, see
+        Block.rate.
+        Systems with blocks changing the rate cannot be called sample by
+        sample.
+        With feedback connections, the chunk is split into chunks of
+        latency+1 samples if all feedback connections come from blocks
+        with a latency, e.g. delay lines, see Block.latency.
+        Otherwise, the samples are passed to the system one by one.
+        Feedback connections are not supported with blocks changing the
+        rate.
+        """
+        if not self._set:
+            raise ValueError("self.input_blocks is not set."
+                             "Set it by using self.set_blocks method.")
+        inputs = np.atleast_2d(inputs)
+        if len(inputs) != self.ninput:
+            raise ValueError("expected input size of {} in axis 0, "
+                             "got {} instead".format(self.ninput,
+                                                     len(inputs)))
+        n = inputs.shape[1]
+        _, _, _, feedback = self._flat_plan()
+        size = n
+        breaks = []
+        if feedback:
+            if self._multirate():
+                raise ValueError("feedback connections are not supported "
+                                 "with blocks changing the rate")
+            size, breaks = self._feedback_breaks()
+            if size is None:
+                return self._process_samples(inputs)
+
+        meters = self._meters
+        tracer = self._tracer
+        if meters is not None or tracer is not None:
+            step_start = time.perf_counter_ns()
+        if size >= n:
+            outputs = self._process_chunk(inputs, breaks)
+        else:
+            outputs = np.concatenate(
+                [self._process_chunk(inputs[:, k:k+size], breaks)
+                 for k in range(0, n, size)], axis=1)
+        self._dirty = None
+        if meters is not None or tracer is not None:
+            self._end_step(n, step_start)
+        return outputs
+
+    def _multirate(self):
+        """True if a block of the flat plan changes the rate."""
+        self._flat_plan()
+        return self._flat[2]
+
+    def _port_rates(self):
+        """Rates of the inputs of the blocks and of the outputs of the
+        system, derived from Block.rate along the schedule.
+
+        Returns
+        -------
+        inputs : dict
+            {block_id: rate} of the inputs of the scheduled blocks,
+            relative to the rate of the system's input.
+        outputs : list
+            Rate of each output of the system.
+            Outputs which are not connected have the rate of the other
+            outputs if they all have the same, or else the input rate.
+
+        Raises
+        ------
+        ValueError
+            If the inputs of a block or an output of the system are fed
+            at different rates.
+        """
+        version = self._layout_version()
+        if self._rates is not None and self._rates[0] == version:
+            return self._rates[1:]
+        input_edges, steps = self._compile()
+        inputs = {}
+        outputs = [None]*self.noutput
+
+        def feed(to_id, to_port, rate):
+            if to_id == "output":
+                known = outputs[to_port]
+                outputs[to_port] = rate
+            else:
+                known = inputs.setdefault(to_id, rate)
+            if known is not None and known != rate:
+                raise ValueError(
+                    "inputs of block {} have different rates: {} and "
+                    "{}".format(to_id, known, rate))
+
+        for _, to_id, to_port in input_edges:
+            feed(to_id, to_port, 1)
+        ## blocks of a precompiled order may be fed by later blocks
+        remaining = steps
+        while remaining:
+            deferred = []
+            for current_id, current_block, edges in remaining:
+                if current_id not in inputs:
+                    deferred.append((current_id, current_block, edges))
+                    continue
+                rate = inputs[current_id]
+                if isinstance(current_block, System):
+                    rates = [rate*r for r in current_block._port_rates()[1]]
+                else:
+                    rates = [rate*current_block.rate]*current_block.noutput
+                for from_port, to_id, to_port in edges:
+                    feed(to_id, to_port, rates[from_port])
+            if len(deferred) == len(remaining):
+                break
+            remaining = deferred
+        connected = {rate for rate in outputs if rate is not None}
+        common = connected.pop() if len(connected) == 1 else 1
+        outputs = [common if rate is None else rate for rate in outputs]
+        self._rates = (version, inputs, outputs)
+        return inputs, outputs
+
+    def _process_chunk(self, inputs, breaks=()):
+        """Process a chunk of samples, see System.process.
+
+        Parameters
+        ----------
+        inputs : array
+            (ninput, n) array of n samples of each input of the system.
+        breaks : list of tuple, optional
+            (block, route) of the feedback routes, see
+            System._feedback_breaks.
+            n must not exceed the latency of the blocks plus one.
+            Defaults to ().
+
+        Returns
+        -------
+        array
+            (noutput, n) array of n samples of each output of the system.
+        """
+        n = inputs.shape[1]
+        input_routes, steps, systems, _ = self._flat_plan()
+        for system in systems:
+            system._refresh_pending()
+        timed = self._profiling or self._tracer is not None
+        chunk = {}  # values of the ports in this chunk
+
+        def port_values(pending, key):
+            slot = (id(pending), key)
+            if slot not in chunk:
+                chunk[slot] = (pending, key, list(pending[key]))
+            return chunk[slot][2]
+
+        ## feedback connections carry the last output of the previous
+        ## chunk and the outputs the blocks already know
+        for block, (from_port, target, target_key, to_port) in breaks:
+            values = port_values(target, target_key)
+            future = block._peek(n-1)[from_port] if n > 1 else []
+            values[to_port] = np.concatenate(
+                [np.ravel(values[to_port]), future])
+        for from_port, target, target_key, to_port in input_routes:
+            port_values(target, target_key)[to_port] = inputs[from_port]
+        for path, current_block, pending, key, routes in steps:
+            values = port_values(pending, key)
+            if current_block is None:
+                for from_port, target, target_key, to_port in routes:
+                    port_values(target, target_key)[to_port] = (
+                        values[from_port])
+                continue
+            if timed:
+                start = time.perf_counter_ns()
+            ## blocks after a resampler process chunks at its rate
+            m = _chunk_length(values, n)
+            block_inputs = np.empty((current_block.ninput, m),
+                                    dtype=current_block.dtype)
+            for port, value in enumerate(values):
+                block_inputs[port] = value
+            if m > 0:
+                block_outputs = current_block.process(block_inputs)
+            else:
+                block_outputs = np.empty((current_block.noutput, 0),
+                                         dtype=current_block.dtype)
+            if timed:
+                self._record(path, start, time.perf_counter_ns())
+            for from_port, target, target_key, to_port in routes:
+                port_values(target, target_key)[to_port] = (
+                    block_outputs[from_port])
+
+        ## keep the last sample pending, as if called sample by sample
+        for pending, key, values in chunk.values():
+            for port, value in enumerate(values):
+                if np.ndim(value) > 0 and len(value) > 0:
+                    pending[key][port] = value[-1]
+        values = (port_values(self._pending, "output")
+                  if self.noutput > 0 else [])
+        _, rates = self._port_rates()
+        if len(set(rates)) > 1:
+            outputs = [np.full(n, np.nan, dtype=self.dtype)
+                       if np.ndim(value) == 0
+                       else np.asarray(value, dtype=self.dtype)
+                       for value in values]
+            return outputs
+        m = _chunk_length(values, n)
+        outputs = np.full((self.noutput, m), np.nan, dtype=self.dtype)
+        for i, value in enumerate(values):
+            if value is not None:
+                outputs[i] = value
+        return outputs
+
+    def _feedback_breaks(self):
+        """Feedback routes of the flat plan and the chunk size they allow.
+
+        Returns
+        -------
+        size : int or None
+            The largest number of samples which can be processed at once,
+            one more than the smallest latency of the blocks the feedback
+            routes come from, or None if one of them has no latency.
+        breaks : list of tuple
+            (block, route) of the feedback routes, where route is
+            (from_port, pending, key, to_port).
+        """
+        _, steps, _, _ = self._flat_plan()
+        position = {(id(pending), key): k
+                    for k, (_, _, pending, key, _) in enumerate(steps)}
+        size = None
+        breaks = []
+        for k, (_, block, _, _, routes) in enumerate(steps):
+            for route in routes:
+                _, target, target_key, _ = route
+                if position.get((id(target), target_key), len(steps)) > k:
+                    continue
+                latency = 0 if block is None else block.latency
+                if latency < 1:
+                    return None, []
+                if size is None or latency + 1 < size:
+                    size = latency + 1
+                breaks.append((block, route))
+        return size, breaks
+
+    def process_pipelined(self, inputs, nstages=2, chunk=4096, costs=None):
+        """Process a chunk of samples with the blocks split into stages
+        running in parallel threads.
+
+        Parameters
+        ----------
+        inputs : array
+            (ninput, n) array of n samples of each input of the system.
+        nstages : int, optional
+            Maximum number of stages.
+            Defaults to 2.
+        chunk : int, optional
+            Number of samples processed by the stages at once.
+            Defaults to 4096.
+        costs : dict or None, optional
+            {block_id: seconds per sample} balancing the stages.
+            Defaults to None, meaning the times recorded while
+            profiling, or else estimated.
+
+        Returns
+        -------
+        array
+            (noutput, n) array of n samples of each output of the system.
+            Outputs which are not connected are filled with nan.
+
+        Note
+        ----
+        The outputs are the same as calling System.process on
+        successive chunks of ``chunk`` samples.
+        The stages are planned on the first call and again when the
+        connections, nstages or chunk change.
+        See sigflow.system.pipeline.ThreadPipeline.
+        """
+        from .pipeline import ThreadPipeline
+
+        key = (self._layout_version(), nstages, chunk)
+        if self._pipeline is None or self._pipeline[0] != key:
+            self._pipeline = (key, ThreadPipeline(
+                self, nstages=nstages, chunk=chunk, costs=costs))
+        return self._pipeline[1].process(inputs)
+
+    def _process_samples(self, inputs):
+        """Process a chunk of samples by calling the system sample by
+        sample, see System.process."""
+        if self._multirate():
+            raise ValueError("systems with blocks changing the rate only "
+                             "process chunks, see System.process")
+        n = inputs.shape[1]
+        outputs = np.full((self.noutput, n), np.nan, dtype=self.dtype)
+        for k in range(n):
+            res = self(inputs[:, k])
+            for i in range(self.noutput):
+                if res[i] is not None:
+                    outputs[i, k] = np.ravel(res[i])[0]
+        return outputs
+
+    def initialize_steady_state(self, inputs):
+        """Set the states of all blocks to the equilibrium for constant
+        inputs.
+
+        Parameters
+        ----------
+        inputs : float or array
+            The constant value of each input of the system.
+
+        Returns
+        -------
+        array
+            The steady-state value of each output of the system.
+            Outputs which are not connected are nan.
+
+        Note
+        ----
+        Without feedback connections, the equilibrium values are
+        propagated through the blocks in the order of the schedule, see
+        Block.initialize_steady_state.
+        Otherwise, the values of all ports are first solved from the DC
+        gains of the blocks, see System.frequency_response.
+        The values pending on the connections are set too, so the system
+        starts settled.
+        """
+        if not self._set:
+            raise ValueError("self.input_blocks is not set."
+                             "Set it by using self.set_blocks method.")
+        inputs = np.ravel(np.asarray(inputs, dtype=float))
+        if len(inputs) != self.ninput:
+            raise ValueError("expected input size of {}, got {} instead"
+                             "".format(self.ninput, len(inputs)))
+        input_edges, steps = self._compile()
+        self._refresh_pending()
+        self._dirty = None
+        pending = self._pending
+        for from_port, target_id, to_port in input_edges:
+            pending[target_id][to_port] = inputs[from_port]
+
+        if self._feedback_ports():
+            gains, feed, inject, _, _ = self._interconnection(np.zeros(1))
+            u_offset, _ = self._port_offsets()
+            gains = gains[0].real
+            u = np.linalg.solve(np.identity(len(feed)) - feed @ gains,
+                                inject @ inputs)
+            for current_id, current_block, _ in steps:
+                start = u_offset[current_id]
+                for port in range(current_block.ninput):
+                    pending[current_id][port] = u[start+port]
+
+        for current_id, current_block, edges in steps:
+            block_inputs = np.ravel(np.asarray(pending[current_id],
+                                               dtype=float))
+            block_outputs = current_block.initialize_steady_state(
+                block_inputs)
+            for from_port, target_id, to_port in edges:
+                pending[target_id][to_port] = block_outputs[from_port]
+        outputs = np.full(self.noutput, np.nan)
+        if self.noutput > 0:
+            for i, value in enumerate(pending["output"]):
+                if value is not None:
+                    outputs[i] = value
+        return outputs
+
+    def frequency_response(self, freqs, break_edges=None):
+        """Frequency response of the system.
+
+        Parameters
+        ----------
+        freqs : array
+            Frequencies in Hz.
+        break_edges : list of tuple, optional
+            Connections to open, e.g. to get the open-loop response of a
+            feedback system.
+            Each connection is given by the arguments of System.add_edge,
+            (edge_from, edge_to[, from_port[, to_port]]).
+            Defaults to None.
+
+        Returns
+        -------
+        array
+            (n_freq, noutput, ninput) complex array of the gains from each
+            input to each output of the system.
+            Outputs which are not connected are nan.
+
+        Note
+        ----
+        The responses of the blocks are evaluated at all frequencies at
+        once, see Block.frequency_response, and the interconnection is
+        solved as a batch of linear systems, one per frequency.
+        Nested systems are evaluated recursively.
+        The connections are treated as continuous, i.e. the one-sample
+        delay of feedback connections is neglected.
+        """
+        freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+        gains, feed, inject, read, direct = self._interconnection(
+            freqs, break_edges)
+        ## block inputs u = feed @ gains @ u + inject @ x
+        loop = np.identity(len(feed)) - feed @ gains
+        u = np.linalg.solve(
+            loop, np.broadcast_to(inject, loop.shape[:2]+inject.shape[1:]))
+        response = read @ (gains @ u) + direct
+        driven = read.any(axis=1) | direct.any(axis=1)
+        response[:, ~driven] = np.nan
+        return response
+
+    def loop_response(self, freqs, edge):
+        """Open-loop response around a connection.
+
+        Parameters
+        ----------
+        freqs : array
+            Frequencies in Hz.
+        edge : tuple
+            The connection to open, given by the arguments of
+            System.add_edge, (edge_from, edge_to[, from_port[, to_port]]).
+
+        Returns
+        -------
+        array
+            (n_freq,) complex array of the gain from the input port the
+            connection goes to, around the loop, back to the output port
+            it comes from, with the connection opened.
+
+        Note
+        ----
+        For a loop closed with negative feedback, e.g. through
+        Junction("+-"), the loop gain is the negative of this.
+        See System.frequency_response for the assumptions.
+        """
+        freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+        from_id, from_port, to_id, to_port = self._resolve_edge(edge)
+        if from_id == INPUT or to_id == OUTPUT:
+            raise ValueError("edge must connect two blocks.")
+        gains, feed, _, _, _ = self._interconnection(freqs, [edge])
+        u_offset, y_offset = self._port_offsets()
+        inject = np.zeros((len(feed), 1))
+        inject[u_offset[to_id]+to_port] = 1.
+        loop = np.identity(len(feed)) - feed @ gains
+        u = np.linalg.solve(loop, np.broadcast_to(inject,
+                                                  (len(freqs),)+inject.shape))
+        row = y_offset[from_id] + from_port
+        return (gains[:, row:row+1] @ u)[:, 0, 0]
+
+    def _port_offsets(self):
+        """Positions of the ports of each block in the stacked ports.
+
+        Returns
+        -------
+        u_offset : dict
+            {block_id: position of the first input port}.
+        y_offset : dict
+            {block_id: position of the first output port}.
+        """
+        u_offset = {}
+        y_offset = {}
+        nu = 0
+        ny = 0
+        for i, block in self.blocks.items():
+            u_offset[i] = nu
+            y_offset[i] = ny
+            nu += block.ninput
+            ny += block.noutput
+        return u_offset, y_offset
+
+    def _interconnection(self, freqs, break_edges=None):
+        """Block responses and connection matrices of the system.
+
+        The input ports u and output ports y of all blocks are stacked,
+        so that the system is described by
+        y = gains @ u, u = feed @ y + inject @ x and
+        system output = read @ y + direct @ x,
+        where x is the system input.
+
+        Parameters
+        ----------
+        freqs : array
+            Frequencies in Hz.
+        break_edges : list of tuple, optional
+            Connections to leave out, see System.frequency_response.
+            Defaults to None.
+
+        Returns
+        -------
+        gains : array
+            (n_freq, ny, nu) block diagonal responses of the blocks.
+        feed, inject, read, direct : array
+            Connection matrices of 0s and 1s.
+        """
+        u_offset, y_offset = self._port_offsets()
+        nu = sum(block.ninput for block in self.blocks.values())
+        ny = sum(block.noutput for block in self.blocks.values())
+        gains = np.zeros((len(freqs), ny, nu), dtype=complex)
+        for i, block in self.blocks.items():
+            gains[:, y_offset[i]:y_offset[i]+block.noutput,
+                  u_offset[i]:u_offset[i]+block.ninput] = (
+                      block.frequency_response(freqs))
+
+        edges = self._graph.edges()
+        if break_edges:
+            broken = np.array([self._resolve_edge(edge)
+                               for edge in break_edges])
+            keep = ~(edges[:, None, :] == broken[None, :, :]).all(-1).any(-1)
+            edges = edges[keep]
+        ## offsets indexed by node+2, boundaries left at 0
+        size = max(self.blocks, default=-1) + 3
+        u_start = np.zeros(size, dtype=int)
+        y_start = np.zeros(size, dtype=int)
+        for i in self.blocks:
+            u_start[i+2] = u_offset[i]
+            y_start[i+2] = y_offset[i]
+        from_id, from_port, to_id, to_port = edges.T
+        rows = u_start[to_id+2] + to_port
+        cols = y_start[from_id+2] + from_port
+        from_input = from_id == INPUT
+        to_output = to_id == OUTPUT
+
+        feed = np.zeros((nu, ny))
+        inject = np.zeros((nu, self.ninput))
+        read = np.zeros((self.noutput, ny))
+        direct = np.zeros((self.noutput, self.ninput))
+        mask = ~from_input & ~to_output
+        feed[rows[mask], cols[mask]] = 1.
+        mask = from_input & ~to_output
+        inject[rows[mask], from_port[mask]] = 1.
+        mask = ~from_input & to_output
+        read[to_port[mask], cols[mask]] = 1.
+        mask = from_input & to_output
+        direct[to_port[mask], from_port[mask]] = 1.
+        return gains, feed, inject, read, direct
+
+    def _resolve_edge(self, edge):
+        """Graph row of an existing connection.
+
+        Parameters
+        ----------
+        edge : tuple
+            The arguments of System.add_edge,
+            (edge_from, edge_to[, from_port[, to_port]]).
+
+        Returns
+        -------
+        tuple
+            (from_node, from_port, to_node, to_port).
+        """
+        edge_from, edge_to, *ports = edge
+        from_port, to_port = (list(ports) + [0, 0])[:2]
+        self._check_block_exists(edge_from)
+        self._check_block_exists(edge_to)
+        if isinstance(edge_from, Block):
+            edge_from = self._ids[edge_from]
+        if isinstance(edge_to, Block):
+            edge_to = self._ids[edge_to]
+        row = (self._node(edge_from), from_port, self._node(edge_to), to_port)
+        if self._graph.find_edge(*row) < 0:
+            raise KeyError("edge {} doesn't exist".format(
+                (edge_from, from_port, edge_to, to_port)))
+        return row
+
+    def get_state(self, out=None):
+        """Dynamic states of the system as one flat array.
+
+        Parameters
+        ----------
+        out : array, optional
+            Array of size ``len(self.state_index())`` to put the states in.
+            Defaults to None, meaning a new array is returned.
+
+        Returns
+        -------
+        array
+            States of all blocks, including those of nested systems,
+            followed by the values pending on feedback connections.
+            See System.state_index for the position of each state.
+            The dtype is the common dtype of the states, e.g. float64
+            for float32 states mixed with integer counters.
+
+        Note
+        ----
+        The block states are kept in one contiguous buffer per dtype, so
+        taking a snapshot is essentially a single copy.
+        """
+        arenas, ports, _ = self._bind_state_layout()
+        pending = [np.ravel(pending_dict[i][port])
+                   for _, pending_dict, i, port, _ in ports]
+        parts = [arena for _, arena in arenas] + pending
+        if not parts:
+            ## a system without states, e.g. of matrices only
+            if out is None:
+                return np.empty(0, dtype=self.dtype)
+            if np.shape(out) != (0,):
+                raise ValueError("expected out of shape (0,), got {} "
+                                 "instead".format(np.shape(out)))
+            return out
+        return np.concatenate(parts, out=out)
+
+    def set_state(self, state):
+        """Restore the dynamic states from System.get_state.
+
+        Parameters
+        ----------
+        state : array
+            States returned by System.get_state of this system or of a
+            system with the same topology and blocks.
+        """
+        arenas, ports, size = self._bind_state_layout()
+        state = np.asarray(state)
+        if state.shape != (size,):
+            raise ValueError("expected state of shape {}, got {} instead"
+                             "".format((size,), state.shape))
+        for offset, arena in arenas:
+            arena[:] = state[offset:offset+len(arena)]
+        for offset, pending_dict, i, port, shape in ports:
+            value = state[offset:offset+int(np.prod(shape))].reshape(shape)
+            pending_dict[i][port] = value[()] if shape == () else value
+        self._dirty = None
+
+    def state_index(self):
+        """Position of each state in System.get_state.
+
+        Returns
+        -------
+        dict
+            {name: (offset, shape)}.
+            Block states are named "blocks/<id>/<state>" and the values
+            pending on feedback connections "pending/<id>/<port>".
+            Nested systems prefix the names with "blocks/<id>/".
+
+        Note
+        ----
+        The index is built on each call rather than kept with the state
+        arenas, as the names take more memory than the states of small
+        blocks.
+        """
+        _, ports, _ = self._bind_state_layout()
+        entries, pending_ports = self._state_entries()
+        index = {}
+        offset = 0
+        for _, group in _dtype_groups(entries):
+            for name, _, _, array in group:
+                index[name] = (offset, array.shape)
+                offset += array.size
+        for (name, *_), (offset, *_, shape) in zip(pending_ports, ports):
+            index[name] = (offset, shape)
+        return index
+
+    def _state_entries(self, prefix=""):
+        """States of the blocks and the ports carrying states.
+
+        Returns
+        -------
+        arrays : list of tuple
+            (name, block, key, array) of the block states.
+        ports : list of tuple
+            (name, pending, block_id, port) of the input ports whose
+            pending values are carried to the next call, i.e. the ports
+            fed by a block scheduled after the receiving block.
+        """
+        arrays = []
+        ports = []
+        for i, block in self.blocks.items():
+            name = "{}blocks/{}/".format(prefix, i)
+            if isinstance(block, System):
+                block_arrays, block_ports = block._state_entries(name)
+                arrays += block_arrays
+                ports += block_ports
+            else:
+                for key, array in block._states().items():
+                    arrays.append((name+key, block, key, array))
+        if self._set:
+            for target_id, to_port in self._feedback_ports():
+                name = "{}pending/{}/{}".format(prefix, target_id, to_port)
+                ports.append((name, self._pending, target_id, to_port))
+        return arrays, ports
+
+    def _bind_state_layout(self):
+        """Gather the block states into one buffer per dtype.
+
+        The state arrays of the blocks are replaced by views of the
+        buffers.
+        The layout is rebuilt if the connections changed or if a block
+        notified that it replaced its state arrays, e.g. after a change of
+        the state dimension.
+
+        Returns
+        -------
+        arenas : list of tuple
+            (offset, arena) of the buffers of the block states, in the
+            order they appear in System.get_state.
+        ports : list of tuple
+            (offset, pending, block_id, port, shape) of the pending values.
+        size : int
+            The number of states, see System.get_state.
+        """
+        layout = self._state_layout
+        if layout is not None:
+            version, arenas, ports, size = layout
+            if (version == self._layout_version()
+                    and all(np.shape(pending_dict[i][port]) == shape
+                            for _, pending_dict, i, port, shape in ports)):
+                return arenas, ports, size
+
+        entries, pending_ports = self._state_entries()
+        arenas = []
+        offset = 0
+        states = collections.defaultdict(dict)
+        for dtype, group in _dtype_groups(entries):
+            arena = np.zeros(sum(array.size for *_, array in group),
+                             dtype=dtype)
+            arenas.append((offset, arena))
+            start = offset
+            for name, block, key, array in group:
+                view = arena[offset-start:offset-start+array.size]
+                view = view.reshape(array.shape)
+                view[...] = array
+                states[block][key] = view
+                offset += array.size
+        for block, block_states in states.items():
+            block._bind_states(block_states)
+        ports = []
+        for _, pending_dict, i, port in pending_ports:
+            shape = np.shape(pending_dict[i][port])
+            ports.append((offset, pending_dict, i, port, shape))
+            offset += int(np.prod(shape))
+        self._state_layout = (self._layout_version(), arenas, ports, offset)
+        return arenas, ports, offset
+
+    def _layout_version(self):
+        """Versions of the connections of this and the nested systems."""
+        return (self._graph.version, self._inline) + tuple(
+            block._layout_version() for block in self.blocks.values()
+            if isinstance(block, System))
+
+    def save(self, path, schedule=True):
+        """Save the system to a binary file.
+
+        Parameters
+        ----------
+        path : str or path-like
+            Path of the file.
+            Written in numpy's .npz format, with the arrays uncompressed.
+        schedule : bool, optional
+            Also save the compiled execution schedule.
+            Defaults to True.
+
+        Note
+        ----
+        Blocks are saved with their types, labels, dtypes, parameters,
+        including discretized coefficients, and states.
+        The values pending on feedback connections are saved too, so
+        that the loaded system continues like this one.
+        Nested systems are saved recursively.
+        """
+        with open(path, "wb") as f:
+            np.savez(f, **self._to_arrays(schedule=schedule))
+
+    @classmethod
+    def load(cls, path, mmap_mode=None):
+        """Load a system saved by System.save.
+
+        Parameters
+        ----------
+        path : str or path-like
+            Path of the file.
+        mmap_mode : str or None, optional
+            If not None, memory-map the block parameters with this mode,
+            e.g. "r", see ``numpy.memmap``.
+            States are always loaded into memory.
+            Defaults to None.
+
+        Returns
+        -------
+        System
+            The loaded system.
+
+        Note
+        ----
+        Blocks are reconstructed from the saved coefficients, so
+        transfer functions are not realized or discretized again.
+        """
+        return cls._from_arrays(load_npz(path, mmap_mode=mmap_mode))
+
+    def _to_arrays(self, prefix="", schedule=True):
+        """Arrays representing the system, see System.save."""
+        arrays = {}
+        ids = list(self.blocks)
+        labels = [block.label for block in self.blocks.values()]
+        arrays[prefix+"ninout"] = np.array([self.ninput, self.noutput])
+        arrays[prefix+"dtype"] = np.array(self.dtype.str)
+        arrays[prefix+"dtypes"] = np.array(
+            [block.dtype.str for block in self.blocks.values()], dtype=str)
+        arrays[prefix+"ids"] = np.array(ids, dtype=int)
+        arrays[prefix+"types"] = np.array(
+            ["{}.{}".format(type(block).__module__, type(block).__qualname__)
+             for block in self.blocks.values()], dtype=str)
+        arrays[prefix+"labels"] = np.array(
+            ["" if label is None else str(label) for label in labels],
+            dtype=str)
+        arrays[prefix+"has_label"] = np.array(
+            [label is not None for label in labels], dtype=bool)
+        arrays[prefix+"edges"] = self._graph.edges()
+        if schedule and self._set:
+            _, steps = self._compile()
+            arrays[prefix+"schedule"] = np.array(
+                [step[0] for step in steps], dtype=int)
+        if self._set:
+            for target_id, to_port in self._feedback_ports():
+                value = self._pending[target_id][to_port]
+                if value is not None:
+                    arrays["{}pending/{}/{}".format(
+                        prefix, target_id, to_port)] = np.asarray(value)
+        for i, block in self.blocks.items():
+            block_prefix = "{}blocks/{}/".format(prefix, i)
+            if isinstance(block, System):
+                arrays.update(block._to_arrays(block_prefix, schedule))
+                continue
+            for key, value in block._parameters().items():
+                if value is not None:
+                    arrays[block_prefix+"parameters/"+key] = value
+            for key, value in block._states().items():
+                arrays[block_prefix+"states/"+key] = value
+        return arrays
+
+    @classmethod
+    def _from_arrays(cls, arrays, prefix=""):
+        """Construct a system from System._to_arrays."""
+        nin, nout = arrays[prefix+"ninout"].tolist()
+        sys = cls(nin=nin, nout=nout)
+        ids = arrays[prefix+"ids"].tolist()
+        if prefix+"dtype" in arrays:
+            sys._dtype = np.dtype(str(arrays[prefix+"dtype"]))
+            dtypes = arrays[prefix+"dtypes"].tolist()
+        else:
+            dtypes = [np.float64]*len(ids)
+        types = arrays[prefix+"types"].tolist()
+        labels = arrays[prefix+"labels"].tolist()
+        has_label = arrays[prefix+"has_label"].tolist()
+        block_arrays = _group_block_arrays(arrays, prefix+"blocks/")
+        for i, block_type, label, labeled, dtype in zip(
+                ids, types, labels, has_label, dtypes):
+            block_prefix = "{}blocks/{}/".format(prefix, i)
+            block_cls = _import_block(block_type)
+            label = label if labeled else None
+            if issubclass(block_cls, System):
+                block = block_cls._from_arrays(arrays, block_prefix)
+                block.label = label
+            else:
+                parameters = block_arrays[i]["parameters"]
+                states = block_arrays[i]["states"]
+                block = block_cls._from_parameters(parameters, label=label)
+                if block.dtype != dtype:
+                    block.dtype = dtype
+                block._set_states(states)
+            sys._insert_block(i, block)
+        sys._graph.add_edges(arrays[prefix+"edges"])
+        if prefix+"schedule" in arrays:
+            sys._compile(order=arrays[prefix+"schedule"].tolist())
+        ## values pending on the feedback connections
+        pending_prefix = prefix+"pending/"
+        for key, value in arrays.items():
+            if not key.startswith(pending_prefix):
+                continue
+            target_id, to_port = map(int, key[len(pending_prefix):].split("/"))
+            sys._pending[target_id][to_port] = (
+                value[()] if value.ndim == 0 else np.array(value))
+        return sys
+
+    def _cast(self):
+        """Set the dtype of all blocks, see Block._cast."""
+        for block in self.blocks.values():
+            block.dtype = self.dtype
+        self._state_layout = None
+
     def add_blocks(self, blocks):
         """Add blocks to the system
 
@@ -137,19 +1474,17 @@ class System(Block):
             id_start = last_id + 1
         blocks = to_array(blocks, types=Block)
         new_ids = range(id_start, id_start+len(blocks))
-        out_ports = [[{}]*block.noutput for block in blocks]
-        self.blocks = {**self.blocks,
-                       **dict(zip(new_ids, blocks))}
-        self._ids = {**self._ids,
-                     **dict(zip(blocks, new_ids))}
-        self._succ = {**self._succ,
-                      **dict(zip(new_ids, out_ports))}
-        in_ports = [[{}]*block.ninput for block in blocks]
-        self._pred = {**self._pred,
-                      **dict(zip(new_ids, in_ports))}
-        pending = [[0.]*block.ninput for block in blocks]
-        self._pending = {**self._pending,
-                         **dict(zip(new_ids, pending))}
+        for i, block in zip(new_ids, blocks):
+            self._insert_block(i, block)
+
+    def _insert_block(self, block_id, block):
+        """Insert a block with the given ID into the node table."""
+        self.blocks[block_id] = block
+        self._ids[block] = block_id
+        self._graph.add_node(block_id)
+        self._pending[block_id] = [0.]*block.ninput
+        block._add_owner(self)
+        self._state_layout = None
 
     def add_edge(self, edge_from, edge_to, from_port=0, to_port=0):
         """Add a directed connection from block out_edge to in_edge.
@@ -186,7 +1521,7 @@ class System(Block):
         if from_id == "input":
             nport = self.ninput
         else:
-            nport = self.blocks[from_id].ninput
+            nport = self.blocks[from_id].noutput
         if from_port >= nport:
             raise ValueError("invalid from port {} for id:{}"
                              "".format(from_port, from_id))
@@ -199,18 +1534,16 @@ class System(Block):
                              "".format(from_port, to_id))
 
         ## check if to_port is already connected to others
-        if len(self._pred[to_id][to_port]) > 0:
+        from_node = self._node(from_id)
+        to_node = self._node(to_id)
+        if self._graph.driver(to_node, to_port) >= 0:
             raise ValueError("node {} port {} already connected to another"
                              " node {} port {}, please remove the connection"
                              " before connecting to it."
                              "".format(to_id, to_port, from_id, from_port))
 
         ## add edge
-        target_dict = self._succ[from_id][from_port]
-        self._succ[from_id][from_port] = {**target_dict, **{to_id: to_port}}
-
-        source_dict = self._pred[to_id][to_port]
-        self._pred[to_id][to_port] = {**source_dict, **{from_id: to_port}}
+        self._graph.add_edge(from_node, from_port, to_node, to_port)
 
     def remove_edge(self, edge_from, edge_to, from_port=0, to_port=0):
         """Remove the given edge from the system.
@@ -238,15 +1571,12 @@ class System(Block):
             to_id = self._ids[edge_to]
         else:
             to_id = edge_to
-        del self._succ[from_id][from_port][to_id]
-        del self._pred[to_id][to_port][from_id]
+        self._graph.remove_edge(self._node(from_id), from_port,
+                                self._node(to_id), to_port)
 
     def clear_edges(self):
         """Clear all the connections in the system."""
-        succ = [(i, [{}]*block.noutput) for i, block in self.blocks.items()]
-        self._succ = dict(succ)
-        pred = [(i, [{}]*block.noutput) for i, block in self.blocks.items()]
-        self._pred = dict(pred)
+        self._graph.clear()
 
     def remove_blocks(self, blocks):
         """Remove blocks from the system.
@@ -279,13 +1609,434 @@ class System(Block):
         delete = self.blocks.pop(del_id)
         del self._ids[delete]
         del self._pending[del_id]
+        self._changed.discard(del_id)
+        self._graph.remove_node(del_id)
+        delete._remove_owner(self)
+        self._state_layout = None
+
+    @property
+    def inline(self):
+        """Inline the nested systems into the execution plan."""
+        return self._inline
+
+    @inline.setter
+    def inline(self, inline):
+        """inline.setter"""
+        self._inline = bool(inline)
+
+    @property
+    def event_driven(self):
+        """Only run the pure blocks whose inputs changed.
+
+        Note
+        ----
+        When the system is called sample by sample, the blocks which
+        are not pure, see Block.pure, run every sample.
+        Pure blocks only run if one of their inputs changed since their
+        last run, or if they were modified.
+        The cost of a sample then scales with the number of stateful
+        blocks and of changed signals rather than with the size of the
+        system, which pays off with slowly varying inputs such as
+        setpoints and flags.
+        The outputs are the same as in the normal mode.
+        Values pending on the connections are assumed to only change by
+        calling the system, System.process, System.set_state or
+        System.initialize_steady_state.
+        """
+        return self._event_driven
+
+    @event_driven.setter
+    def event_driven(self, event_driven):
+        """event_driven.setter"""
+        self._event_driven = bool(event_driven)
+        self._dirty = None
+
+    @property
+    def profiling(self):
+        """Record the time spent in each block."""
+        return self._profiling
+
+    @profiling.setter
+    def profiling(self, profiling):
+        """profiling.setter"""
+        self._profiling = bool(profiling)
+
+    def profile(self, reset=False):
+        """Time spent in the blocks and nested systems while profiling.
+
+        Parameters
+        ----------
+        reset : bool, optional
+            Clear the recorded times afterwards.
+            Defaults to False.
+
+        Returns
+        -------
+        dict
+            {name: seconds}, where name is the path of the block or
+            nested system, see System.lookup.
+            The time of a nested system is the total of its blocks.
+        """
+        report = collections.defaultdict(float)
+        for path, seconds in self._profile.items():
+            names = self._path_names(path)
+            for k in range(1, len(names)+1):
+                report["/".join(names[:k])] += seconds
+        if reset:
+            self._profile = {}
+        return dict(report)
+
+    def memory_report(self):
+        """Memory used by the system, its blocks and nested systems.
+
+        Returns
+        -------
+        dict
+            "total": the bytes used in total.
+            "graph": {structure: bytes} of the structures of this system
+            and the nested systems, "graph" for the blocks and
+            connections, "ports" for the pending inputs, "plan" for the
+            execution plans, "states" for the state arenas, see
+            System.get_state, and "other" for the rest.
+            "blocks": {name: bytes} of each block, where name is its
+            path, see System.lookup.
+            "types": {type name: bytes} of the blocks by type.
+
+        Note
+        ----
+        Objects used by several blocks, e.g. shared coefficients, are
+        counted once, with the first block using them.
+        The states bound to the arenas are counted with the arenas.
+        See System.compact to reduce the memory of the blocks.
+        """
+        report = {"graph": collections.defaultdict(int),
+                  "blocks": collections.defaultdict(int),
+                  "types": collections.defaultdict(int)}
+        self._memory(report, set(), [])
+        report = {key: dict(value) for key, value in report.items()}
+        report["total"] = (sum(report["graph"].values())
+                           + sum(report["blocks"].values()))
+        return report
+
+    def _memory(self, report, seen, names):
+        """Add the memory of this system to a report, see
+        System.memory_report."""
+        for group, keys in _MEMORY_GROUPS.items():
+            for key in keys:
+                report["graph"][group] += sizeof(self.__dict__.get(key),
+                                                 seen, skip=(Block,))
+        report["graph"]["other"] += sizeof(self, seen, skip=(Block,))
+        for block_id, block in self.blocks.items():
+            path = names + [str(block_id) if block.label is None
+                            else str(block.label)]
+            if isinstance(block, System):
+                block._memory(report, seen, path)
+                continue
+            size = sizeof(block, seen, skip=(Block,))
+            report["blocks"]["/".join(path)] += size
+            report["types"][type(block).__name__] += size
+
+    def compact(self):
+        """Reduce the memory of the blocks.
+
+        Note
+        ----
+        The blocks with the same coefficients, e.g. copies of a filter,
+        then share one read-only copy of them, and LTI blocks drop their
+        python-control objects, see LTI.keep_control.
+        This applies to the blocks of the nested systems too, see
+        Block._compact and System.memory_report.
+        Blocks added afterwards are not compacted until the next call.
+        """
+        self._compact({})
+
+    def _compact(self, shared):
+        """Compact the blocks and nested systems, see System.compact."""
+        for block in self.blocks.values():
+            block._compact(shared)
+
+    def _record(self, path, start, end):
+        """Record the execution of the block at path.
+
+        Parameters
+        ----------
+        path : tuple
+            Block IDs from this system to the block.
+        start, end : int
+            Start and end times from time.perf_counter_ns.
+        """
+        if self._tracer is not None:
+            name = self._trace_names.get(path)
+            if name is None:
+                name = "/".join(self._path_names(path))
+                self._trace_names[path] = name
+            self._tracer.complete(name, start, end)
+        if not self._profiling:
+            return
+        seconds = (end-start) * 1e-9
+        self._profile[path] = self._profile.get(path, 0.) + seconds
+        if self._meters is not None:
+            blocks = self._meters[3]
+            child = blocks.get(path)
+            if child is None:
+                child = self._metrics.counter(
+                    "sigflow_block_seconds_total",
+                    "Time spent in the blocks while profiling.",
+                    ["system", "block"]).labels(
+                        self._metric_label(), "/".join(self._path_names(path)))
+                blocks[path] = child
+            child.inc(seconds)
+
+    @property
+    def metrics(self):
+        """Registry the execution metrics are recorded in.
+
+        Note
+        ----
+        When set, each call and each chunk of the system updates
+
+        - sigflow_samples_total, the number of samples processed, whose
+          rate is the throughput,
+        - sigflow_step_seconds, a histogram of the duration of the calls
+          and chunks,
+        - sigflow_overruns_total, the number of steps slower than
+          ``deadline`` per sample,
+
+        labelled with the label of the system.
+        While profiling, sigflow_block_seconds_total is also updated
+        with the time spent in each block, labelled with the path of the
+        block, see System.lookup.
+        The labels are taken when the registry is set.
+        """
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, registry):
+        """metrics.setter
+
+        Parameters
+        ----------
+        registry : sigflow.metrics.Registry or None
+            The registry, e.g. sigflow.metrics.registry.
+            None disables the metrics.
+        """
+        self._metrics = registry
+        if registry is None:
+            self._meters = None
+            return
+        label = self._metric_label()
+        self._meters = (
+            registry.counter("sigflow_samples_total",
+                             "Samples processed by the system.",
+                             ["system"]).labels(label),
+            registry.histogram("sigflow_step_seconds",
+                               "Duration of the calls and chunks of the "
+                               "system.", ["system"]).labels(label),
+            registry.counter("sigflow_overruns_total",
+                             "Calls and chunks slower than the deadline.",
+                             ["system"]).labels(label),
+            {})  # counters of the blocks by path
+
+    def _metric_label(self):
+        """Value of the system label of the metrics."""
+        return "system" if self.label is None else str(self.label)
+
+    def _end_step(self, n, start):
+        """Record a step of n samples in the metrics and the tracer."""
+        end = time.perf_counter_ns()
+        if self._meters is not None:
+            self._observe(n, (end-start) * 1e-9)
+        if self._tracer is not None:
+            self._tracer.complete(self._metric_label(), start, end,
+                                  category="system", args={"samples": n})
+
+    @property
+    def tracer(self):
+        """Tracer recording the execution of the blocks and steps.
+
+        Note
+        ----
+        When set, each block execution and each call or chunk of the
+        system is recorded as an event, named by the path of the block,
+        see System.lookup, or the label of the system.
+        See sigflow.tracing.Tracer.
+        """
+        return self._tracer
+
+    @tracer.setter
+    def tracer(self, tracer):
+        """tracer.setter
+
+        Parameters
+        ----------
+        tracer : sigflow.tracing.Tracer or None
+            The tracer.
+            None disables tracing.
+        """
+        self._tracer = tracer
+        self._trace_names = {}
+
+    def _observe(self, n, seconds):
+        """Record a step of n samples in the metrics."""
+        samples, steps, overruns, _ = self._meters
+        samples.inc(n)
+        steps.observe(seconds)
+        if self.deadline is not None and seconds > self.deadline*n:
+            overruns.inc()
+
+    def _path_names(self, path):
+        """Names of the blocks along a path of block IDs."""
+        names = []
+        system = self
+        for block_id in path:
+            block = system.blocks.get(block_id)
+            if block is None or block.label is None:
+                names.append(str(block_id))
+            else:
+                names.append(str(block.label))
+            system = block
+        return names
+
+    def lookup(self, path):
+        """Find a block of this system or of its nested systems.
+
+        Parameters
+        ----------
+        path : str or iterable
+            Labels or IDs of the blocks from this system to the block,
+            e.g. "controller/lti" or ("controller", 0).
+            A string is split at "/".
+
+        Returns
+        -------
+        Block
+            The block.
+
+        Raises
+        ------
+        LookupError
+            If the block doesn't exist or the label is ambiguous.
+        """
+        if isinstance(path, str):
+            path = path.split("/")
+        block = self
+        for name in path:
+            if not isinstance(block, System):
+                raise LookupError("{} is not a system".format(block))
+            block = block._lookup_one(name)
+        return block
+
+    def _lookup_one(self, name):
+        """Block of this system by label or ID."""
+        if isinstance(name, (int, np.integer)):
+            if name not in self.blocks:
+                raise LookupError("ID {:d} doesn't exist in the system"
+                                  "".format(name))
+            return self.blocks[name]
+        matches = [block for block in self.blocks.values()
+                   if block.label == name]
+        if len(matches) > 1:
+            raise LookupError("label {} is ambiguous".format(name))
+        if matches:
+            return matches[0]
+        if name.isdigit() and int(name) in self.blocks:
+            return self.blocks[int(name)]
+        raise LookupError("{} doesn't exist in the system".format(name))
+
+    def _on_block_changed(self, block, states=False):
+        """Called by Block._notify when a block of the system changed.
+
+        Parameters
+        ----------
+        block : Block
+            The changed block.
+        states : bool, optional
+            True if the state arrays of the block were replaced.
+            Defaults to False.
+        """
+        block_id = self._ids.get(block)
+        if block_id is None:
+            return
+        self._changed.add(block_id)
+        if states:
+            self._state_layout = None
+        self._notify(states)
+
+    def _refresh_pending(self):
+        """Reset the pending inputs of changed blocks if ninput changed."""
+        for block_id in self._changed:
+            length = self.blocks[block_id].ninput
+            if len(self._pending[block_id]) != length:
+                self._pending[block_id] = [0.]*length
+        self._changed.clear()
+
+    @staticmethod
+    def _node(block_id):
+        """Node of the adjacency store for block_id, 'input' or 'output'."""
+        if block_id == "input":
+            return INPUT
+        if block_id == "output":
+            return OUTPUT
+        return int(block_id)
+
+    @staticmethod
+    def _key(node):
+        """Inverse of System._node."""
+        if node == INPUT:
+            return "input"
+        if node == OUTPUT:
+            return "output"
+        return node
+
+    def _adjacency(self, reverse=False):
+        """Nested dict view of the connections.
+
+        Parameters
+        ----------
+        reverse : bool, optional
+            Group the connections by the input ports they enter instead
+            of the output ports they leave.
+            Defaults to False.
+
+        Returns
+        -------
+        dict
+            {block_id: [{to_id: to_port}, ...]} for each output port or
+            {block_id: [{from_id: from_port}, ...]} for each input port
+            if reverse.
+        """
+        if reverse:
+            view = {i: [{} for _ in range(block.ninput)]
+                    for i, block in self.blocks.items()}
+            if self.noutput > 0:
+                view["output"] = [{} for _ in range(self.noutput)]
+        else:
+            view = {i: [{} for _ in range(block.noutput)]
+                    for i, block in self.blocks.items()}
+            if self.ninput > 0:
+                view["input"] = [{} for _ in range(self.ninput)]
+        for from_id, from_port, to_id, to_port in self._graph.edges().tolist():
+            from_id = self._key(from_id)
+            to_id = self._key(to_id)
+            if reverse:
+                key, port, value = to_id, to_port, (from_id, from_port)
+            else:
+                key, port, value = from_id, from_port, (to_id, to_port)
+            ports = view.setdefault(key, [])
+            while len(ports) <= port:
+                ports.append({})
+            ports[port][value[0]] = value[1]
+        return view
 
-        for dictionary in [self._succ, self._pred]:
-            del dictionary[del_id]
-            for key in dictionary:
-                for port in range(len(dictionary[key])):
-                    if del_id in dictionary[key][port]:
-                        del dictionary[key][port][del_id]
+    @property
+    def _succ(self):
+        """Successors of each output port, see System._adjacency."""
+        return self._adjacency()
+
+    @property
+    def _pred(self):
+        """Predecessors of each input port, see System._adjacency."""
+        return self._adjacency(reverse=True)
 
     def _check_block_exists(self, block):
         """An internal method to check if block is in the system.
@@ -359,3 +2110,91 @@ class System(Block):
                              "got {} instead".format(self.ninput, len(values)))
         self._inputs = values
 
+
+## attributes of System counted in each group of System.memory_report
+_MEMORY_GROUPS = {"graph": ("blocks", "_ids", "_graph"),
+                  "ports": ("_pending", "_changed"),
+                  "plan": ("_plan", "_flat", "_feedback", "_events",
+                           "_dirty"),
+                  "states": ("_state_layout",)}
+
+
+def _dtype_groups(entries):
+    """Block states grouped by dtype, in the order of System.get_state.
+
+    Parameters
+    ----------
+    entries : list of tuple
+        (name, block, key, array) of the block states, see
+        System._state_entries.
+
+    Returns
+    -------
+    list of tuple
+        (dtype, entries) of each dtype.
+    """
+    groups = collections.defaultdict(list)
+    for entry in entries:
+        groups[entry[3].dtype].append(entry)
+    return list(groups.items())
+
+
+def _chunk_length(values, n):
+    """Number of samples of the port values of a block in a chunk.
+
+    Parameters
+    ----------
+    values : list
+        Values of the input ports, arrays of samples or pending values.
+    n : int
+        Number of samples of the chunk, if no value is an array.
+
+    Returns
+    -------
+    int
+    """
+    lengths = {len(value) for value in values if np.ndim(value) > 0}
+    if len(lengths) > 1:
+        raise ValueError("inputs of a block have different rates: {} "
+                         "samples".format(sorted(lengths)))
+    return lengths.pop() if lengths else n
+
+
+def _differs(old, new):
+    """True if a value sent to a port differs from the one it holds."""
+    if old is new:
+        return False
+    try:
+        return bool(old != new)
+    except (TypeError, ValueError):
+        return not np.array_equal(old, new)
+
+
+def _import_block(name):
+    """Import a Block subclass by its qualified name."""
+    module, _, qualname = name.rpartition(".")
+    obj = importlib.import_module(module)
+    for attr in qualname.split("."):
+        obj = getattr(obj, attr)
+    if not (isinstance(obj, type) and issubclass(obj, Block)):
+        raise TypeError("{} is not a Block".format(name))
+    return obj
+
+
+def _group_block_arrays(arrays, prefix):
+    """Group the parameters and states of the blocks saved under prefix.
+
+    Returns
+    -------
+    dict
+        {block_id: {"parameters": {...}, "states": {...}}}
+    """
+    groups = collections.defaultdict(
+        lambda: {"parameters": {}, "states": {}})
+    for key, value in arrays.items():
+        if not key.startswith(prefix):
+            continue
+        path = key[len(prefix):].split("/")
+        if len(path) == 3 and path[1] in ("parameters", "states"):
+            groups[int(path[0])][path[1]][path[2]] = value
+    return groups
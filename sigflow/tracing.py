@@ -0,0 +1,241 @@
+"""Event tracing of block execution.
+
+Events are recorded in a ring buffer and dumped in the Chrome Trace
+Event format, which can be opened in Perfetto (https://ui.perfetto.dev)
+or chrome://tracing.
+
+.. code-block:: python
+
+   from sigflow.tracing import Tracer
+
+   tracer = Tracer()
+   system.tracer = tracer
+   with tracer:  # also trace the garbage collector
+       system.process(inputs)
+   tracer.dump("trace.json")
+"""
+import gc
+import json
+import os
+import threading
+import time
+
+
+__all__ = ["Tracer"]
+
+
+class Tracer:
+    """Recorder of timed events in a preallocated ring buffer.
+
+    Parameters
+    ----------
+    capacity : int, optional
+        Number of events kept.
+        Older events are overwritten.
+        Defaults to 65536.
+
+    Attributes
+    ----------
+    dropped : int
+        Number of events overwritten.
+
+    Note
+    ----
+    Each event is recorded as a Chrome Trace "complete" event, i.e.
+    with its start and duration, so a block execution costs one event.
+    Tracer.instant records an "instant" event, scoped to its thread.
+    Times are from time.perf_counter_ns.
+    Recording is not locked; events of different threads may rarely
+    overwrite each other once the buffer wraps around.
+    """
+    def __init__(self, capacity=65536):
+        """Constructor
+
+        Parameters
+        ----------
+        capacity : int, optional
+            Number of events kept.
+            Older events are overwritten.
+            Defaults to 65536.
+        """
+        capacity = int(capacity)
+        if capacity < 1:
+            raise ValueError("capacity must be a positive integer.")
+        self.capacity = capacity
+        self._events = [None] * capacity
+        self._next = 0
+        self._count = 0
+        self._gc_start = None
+        self._tracing_gc = False
+
+    @property
+    def dropped(self):
+        """Number of events overwritten."""
+        return max(self._count - self.capacity, 0)
+
+    def complete(self, name, start, end, category="block", args=None):
+        """Record an event that already ended.
+
+        Parameters
+        ----------
+        name : str
+            Name of the event.
+        start : int
+            Start time from time.perf_counter_ns.
+        end : int
+            End time from time.perf_counter_ns.
+        category : str, optional
+            Category of the event.
+            Defaults to "block".
+        args : dict, optional
+            Arguments shown with the event.
+            Defaults to None.
+        """
+        i = self._next
+        self._events[i] = (name, category, start, end-start,
+                           threading.get_ident(), args)
+        self._next = i+1 if i+1 < self.capacity else 0
+        self._count += 1
+
+    def instant(self, name, category="mark", args=None):
+        """Record an instant event now.
+
+        Parameters
+        ----------
+        name : str
+            Name of the event.
+        category : str, optional
+            Category of the event.
+            Defaults to "mark".
+        args : dict, optional
+            Arguments shown with the event.
+            Defaults to None.
+        """
+        i = self._next
+        self._events[i] = (name, category, time.perf_counter_ns(), None,
+                           threading.get_ident(), args)
+        self._next = i+1 if i+1 < self.capacity else 0
+        self._count += 1
+
+    def span(self, name, category="span", args=None):
+        """Context manager recording the time spent in its body.
+
+        Parameters
+        ----------
+        name : str
+            Name of the event.
+        category : str, optional
+            Category of the event.
+            Defaults to "span".
+        args : dict, optional
+            Arguments shown with the event.
+            Defaults to None.
+        """
+        return _Span(self, name, category, args)
+
+    def start(self):
+        """Start recording the garbage collections."""
+        if not self._tracing_gc:
+            gc.callbacks.append(self._on_gc)
+            self._tracing_gc = True
+
+    def stop(self):
+        """Stop recording the garbage collections."""
+        if self._tracing_gc:
+            gc.callbacks.remove(self._on_gc)
+            self._tracing_gc = False
+            self._gc_start = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _on_gc(self, phase, info):
+        """gc.callbacks callback"""
+        now = time.perf_counter_ns()
+        if phase == "start":
+            self._gc_start = now
+        elif self._gc_start is not None:
+            self.complete("gc", self._gc_start, now, category="gc",
+                          args={"generation": info.get("generation"),
+                                "collected": info.get("collected")})
+            self._gc_start = None
+
+    def clear(self):
+        """Remove all events."""
+        self._events = [None] * self.capacity
+        self._next = 0
+        self._count = 0
+
+    def events(self):
+        """Recorded events in the Chrome Trace Event format.
+
+        Returns
+        -------
+        list of dict
+            The events, oldest first.
+            Times are in microseconds.
+        """
+        if self._count > self.capacity:
+            records = self._events[self._next:] + self._events[:self._next]
+        else:
+            records = self._events[:self._next]
+        pid = os.getpid()
+        events = []
+        for name, category, start, duration, tid, args in records:
+            if duration is None:
+                event = {"name": name, "cat": category, "ph": "i",
+                         "ts": start / 1e3, "s": "t", "pid": pid,
+                         "tid": tid}
+            else:
+                event = {"name": name, "cat": category, "ph": "X",
+                         "ts": start / 1e3, "dur": duration / 1e3,
+                         "pid": pid, "tid": tid}
+            if args:
+                event["args"] = args
+            events.append(event)
+        return events
+
+    def to_json(self):
+        """Recorded events as a Chrome Trace Event JSON document.
+
+        Returns
+        -------
+        dict
+            The document, see json.dump.
+        """
+        return {"traceEvents": self.events(), "displayTimeUnit": "ns",
+                "otherData": {"dropped": self.dropped}}
+
+    def dump(self, path):
+        """Write the recorded events to a JSON file.
+
+        Parameters
+        ----------
+        path : str or path-like
+            Path of the file.
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f)
+
+
+class _Span:
+    """Context manager of Tracer.span."""
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.start, time.perf_counter_ns(),
+                             self.category, self.args)
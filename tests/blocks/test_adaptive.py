@@ -0,0 +1,100 @@
+"""Tests for sigflow.blocks.adaptive
+"""
+import numpy as np
+import pytest
+import scipy.signal
+
+import sigflow
+
+
+def _noise_cancellation(n, taps, seed=0):
+    """Two references through unknown filters into the desired signal"""
+    rng = np.random.default_rng(seed)
+    references = rng.normal(size=(2, n))
+    references[1] = scipy.signal.lfilter([1.], [1., -0.8], references[1])
+    filters = rng.normal(size=(2, taps)) * np.exp(-np.arange(taps)/(taps/5))
+    desired = sum(np.convolve(references[i], filters[i])[:n]
+                  for i in range(2))
+    desired += 1e-3*rng.normal(size=n)
+    return np.vstack([references, desired]), filters
+
+
+def _chunked(block, inputs, sizes):
+    """Outputs for chunks of sizes, calling the block for single samples"""
+    outputs = []
+    start = 0
+    for size in sizes:
+        chunk = inputs[:, start:start+size]
+        if size == 1:
+            outputs.append(block(chunk[:, 0])[:, np.newaxis])
+        else:
+            outputs.append(block.process(chunk))
+        start += size
+    return np.concatenate(outputs, axis=1)
+
+
+def test_nlms():
+    """test per sample and chunked NLMS identifying two filters"""
+    inputs, filters = _noise_cancellation(4000, 16)
+    nlms = sigflow.NLMS(16, nreference=2)
+    sizes = [5, 1, 1, 1000, 1, 2992]
+    outputs = _chunked(nlms, inputs, sizes)
+    reference = sigflow.NLMS(16, nreference=2)
+    expected = np.transpose([reference(u) for u in inputs.T])
+    np.testing.assert_allclose(outputs, expected, rtol=1e-9, atol=1e-12)
+    np.testing.assert_allclose(outputs[0] + outputs[1], inputs[2])
+    np.testing.assert_allclose(nlms.weights, filters, atol=1e-3)
+    assert np.std(outputs[0, -500:]) < 2e-3
+
+
+@pytest.mark.parametrize("taps, partition", [[200, 32], [64, 64],
+                                             [10, 16]])
+def test_partitioned_block_lms(taps, partition):
+    """test per sample and chunked block LMS, and its convergence"""
+    inputs, filters = _noise_cancellation(20000, taps)
+    block_lms = sigflow.PartitionedBlockLMS(taps, partition, nreference=2,
+                                            step=1.)
+    sizes = [5, 1, 1, 1000, 1, 19 + partition, 2, 18971 - partition]
+    outputs = _chunked(block_lms, inputs, sizes)
+    reference = sigflow.PartitionedBlockLMS(taps, partition, nreference=2,
+                                            step=1.)
+    expected = np.concatenate([reference(u)[:, np.newaxis]
+                               for u in inputs[:, :3000].T] +
+                              [reference.process(inputs[:, 3000:])], axis=1)
+    np.testing.assert_allclose(outputs, expected, rtol=1e-7, atol=1e-9)
+    np.testing.assert_allclose(outputs[0] + outputs[1], inputs[2])
+    np.testing.assert_allclose(block_lms.weights, filters, atol=2e-3)
+    assert np.std(outputs[0, -1000:]) < 0.01*np.std(inputs[2])
+
+    ## no latency, the estimate is the convolution with the weights
+    block_lms.step = 0
+    block_lms.weights = filters
+    outputs = _chunked(block_lms, inputs[:, :500], [3, 1, 100, 396])
+    expected = sum(np.convolve(inputs[i, :500], filters[i])[:500]
+                   for i in range(2))
+    np.testing.assert_allclose(outputs[1, taps:], expected[taps:],
+                               atol=1e-9)
+
+
+def test_adaptive_system(tmp_path):
+    """test saving and loading adaptive filters in a system"""
+    inputs, _ = _noise_cancellation(1000, 40)
+    blocks = [sigflow.NLMS(8, nreference=2),
+              sigflow.PartitionedBlockLMS(40, 16, nreference=2)]
+    sys = sigflow.System(blocks, nin=3, nout=2)
+    for i in range(2):
+        for port in range(3):
+            sys.add_edge("input", i, port, port)
+        sys.add_edge(i, "output", 0, i)
+    sys.process(inputs[:, :501])
+    sys.save(tmp_path / "adaptive.npz")
+    loaded = sigflow.System.load(tmp_path / "adaptive.npz")
+    np.testing.assert_array_equal(loaded.get_state(), sys.get_state())
+    np.testing.assert_allclose(loaded.process(inputs[:, 501:]),
+                               sys.process(inputs[:, 501:]))
+    np.testing.assert_allclose(loaded.blocks[1].weights, blocks[1].weights)
+
+    with pytest.raises(ValueError):
+        sigflow.NLMS(0)
+    with pytest.raises(ValueError):
+        sigflow.PartitionedBlockLMS(10, forgetting=1.)
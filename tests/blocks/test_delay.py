@@ -0,0 +1,87 @@
+"""Tests for sigflow.blocks.delay
+"""
+import numpy as np
+import pytest
+
+import sigflow
+
+
+@pytest.mark.parametrize("interpolation, order, delay",
+                         [["lagrange", 3, 0.], ["lagrange", 3, 2.3],
+                          ["lagrange", 4, 250.6], ["lagrange", 0, 7.7],
+                          ["thiran", 3, 2.3], ["thiran", 5, 1000.25]])
+def test_delay_line(interpolation, order, delay):
+    """test DelayLine per sample and chunked evaluation"""
+    fs = 1000
+    t = np.arange(3000)
+    x = np.sin(2*np.pi*0.01*t) + np.cos(2*np.pi*0.003*t)
+    delay_line = sigflow.DelayLine(delay/fs, dt=1/fs, order=order,
+                                   interpolation=interpolation)
+    ## chunks shorter and longer than the delay, and single samples
+    sizes = [64, 1, 100, 7, 1500, 1, 1, 1326]
+    y = []
+    start = 0
+    for size in sizes:
+        chunk = x[start:start+size]
+        if size == 1:
+            y.append([delay_line(chunk[0])])
+        else:
+            y.append(delay_line.process(chunk)[0])
+        start += size
+    y = np.concatenate(y)
+
+    expected = delay_line.process(np.zeros(0))
+    assert expected.shape == (1, 0)
+    reference = sigflow.DelayLine(delay/fs, dt=1/fs, order=order,
+                                  interpolation=interpolation)
+    np.testing.assert_allclose(y, [reference(x_i) for x_i in x],
+                               rtol=1e-12, atol=1e-12)
+    ## fractional delays are interpolated
+    settled = t >= delay + 100
+    exact = (np.sin(2*np.pi*0.01*(t-delay))
+             + np.cos(2*np.pi*0.003*(t-delay)))
+    tolerance = 0.05 if order == 0 else 1e-5
+    np.testing.assert_allclose(y[settled], exact[settled], atol=tolerance)
+
+    ## the response of the implemented filter
+    freqs = np.array([1., 10., 100.])
+    response = delay_line.frequency_response(freqs)[:, 0, 0]
+    expected = np.exp(-2j*np.pi*freqs*delay/fs)
+    np.testing.assert_allclose(response[:2], expected[:2], atol=tolerance)
+    if interpolation == "thiran":
+        np.testing.assert_allclose(np.abs(response), 1)
+
+
+def test_delay_line_changes(tmp_path):
+    """test changing the delay, steady state and saving"""
+    delay_line = sigflow.DelayLine(0.5, dt=0.1, max_delay=2.)
+    assert delay_line.latency == 4
+    x = np.arange(1., 31.)
+    delay_line.process(x)
+    ## the buffer is kept up to max_delay
+    delay_line.delay = 1.5
+    assert delay_line.latency == 14
+    np.testing.assert_allclose(delay_line.process(x[:3])[0], x[-15:-12])
+    ## and grows beyond it
+    delay_line.delay = 3.
+    np.testing.assert_allclose(delay_line.process(np.tile(x, 2))[0, 30:],
+                               x)
+
+    with pytest.raises(ValueError):
+        sigflow.DelayLine(0.1, dt=0.1, order=3, interpolation="thiran")
+    with pytest.raises(ValueError):
+        sigflow.DelayLine(0.1, dt=0.1, interpolation="linear")
+    with pytest.raises(ValueError):
+        delay_line.delay = -1.
+
+    thiran = sigflow.DelayLine(0.55, dt=0.1, interpolation="thiran")
+    np.testing.assert_allclose(thiran.initialize_steady_state(2.), 2.)
+    np.testing.assert_allclose(thiran.process(np.full(20, 2.)), 2.)
+
+    sys = sigflow.System([thiran], nin=1, nout=1)
+    sys.add_edge("input", 0)
+    sys.add_edge(0, "output")
+    sys.save(tmp_path / "delay.npz")
+    loaded = sigflow.System.load(tmp_path / "delay.npz")
+    np.testing.assert_array_equal(loaded.get_state(), sys.get_state())
+    np.testing.assert_array_equal(loaded.process(x), sys.process(x))
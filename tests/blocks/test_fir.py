@@ -0,0 +1,81 @@
+"""Tests for sigflow.blocks.fir
+"""
+import numpy as np
+import pytest
+
+import sigflow
+
+
+@pytest.mark.parametrize("n_taps, partition",
+                         [[16, None], [300, None], [300, 32], [300, 300],
+                          [1000, 64]])
+def test_fir(n_taps, partition):
+    """test FIR per sample and chunked evaluation"""
+    rng = np.random.default_rng(0)
+    taps = rng.normal(size=n_taps)
+    x = rng.normal(size=3000)
+    expected = np.convolve(x, taps)[:len(x)]
+
+    fir = sigflow.FIR(taps, partition=partition)
+    ## chunks of various sizes, aligned and not aligned with the partition,
+    ## and single samples in between.
+    sizes = [64, 64, 64, 1, 100, 1000, 7, 128, 256]
+    y = []
+    start = 0
+    for size in sizes:
+        chunk = x[start:start+size]
+        if size == 1:
+            y.append([fir(chunk[0])])
+        else:
+            y.append(fir.process(chunk)[0])
+        start += size
+    y.append(fir.process(x[start:])[0])
+    np.testing.assert_allclose(np.concatenate(y), expected, atol=1e-9)
+
+
+def test_fir_invalid():
+    with pytest.raises(ValueError):
+        sigflow.FIR([])
+    with pytest.raises(ValueError):
+        sigflow.FIR(np.ones(10), partition=0)
+
+
+def test_fir_system():
+    """FIR in a System, chunked and sample by sample."""
+    rng = np.random.default_rng(1)
+    taps = rng.normal(size=200)
+    x = rng.normal(size=(1, 1000))
+    def build():
+        fir = sigflow.FIR(taps, partition=50)
+        gain = sigflow.Matrix(np.array([[2.]]))
+        sys = sigflow.System([fir, gain], nin=1, nout=1)
+        sys.add_edge("input", fir)
+        sys.add_edge(fir, gain)
+        sys.add_edge(gain, "output")
+        return sys
+    expected = 2*np.convolve(x[0], taps)[:x.shape[1]]
+
+    sys = build()
+    y = np.concatenate([sys.process(x[:, :500]), sys.process(x[:, 500:])],
+                       axis=1)
+    np.testing.assert_allclose(y[0], expected, atol=1e-9)
+
+    sys = build()
+    y = [sys(x_k)[0] for x_k in x[0]]
+    np.testing.assert_allclose(y, expected, atol=1e-9)
+
+
+def test_fir_frequency_response(tmp_path):
+    """FIR frequency response and its sampling time saved"""
+    taps = np.random.default_rng(2).normal(size=30)
+    fir = sigflow.FIR(taps, dt=1/100)
+    freqs = np.linspace(0, 50, 11)
+    expected = np.exp(-2j*np.pi*np.outer(freqs, np.arange(30))/100) @ taps
+    np.testing.assert_allclose(fir.frequency_response(freqs)[:, 0, 0],
+                               expected, rtol=1e-10)
+
+    sys = sigflow.System([fir])
+    sys.save(tmp_path / "fir.npz")
+    assert sigflow.System.load(tmp_path / "fir.npz").blocks[0].dt == 1/100
+    with pytest.raises(ValueError):
+        sigflow.FIR(taps).frequency_response(freqs)
@@ -0,0 +1,111 @@
+"""Tests for sigflow.blocks.kalman
+"""
+import control
+import numpy as np
+import pytest
+
+import sigflow
+
+
+A = np.array([[1., 0.1], [-0.2, 0.9]])
+B = np.array([[0.], [0.1]])
+C = np.array([[1., 0.], [0.5, 1.]])
+D = np.array([[0.], [0.2]])
+Q = np.diag([1e-3, 1e-2])
+R = np.diag([0.1, 0.2])
+
+
+def _simulate(n, seed=0):
+    """Inputs and noisy measurements of the model"""
+    rng = np.random.default_rng(seed)
+    u = np.sin(0.05*np.arange(n))
+    x = np.zeros(2)
+    y = np.empty((2, n))
+    for k in range(n):
+        y[:, k] = C @ x + D[:, 0]*u[k] + rng.multivariate_normal([0, 0], R)
+        x = A @ x + B[:, 0]*u[k] + rng.multivariate_normal([0, 0], Q)
+    return np.vstack([u, y])
+
+
+def _reference(signals, covariance, steady_state):
+    """Textbook Kalman filter"""
+    x = np.zeros(2)
+    P = covariance
+    estimates = []
+    for u, *y in signals.T:
+        K = P @ C.T @ np.linalg.inv(C @ P @ C.T + R)
+        x = x + K @ (y - C @ x - D[:, 0]*u)
+        estimates.append(x)
+        x = A @ x + B[:, 0]*u
+        if not steady_state:
+            P = A @ (P - K @ C @ P) @ A.T + Q
+    return np.transpose(estimates)
+
+
+@pytest.mark.parametrize("steady_state", [True, False])
+def test_kalman_filter(steady_state):
+    """test per sample and chunked estimates against the textbook filter"""
+    signals = _simulate(1000)
+    P0 = np.identity(2)
+    kalman = sigflow.KalmanFilter(control.ss(A, B, C, D, True), Q, R,
+                                  steady_state=steady_state, covariance=P0)
+    assert (kalman.ninput, kalman.noutput) == (3, 2)
+    outputs = [kalman.process(signals[:, :300])]
+    outputs += [kalman(signals[:, k])[:, np.newaxis] for k in range(300, 310)]
+    outputs += [kalman.process(signals[:, 310:])]
+    outputs = np.concatenate(outputs, axis=1)
+
+    steady = kalman.covariance
+    expected = _reference(signals, steady if steady_state else P0,
+                          steady_state)
+    np.testing.assert_allclose(outputs, expected, rtol=1e-9, atol=1e-9)
+    ## the covariance converges to the solution of the Riccati equation
+    if not steady_state:
+        kalman.steady_state = True
+        steady = kalman.covariance
+        kalman.steady_state = False
+        kalman.process(signals)
+    gain = steady @ C.T @ np.linalg.inv(C @ steady @ C.T + R)
+    np.testing.assert_allclose(steady, A @ (steady - gain @ C @ steady) @ A.T
+                               + Q, rtol=1e-9)
+    np.testing.assert_allclose(kalman.covariance, steady, rtol=1e-6)
+
+
+def test_kalman_filter_batch(tmp_path):
+    """test a batch of estimators, steady state and saving"""
+    signals = np.vstack([_simulate(500, seed) for seed in range(3)])
+    batch = sigflow.KalmanFilter((A, B, C, D), Q, R, nbatch=3)
+    outputs = batch.process(signals)
+    for i in range(3):
+        single = sigflow.KalmanFilter((A, B, C, D), Q, R)
+        np.testing.assert_allclose(outputs[2*i:2*i+2],
+                                   single.process(signals[3*i:3*i+3]),
+                                   rtol=1e-12, atol=1e-12)
+
+    ## constant measurements of the equilibrium of a constant input
+    x = np.linalg.solve(np.identity(2) - A, B[:, 0])
+    constant = np.tile([1., *(C @ x + D[:, 0])], 3)
+    np.testing.assert_allclose(batch.initialize_steady_state(constant),
+                               np.tile(x, 3), atol=1e-12)
+    np.testing.assert_allclose(
+        batch.process(np.repeat(constant[:, np.newaxis], 5, axis=1)),
+        np.tile(x, (5, 3)).T, atol=1e-12)
+
+    batch.steady_state = False
+    batch.update_model(Q=Q*10)
+    sys = sigflow.System([batch], nin=9, nout=6)
+    for i in range(9):
+        sys.add_edge("input", 0, i, i)
+    for i in range(6):
+        sys.add_edge(0, "output", i, i)
+    sys.process(signals[:, :20])
+    sys.save(tmp_path / "kalman.npz")
+    loaded = sigflow.System.load(tmp_path / "kalman.npz")
+    np.testing.assert_array_equal(loaded.get_state(), sys.get_state())
+    np.testing.assert_allclose(loaded.process(signals[:, 20:]),
+                               sys.process(signals[:, 20:]), rtol=1e-12)
+
+    with pytest.raises(ValueError):
+        sigflow.KalmanFilter(control.ss(A, B, C, D), Q, R)
+    with pytest.raises(ValueError):
+        batch.update_model(A=np.identity(3))
@@ -1,5 +1,6 @@
 import control
 import numpy as np
+import pytest
 
 import sigflow
 
@@ -39,3 +40,120 @@ def test_lti():
         sigflow_tf.input = u[i]
         yd[i] = sigflow_tf.output
     #TODO How to check if the output is expected??
+
+
+def test_lti_forced_response():
+    """LTI output matches control.forced_response"""
+    np.random.seed(123)
+    tf = control.ss2tf(control.rss(5, 1, 1, strictly_proper=True))
+    dt = 1/128
+    u = np.random.normal(0, 1, 256)
+    ## The input before the first sample is zero.
+    t = np.arange(len(u)+1) * dt
+    _, expected = control.forced_response(tf, T=t, U=np.append(0, u))
+    lti = sigflow.blocks.LTI(tf=tf, dt=dt)
+    actual = [lti(u_i) for u_i in u]
+    np.testing.assert_allclose(actual, expected[1:], rtol=1e-8, atol=1e-12)
+
+
+def test_lti_steady_state():
+    """LTI starts settled after initialize_steady_state"""
+    np.random.seed(123)
+    tf = control.ss2tf(control.rss(4, 1, 1))
+    lti = sigflow.blocks.LTI(tf=tf, dt=1/128)
+    y0 = lti.initialize_steady_state(3.)
+    np.testing.assert_allclose(y0, 3*control.dcgain(tf), rtol=1e-8)
+    np.testing.assert_allclose([lti(3.) for _ in range(50)], y0[0],
+                               rtol=1e-10)
+
+
+def test_lti_realization(tmp_path):
+    """The realizations give the same outputs"""
+    s = control.tf("s")
+    tf = (1/(s+1) * 100/(s**2+2*s+100) * (s+3)/(s+5)
+          * 400/(s**2+4*s+400))
+    u = np.random.default_rng(0).normal(size=600)
+    companion = sigflow.blocks.LTI(tf=tf, dt=1/256)
+    expected = [companion(u_i) for u_i in u]
+    for realization in ["modal", "balanced"]:
+        lti = sigflow.blocks.LTI(tf=tf, dt=1/256, realization=realization)
+        assert lti.realization == realization
+        np.testing.assert_allclose([lti(u_i) for u_i in u], expected,
+                                   rtol=1e-9, atol=1e-12)
+
+    ## static gains have no states in any realization
+    for realization in ["modal", "balanced"]:
+        lti = sigflow.blocks.LTI(tf=control.tf([2], [1]), dt=1/256,
+                                 realization=realization)
+        assert lti._a.shape == (0, 0)
+        np.testing.assert_allclose(lti.process(u[:10])[0], 2*u[:10])
+        assert lti(u[0]) == 2*u[0]
+
+    ## modal chunks leave the states as sample by sample calls
+    lti = sigflow.blocks.LTI(tf=tf, dt=1/256, realization="modal")
+    outputs = np.concatenate([lti.process(u[:300]), lti.process(u[300:301]),
+                              [[lti(u_i) for u_i in u[301:400]]],
+                              lti.process(u[400:])], axis=1)
+    np.testing.assert_allclose(outputs[0], expected, rtol=1e-9, atol=1e-12)
+
+    ## high orders are banded and stay accurate
+    tf = control.tf([1], [1])
+    for w in np.geomspace(1, 100, 34):
+        tf *= control.tf([w**2], [1, 0.1*w, w**2])
+    lti = sigflow.blocks.LTI(tf=tf, dt=1/1024, realization="modal")
+    assert lti._banded is not None
+    chunked = sigflow.blocks.LTI(tf=tf, dt=1/1024, realization="modal")
+    np.testing.assert_allclose(chunked.process(u)[0],
+                               [lti(u_i) for u_i in u], rtol=1e-9,
+                               atol=1e-12)
+
+    with pytest.raises(ValueError):
+        sigflow.blocks.LTI(tf=tf, dt=1/1024, realization="diagonal")
+    with pytest.raises(ValueError):
+        sigflow.blocks.LTI(tf=1/(s+1)**2, dt=1/1024, realization="modal")
+
+    ## switching realizations resets the states
+    lti.realization = "balanced"
+    assert not np.any(lti._state_vector)
+
+    ## the realization is saved
+    sys = sigflow.System([chunked], nin=1, nout=1)
+    sys.add_edge("input", 0)
+    sys.add_edge(0, "output")
+    sys.save(tmp_path / "modal.npz")
+    loaded = sigflow.System.load(tmp_path / "modal.npz")
+    assert loaded.blocks[0].realization == "modal"
+    np.testing.assert_allclose(loaded.process(u)[0], sys.process(u)[0],
+                               rtol=1e-12)
+
+
+def test_lti_variable_steps():
+    """Time steps give the same outputs as a finer regular sampling"""
+    np.random.seed(123)
+    tf = control.ss2tf(control.rss(4, 1, 1))
+    dt = 1/128
+    regular = sigflow.blocks.LTI(tf=tf, dt=dt)
+    lti = sigflow.blocks.LTI(tf=tf, dt=dt)
+    steps = np.random.randint(1, 4, size=200)
+    u = np.random.normal(size=len(steps))
+    ## the input is linearly interpolated within longer steps
+    times = np.cumsum(steps)
+    fine = np.interp(np.arange(1, times[-1]+1), np.append(0, times),
+                     np.append(0, u))
+    expected = regular.process(fine)[0, times-1]
+    np.testing.assert_allclose(lti.process(u[:50], dt=steps[:50]*dt)[0],
+                               expected[:50], rtol=1e-9, atol=1e-12)
+    ## a step is computed once and the least recently used is dropped
+    lti.dt_cache_size = 2
+    assert len(lti._propagators) == 2
+    np.testing.assert_allclose(lti.process(u[50:], dt=steps[50:]*dt)[0],
+                               expected[50:], rtol=1e-9, atol=1e-12)
+    assert len(lti._propagators) == 2
+
+    ## a constant step matches the sampling time
+    np.testing.assert_allclose(lti.process(u, dt=dt),
+                               regular.process(u), rtol=1e-9, atol=1e-12)
+    with pytest.raises(ValueError):
+        lti.process(u, dt=-dt)
+    with pytest.raises(ValueError):
+        lti.dt_resolution = 0
@@ -0,0 +1,128 @@
+"""Tests for sigflow.blocks.resample
+"""
+import fractions
+
+import numpy as np
+import pytest
+import scipy.signal
+
+import sigflow
+from sigflow.system import pipeline
+
+
+@pytest.mark.parametrize("rate_in, rate_out",
+                         [[65536, 16384], [16384, 2048], [2048, 65536],
+                          [3, 2], [2, 3], [7, 7]])
+def test_resampler(rate_in, rate_out):
+    """test chunked resampling against scipy.signal.upfirdn"""
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=2000)
+    block = sigflow.Resampler(rate_out, rate_in)
+    assert block.rate == fractions.Fraction(rate_out, rate_in)
+    expected = scipy.signal.upfirdn(block.taps, x, block.up, block.down)
+
+    ## chunks of various sizes and single samples in between
+    sizes = [5, 1, 1, 64, 1, 0, 300, 3, 1000]
+    y = []
+    start = 0
+    for size in sizes:
+        y.append(block.process(x[start:start+size])[0])
+        start += size
+    y.append(block.process(x[start:])[0])
+    y = np.concatenate(y)
+    ## the outputs whose latest input was received
+    m = -(-len(x)*block.up // block.down)
+    assert len(y) == m
+    np.testing.assert_allclose(y, expected[:m], atol=1e-12)
+
+
+def test_resampler_filter():
+    """test the default filter and explicit taps"""
+    rng = np.random.default_rng(1)
+    x = rng.normal(size=600)
+    block = sigflow.Resampler(4, 6)
+    assert (block.up, block.down) == (2, 3)
+    y = block.process(x)[0]
+    assert len(y) == 400
+    np.testing.assert_allclose(
+        y, scipy.signal.upfirdn(block.taps, x, 2, 3)[:400], atol=1e-12)
+
+    taps = rng.normal(size=5)
+    block = sigflow.Resampler(3, 1, taps=taps)
+    np.testing.assert_allclose(block.process(x)[0],
+                               scipy.signal.upfirdn(taps, x, 3)[:1800],
+                               atol=1e-12)
+    ## constant inputs give the DC gain of each phase
+    np.testing.assert_allclose(block.initialize_steady_state(2.),
+                               [2*(taps[0]+taps[3])])
+    np.testing.assert_allclose(block.process(2*np.ones(3))[0],
+                               2*np.tile([taps[0]+taps[3], taps[1]+taps[4],
+                                          taps[2]], 3))
+
+    with pytest.raises(ValueError):
+        sigflow.Resampler(0, 2)
+    with pytest.raises(ValueError):
+        sigflow.Resampler(2, 3, taps=[])
+
+
+def test_resampler_system(tmp_path):
+    """test blocks after a resampler running at the output rate"""
+    rng = np.random.default_rng(2)
+    x = rng.normal(size=4000)
+    resampler = sigflow.Resampler(1, 4)
+    taps = rng.normal(size=20)
+    fir = sigflow.FIR(taps)
+    sys = sigflow.System([resampler, fir], nin=1, nout=2)
+    sys.add_edge("input", 0)
+    sys.add_edge(0, 1)
+    sys.add_edge(1, "output", 0, 0)
+    sys.add_edge(0, "output", 0, 1)
+
+    outputs = sys.process(x[:1001])
+    assert outputs.shape == (2, 251)
+    sys.save(tmp_path / "resampler.npz")
+    loaded = sigflow.System.load(tmp_path / "resampler.npz")
+    np.testing.assert_array_equal(loaded.get_state(), sys.get_state())
+    np.testing.assert_allclose(loaded.process(x[1001:]),
+                               sys.process(x[1001:]))
+    sys.set_state(loaded.get_state())
+
+    expected = scipy.signal.upfirdn(resampler.taps, x, 1, 4)[:1000]
+    np.testing.assert_allclose(outputs[1], expected[:251], atol=1e-12)
+    np.testing.assert_allclose(outputs[0],
+                               np.convolve(expected, taps)[:251], atol=1e-12)
+
+    ## outputs at different rates
+    sys.remove_edge(0, "output", 0, 1)
+    sys.add_edge("input", "output", 0, 1)
+    outputs = sys.process(x[:10])
+    assert [len(output) for output in outputs] == [3, 10]
+    np.testing.assert_array_equal(outputs[1], x[:10])
+    ## the type of the outputs does not depend on the chunk
+    for size in [1, 1, 4, 0]:
+        outputs = sys.process(x[:size])
+        assert isinstance(outputs, list)
+        assert len(outputs[1]) == size
+
+    ## inputs of a block at different rates
+    adder = sigflow.System([resampler, sigflow.Matrix([[1., 1.]])],
+                           nin=1, nout=1)
+    adder.add_edge("input", 0)
+    adder.add_edge(0, 1, 0, 0)
+    adder.add_edge("input", 1, 0, 1)
+    adder.add_edge(1, "output")
+    with pytest.raises(ValueError, match="different rates"):
+        adder.process(x[:1])
+
+    ## blocks changing the rate only process chunks
+    with pytest.raises(ValueError):
+        sys(x[:1])
+    with pytest.raises(ValueError):
+        resampler(x[:1])
+    sys.event_driven = True
+    with pytest.raises(ValueError):
+        sys(x[:1])
+    with pytest.raises(ValueError):
+        pipeline.ThreadPipeline(sys, stages=[[0], [1]], chunk=8)
+    with pytest.raises(ValueError):
+        pipeline.Pipeline(sys, stages=[[0], [1]], chunk=8)
@@ -0,0 +1,100 @@
+"""Tests for sigflow.blocks.spectrum
+"""
+import numpy as np
+import pytest
+import scipy.signal
+
+import sigflow
+
+
+def _signals(n=5000):
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(2, n))
+    x[1] += 0.5*np.roll(x[0], 3) + np.sin(2*np.pi*0.1*np.arange(n))
+    return x
+
+
+@pytest.mark.parametrize("nperseg, noverlap, window",
+                         [[256, None, "hann"], [100, 75, "hamming"],
+                          [64, 0, "boxcar"]])
+def test_spectrum_probe(nperseg, noverlap, window):
+    """test chunked and per sample estimates against scipy.signal.csd"""
+    x = _signals()
+    probe = sigflow.SpectrumProbe(dt=0.01, nperseg=nperseg,
+                                  noverlap=noverlap, window=window, ninput=2)
+    ## chunks shorter and longer than a segment, and single samples
+    sizes = [1000, 1, 10, 2000, 1, 1, 1987]
+    start = 0
+    for size in sizes:
+        chunk = x[:, start:start+size]
+        if size == 1:
+            np.testing.assert_array_equal(probe(chunk[:, 0]), chunk[:, 0])
+        else:
+            np.testing.assert_array_equal(probe.process(chunk), chunk)
+        start += size
+
+    f, expected = scipy.signal.csd(x[:, np.newaxis], x[np.newaxis], fs=100,
+                                   window=window, nperseg=nperseg,
+                                   noverlap=noverlap)
+    np.testing.assert_allclose(probe.frequencies, f)
+    np.testing.assert_allclose(probe.csd, expected, rtol=1e-10)
+    _, psd = scipy.signal.welch(x, fs=100, window=window, nperseg=nperseg,
+                                noverlap=noverlap)
+    np.testing.assert_allclose(probe.psd, psd, rtol=1e-10)
+    step = nperseg - (nperseg//2 if noverlap is None else noverlap)
+    assert probe.segments == (x.shape[1] - nperseg) // step + 1
+
+
+def test_spectrum_probe_averaging(tmp_path):
+    """test fixed count and exponential averaging, and saving"""
+    x = _signals()[0]
+    probe = sigflow.SpectrumProbe(dt=1., nperseg=100, noverlap=0,
+                                  averages=8, scaling="spectrum")
+    probe.process(x[:2345])
+    assert probe.segments == 23 - 16
+    ## the estimate is the last complete group of segments
+    _, expected = scipy.signal.welch(x[800:1600], nperseg=100, noverlap=0,
+                                     scaling="spectrum")
+    np.testing.assert_allclose(probe.psd[0], expected, rtol=1e-10)
+
+    exponential = sigflow.SpectrumProbe(dt=1., nperseg=100, noverlap=50,
+                                        averaging="exponential", averages=4,
+                                        detrend=False)
+    reference = sigflow.SpectrumProbe(dt=1., nperseg=100, noverlap=50,
+                                      averaging="exponential", averages=4,
+                                      detrend=False)
+    exponential.process(x[:1234])
+    exponential.process(x[1234:])
+    for x_i in x:
+        reference(x_i)
+    np.testing.assert_allclose(exponential.csd, reference.csd, rtol=1e-10)
+    ## the weights of the segments decay geometrically
+    _, _, periodograms = scipy.signal.spectrogram(
+        x[:300], nperseg=100, noverlap=50, window="hann", detrend=False)
+    probe = sigflow.SpectrumProbe(dt=1., nperseg=100, noverlap=50,
+                                  averaging="exponential", averages=4,
+                                  detrend=False)
+    probe.process(x[:200])
+    expected = np.mean(periodograms[:, :3], axis=1)
+    np.testing.assert_allclose(probe.psd[0], expected, rtol=1e-10)
+    probe.process(x[200:300])
+    for k in [3, 4]:
+        expected = 0.75*expected + 0.25*periodograms[:, k]
+    np.testing.assert_allclose(probe.psd[0], expected, rtol=1e-10)
+
+    sys = sigflow.System([exponential], nin=1, nout=1)
+    sys.add_edge("input", 0)
+    sys.add_edge(0, "output")
+    sys.save(tmp_path / "probe.npz")
+    loaded = sigflow.System.load(tmp_path / "probe.npz")
+    np.testing.assert_array_equal(loaded.get_state(), sys.get_state())
+    np.testing.assert_array_equal(loaded.process(x), sys.process(x))
+    np.testing.assert_array_equal(loaded.blocks[0].csd, exponential.csd)
+
+    exponential.reset()
+    assert exponential.segments == 0
+    assert not np.any(exponential.csd)
+    with pytest.raises(ValueError):
+        sigflow.SpectrumProbe(dt=1., averaging="exponential")
+    with pytest.raises(ValueError):
+        sigflow.SpectrumProbe(dt=1., nperseg=10, noverlap=10)
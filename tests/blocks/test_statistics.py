@@ -0,0 +1,125 @@
+"""Tests for sigflow.blocks.statistics
+"""
+import numpy as np
+import pytest
+
+import sigflow
+
+
+def _signals(n=3000):
+    rng = np.random.default_rng(0)
+    t = np.arange(n)
+    x = rng.normal(size=(3, n))
+    x[1] += 1e6  # large offset
+    x[2] += 0.01*t  # drift
+    return x
+
+
+def _chunked(block, x, sizes):
+    """Outputs for chunks of sizes, calling the block for single samples"""
+    y = []
+    start = 0
+    for size in sizes:
+        chunk = x[:, start:start+size]
+        if size == 1:
+            y.append(np.reshape(block(chunk[:, 0]), (-1, 1)))
+        else:
+            y.append(block.process(chunk))
+        start += size
+    return np.concatenate(y, axis=1)
+
+
+SIZES = [5, 1, 1, 700, 1, 1293, 1000]
+
+
+@pytest.mark.parametrize("window", [1, 7, 256])
+@pytest.mark.parametrize("statistic", ["mean", "variance", "std", "rms"])
+def test_moving_statistic(window, statistic):
+    """test sliding statistics per sample and chunked"""
+    x = _signals()
+    block = sigflow.MovingStatistic(window, statistic=statistic, ninput=3)
+    y = _chunked(block, x, SIZES)
+
+    reference = sigflow.MovingStatistic(window, statistic=statistic,
+                                        ninput=3)
+    assert np.shape(reference(x[:, 0])) == (3,)
+    windows = [x[:, max(k-window+1, 0):k+1] for k in range(x.shape[1])]
+    expected = {"mean": lambda w: w.mean(axis=1),
+                "variance": lambda w: w.var(axis=1),
+                "std": lambda w: w.std(axis=1),
+                "rms": lambda w: np.sqrt(np.mean(w**2, axis=1))}[statistic]
+    expected = np.stack([expected(w) for w in windows], axis=1)
+    ## relative to the standard deviation of the data for the offset
+    atol = {"mean": 1e-9, "variance": 1e-7, "std": 1e-7, "rms": 1e-9}
+    np.testing.assert_allclose(y, expected, rtol=1e-9,
+                               atol=atol[statistic])
+
+
+@pytest.mark.parametrize("statistic", ["mean", "variance"])
+def test_exponential_statistic(statistic):
+    """test exponential moments against the Welford recursion"""
+    x = _signals()
+    block = sigflow.MovingStatistic(50, statistic=statistic,
+                                    averaging="exponential", ninput=3)
+    y = _chunked(block, x, [10, 1, 20, 1, 2968])
+
+    mean = np.zeros(3)
+    variance = np.zeros(3)
+    expected = []
+    for k, x_k in enumerate(x.T):
+        rate = 1 / min(k+1, 50)
+        deviation = x_k - mean
+        mean = mean + rate*deviation
+        variance = (1 - rate) * (variance + rate*deviation**2)
+        expected.append(mean if statistic == "mean" else variance)
+    np.testing.assert_allclose(y, np.transpose(expected), rtol=1e-9,
+                               atol=1e-9)
+    ## the first samples are averaged uniformly
+    np.testing.assert_allclose(y[:, 49], np.mean(x[:, :50], axis=1)
+                               if statistic == "mean" else
+                               np.var(x[:, :50], axis=1), rtol=1e-9)
+
+
+@pytest.mark.parametrize("window", [1, 5, 100])
+@pytest.mark.parametrize("extremum", ["max", "min"])
+def test_moving_extremum(window, extremum):
+    """test sliding extrema per sample and chunked"""
+    x = np.round(_signals(), 1)  # with ties
+    block = sigflow.MovingExtremum(window, extremum=extremum, ninput=3)
+    y = _chunked(block, x, SIZES[:3] + [150, 1, 1, 2, 20] + SIZES[3:])
+    function = np.max if extremum == "max" else np.min
+    expected = np.stack([function(x[:, max(k-window+1, 0):k+1], axis=1)
+                         for k in range(x.shape[1])], axis=1)
+    np.testing.assert_array_equal(y[:, :x.shape[1]], expected[:, :y.shape[1]])
+
+
+def test_statistics_system(tmp_path):
+    """test steady state, saving and loading in a system"""
+    rms = sigflow.MovingStatistic(10, statistic="rms", ninput=2)
+    peak = sigflow.MovingExtremum(10, ninput=2)
+    np.testing.assert_allclose(rms.initialize_steady_state([3., -4.]),
+                               [3., 4.])
+    np.testing.assert_allclose(peak.initialize_steady_state([3., -4.]),
+                               [3., -4.])
+    sys = sigflow.System([rms, peak], nin=2, nout=4)
+    for i in range(2):
+        sys.add_edge("input", 0, i, i)
+        sys.add_edge("input", 1, i, i)
+        sys.add_edge(0, "output", i, i)
+        sys.add_edge(1, "output", i, 2+i)
+    x = _signals(100)[:2]
+    sys.process(x[:, :30])
+    sys.save(tmp_path / "statistics.npz")
+    loaded = sigflow.System.load(tmp_path / "statistics.npz")
+    np.testing.assert_array_equal(loaded.get_state(), sys.get_state())
+    np.testing.assert_allclose(loaded.process(x[:, 30:]),
+                               sys.process(x[:, 30:]))
+    np.testing.assert_allclose(
+        sys.process(x[:, :40])[2:, -1], np.max(x[:, 30:40], axis=1))
+
+    with pytest.raises(ValueError):
+        sigflow.MovingStatistic(0)
+    with pytest.raises(ValueError):
+        sigflow.MovingStatistic(10, statistic="median")
+    with pytest.raises(ValueError):
+        sigflow.MovingExtremum(10, extremum="mean")
@@ -0,0 +1,117 @@
+"""Tests for sigflow.clitools.cli
+"""
+import io
+import json
+
+import control
+import numpy as np
+import pytest
+
+import sigflow
+from sigflow.clitools.cli import main
+
+
+@pytest.fixture
+def model(tmp_path):
+    s = control.tf("s")
+    blocks = [sigflow.LTI(1/(s+1), dt=1/64, label="lti"),
+              sigflow.Matrix([[1., 2.], [3., 4.]], label="mat")]
+    sys = sigflow.System(blocks, nin=2, nout=2, label="model")
+    sys.add_edge("input", 0, 0, 0)
+    sys.add_edge(0, 1, 0, 0)
+    sys.add_edge("input", 1, 1, 1)
+    sys.add_edge(1, "output", 0, 0)
+    sys.add_edge(1, "output", 1, 1)
+    path = tmp_path / "model.npz"
+    sys.save(path)
+    return str(path)
+
+
+def _expected(model, inputs):
+    return sigflow.System.load(model).process(inputs)
+
+
+def test_run_npy(model, tmp_path):
+    """test run with .npy input and output"""
+    inputs = np.random.default_rng(0).normal(size=(2, 1000))
+    np.save(tmp_path / "in.npy", inputs)
+    main(["run", model, "--in", str(tmp_path / "in.npy"),
+          "--out", str(tmp_path / "out.npy"), "--chunk", "64"])
+    outputs = np.load(tmp_path / "out.npy")
+    np.testing.assert_allclose(outputs, _expected(model, inputs))
+
+
+def test_run_raw(model, tmp_path, monkeypatch):
+    """test run with interleaved raw binary on stdin and stdout"""
+    inputs = np.random.default_rng(0).normal(size=(2, 1001))
+    stdin = io.TextIOWrapper(io.BytesIO(
+        inputs.T.astype(np.float32).tobytes()))
+    stdout = io.TextIOWrapper(io.BytesIO())
+    monkeypatch.setattr("sys.stdin", stdin)
+    monkeypatch.setattr("sys.stdout", stdout)
+    main(["run", model, "--raw-dtype", "float32", "--chunk", "100"])
+    outputs = np.frombuffer(stdout.buffer.getvalue(),
+                            dtype=np.float32).reshape(-1, 2).T
+    expected = _expected(model, inputs.astype(np.float32).astype(float))
+    np.testing.assert_allclose(outputs, expected, rtol=1e-6)
+
+    ## raw input to a .npy output of unknown length
+    stdin = io.TextIOWrapper(io.BytesIO(inputs.T.tobytes()))
+    monkeypatch.setattr("sys.stdin", stdin)
+    main(["run", model, "--out", str(tmp_path / "out.npy")])
+    np.testing.assert_allclose(np.load(tmp_path / "out.npy"),
+                               _expected(model, inputs))
+
+
+def test_run_dtype_and_empty(model, tmp_path, monkeypatch):
+    """test .npy outputs in the system dtype, also for empty inputs"""
+    sys = sigflow.System.load(model)
+    sys.dtype = np.float32
+    sys.save(tmp_path / "model32.npz")
+    model = str(tmp_path / "model32.npz")
+    inputs = np.random.default_rng(0).normal(size=(2, 100))
+    np.save(tmp_path / "in.npy", inputs)
+    main(["run", model, "--in", str(tmp_path / "in.npy"),
+          "--out", str(tmp_path / "out.npy")])
+    outputs = np.load(tmp_path / "out.npy")
+    assert outputs.dtype == np.float32
+    np.testing.assert_array_equal(outputs, _expected(model, inputs))
+
+    np.save(tmp_path / "empty.npy", np.zeros((2, 0)))
+    main(["run", model, "--in", str(tmp_path / "empty.npy"),
+          "--out", str(tmp_path / "out.npy")])
+    assert np.load(tmp_path / "out.npy").shape == (2, 0)
+    ## raw input of unknown length
+    monkeypatch.setattr("sys.stdin", io.TextIOWrapper(io.BytesIO()))
+    main(["run", model, "--out", str(tmp_path / "raw.npy")])
+    outputs = np.load(tmp_path / "raw.npy")
+    assert outputs.shape == (2, 0) and outputs.dtype == np.float32
+    main(["run", model, "--in", str(tmp_path / "empty.npy"),
+          "--out", str(tmp_path / "out.bin")])
+    assert (tmp_path / "out.bin").read_bytes() == b""
+
+
+def test_run_wrong_shape(model, tmp_path):
+    np.save(tmp_path / "in.npy", np.zeros((3, 10)))
+    with pytest.raises(SystemExit):
+        main(["run", model, "--in", str(tmp_path / "in.npy")])
+
+
+def test_bench_and_info(model, capsys):
+    """test the bench and info commands"""
+    main(["bench", model, "--samples", "256", "--chunk", "64", "--json"])
+    report = json.loads(capsys.readouterr().out)
+    assert report["samples"] == 256
+    assert report["samples_per_second"] > 0
+    latency = report["latency_seconds"]
+    assert 0 < latency["p50"] <= latency["p99"] <= latency["max"]
+
+    main(["bench", model, "--samples", "16", "--chunk", "1"])
+    assert "samples/s" in capsys.readouterr().out
+
+    main(["info", model])
+    text = capsys.readouterr().out
+    assert "blocks: 2" in text
+    assert "edges: 5" in text
+    assert "0 LTI lti: 0 -> mat:0" in text
+    assert "1 Matrix mat: 0 -> output:0, 1 -> output:1" in text
@@ -0,0 +1,73 @@
+"""Tests for sigflow.system.graph
+"""
+import numpy as np
+import pytest
+
+from sigflow.system.graph import Graph, INPUT, OUTPUT
+
+
+@pytest.fixture
+def random_edges():
+    """Returns random edges between 50 nodes."""
+    rng = np.random.default_rng(0)
+    edges = rng.integers(0, 50, size=(300, 4))
+    edges[:, [1, 3]] %= 3
+    edges[:20, 0] = INPUT
+    edges[20:30, 2] = OUTPUT
+    return edges
+
+
+def test_add_edges(random_edges):
+    """Bulk insertion matches one-by-one insertion."""
+    graph = Graph()
+    graph.add_edges(random_edges)
+    expected = Graph()
+    for edge in random_edges:
+        expected.add_edge(*edge)
+    np.testing.assert_equal(graph.edges(), random_edges)
+    for reverse in [False, True]:
+        indptr, edges = graph.csr(reverse)
+        expected_indptr, expected_edges = expected.csr(reverse)
+        np.testing.assert_equal(indptr[:53], expected_indptr[:53])
+        np.testing.assert_equal(edges, expected_edges)
+    for node in range(-2, 50):
+        assert (sorted(graph.out_edges(node))
+                == sorted(expected.out_edges(node)))
+        assert (sorted(graph.in_edges(node))
+                == sorted(expected.in_edges(node)))
+
+
+def test_csr(random_edges):
+    graph = Graph()
+    graph.add_edges(random_edges)
+    indptr, edges = graph.csr()
+    for node in range(-2, 50):
+        actual = edges[indptr[node+2]:indptr[node+3]]
+        expected = random_edges[random_edges[:, 0] == node]
+        expected = expected[np.argsort(expected[:, 1], kind="stable")]
+        np.testing.assert_equal(actual, expected)
+
+
+def test_remove(random_edges):
+    graph = Graph()
+    graph.add_edges(random_edges)
+    graph.remove_edge(*random_edges[0])
+    graph.remove_node(7)
+    keep = np.ones(len(random_edges), dtype=bool)
+    keep[0] = False
+    keep &= (random_edges[:, 0] != 7) & (random_edges[:, 2] != 7)
+    np.testing.assert_equal(graph.edges(), random_edges[keep])
+    assert len(graph) == keep.sum()
+    assert graph.out_edges(7) == []
+    assert graph.in_edges(7) == []
+    with pytest.raises(KeyError):
+        graph.remove_edge(*random_edges[0])
+
+    ## freed slots are reused and keep the insertion order
+    graph.add_edge(7, 0, 8, 0)
+    np.testing.assert_equal(graph.edges()[-1], [7, 0, 8, 0])
+    assert graph.driver(8, 0) >= 0
+
+    graph.clear()
+    assert len(graph) == 0
+    assert graph.edges().shape == (0, 4)
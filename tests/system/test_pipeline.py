@@ -0,0 +1,155 @@
+"""Tests for sigflow.system.pipeline
+"""
+import copy
+
+import control
+import numpy as np
+import pytest
+
+import sigflow
+from sigflow.metrics import Registry
+from sigflow.system.pipeline import Pipeline, Ring, partition
+
+
+def _chain_system(feedback=False):
+    """Chain of LTI blocks, with a feedback loop around the first one."""
+    s = control.tf("s")
+    blocks = [sigflow.Junction("+-", label="sum")]
+    blocks += [sigflow.LTI(1/(s+i+1), dt=1/64, label="lti%d" % i)
+               for i in range(5)]
+    sys = sigflow.System(blocks, nin=2, nout=3)
+    sys.add_edge("input", 0, 0, 0)
+    if feedback:
+        sys.add_edge(1, 0, 0, 1)
+    for i in range(5):
+        sys.add_edge(i, i+1)
+    sys.add_edge(5, "output", 0, 0)
+    sys.add_edge(2, "output", 0, 1)
+    sys.add_edge("input", "output", 1, 2)
+    return sys
+
+
+def _chunked(system, inputs, chunk):
+    return np.concatenate([system.process(inputs[:, k:k+chunk])
+                           for k in range(0, inputs.shape[1], chunk)], axis=1)
+
+
+def test_ring():
+    """test the ring buffer wrapping around and closing"""
+    ring = Ring(2, 5, slots=2)
+    reader = Ring.attach(ring.spec)
+    try:
+        data = np.arange(20.).reshape(2, 10)
+        assert ring.try_write(data[:, :3])
+        assert ring.try_write(data[:, 3:5])
+        assert not ring.try_write(data[:, 5:6])  # no message slot left
+        np.testing.assert_array_equal(reader.try_read(), data[:, :3])
+        assert not ring.try_write(data[:, 5:9])  # no space left
+        assert ring.try_write(data[:, 5:8])  # wraps around
+        np.testing.assert_array_equal(reader.read(), data[:, 3:5])
+        np.testing.assert_array_equal(reader.read(), data[:, 5:8])
+        assert reader.try_read() is None
+        ring.close()
+        assert reader.read() is None
+        with pytest.raises(ValueError):
+            ring.try_write(data[:, :6])
+    finally:
+        reader.release()
+        ring.unlink()
+
+
+@pytest.mark.parametrize("feedback", [False, True])
+def test_partition(feedback):
+    """test that stages are balanced and feedback loops are not cut"""
+    sys = _chain_system(feedback)
+    costs = {i: 1. for i in sys.blocks}
+    assert partition(sys, 3, costs) == [[0, 1], [2, 3], [4, 5]]
+    if feedback:
+        ## no more stages than needed for the bottleneck of the loop
+        assert partition(sys, 6, costs) == [[0, 1], [2, 3], [4, 5]]
+    else:
+        assert partition(sys, 6, costs) == [[i] for i in range(6)]
+    assert partition(sys, 1, costs) == [list(range(6))]
+
+
+@pytest.mark.parametrize("feedback", [False, True])
+def test_pipeline(feedback):
+    """test that the outputs are the same as in a single process"""
+    sys = _chain_system(feedback)
+    reference = copy.deepcopy(sys)
+    inputs = np.random.default_rng(0).normal(size=(2, 2500))
+    chunk = 100 if feedback else 1000
+    costs = {i: 1. for i in sys.blocks}
+    ## the states carry over between the calls
+    expected = np.concatenate([_chunked(reference, inputs[:, :1234], chunk),
+                               _chunked(reference, inputs[:, 1234:], chunk)],
+                              axis=1)
+    with Pipeline(sys, nstages=3, chunk=chunk, costs=costs) as pipeline:
+        assert len(pipeline.stages) == 3
+        outputs = np.concatenate([pipeline.process(inputs[:, :1234]),
+                                  pipeline.process(inputs[:, 1234:])], axis=1)
+        report = pipeline.report()
+    np.testing.assert_array_equal(outputs, expected)
+    assert [stage["samples"] for stage in report["stages"]] == [2500]*3
+    assert all(stage["busy"] > 0 for stage in report["stages"])
+    assert report["bandwidth"] == {
+        ("input", 0): 8, (0, 1): 8, (1, 2): 8, (1, "output"): 8,
+        (2, "output"): 8}
+    ## the system itself is not advanced
+    np.testing.assert_array_equal(_chunked(sys, inputs[:, :1234], chunk),
+                                  expected[:, :1234])
+
+
+def test_pipeline_stages():
+    """test manual stages and the spawn start method"""
+    sys = _chain_system()
+    inputs = np.random.default_rng(0).normal(size=(2, 300))
+    expected = _chunked(copy.deepcopy(sys), inputs, 64)
+    with Pipeline(sys, stages=[[0, 1, 2], [3, 4, 5]], chunk=64,
+                  context="spawn") as pipeline:
+        np.testing.assert_array_equal(pipeline.process(inputs), expected)
+
+    with pytest.raises(ValueError):
+        Pipeline(sys, stages=[[3, 4, 5], [0, 1, 2]])
+    with pytest.raises(ValueError):
+        Pipeline(sys, stages=[[0, 1, 2], [3, 4]])
+    with pytest.raises(LookupError):
+        Pipeline(sys, stages=[[0, 1, 2], [3, 4, 5, 6]])
+
+
+@pytest.mark.parametrize("feedback", [False, True])
+def test_thread_pipeline(feedback, monkeypatch):
+    """test that the stages advance the blocks like System.process"""
+    sys = _chain_system(feedback)
+    reference = copy.deepcopy(sys)
+    registry = Registry()
+    sys.metrics = registry
+    inputs = np.random.default_rng(0).normal(size=(2, 2500))
+    chunk = 100 if feedback else 1000
+    costs = {i: 1. for i in sys.blocks}
+    for u in [inputs[:, :1234], inputs[:, 1234:]]:
+        np.testing.assert_array_equal(
+            sys.process_pipelined(u, nstages=3, chunk=chunk, costs=costs),
+            _chunked(reference, u, chunk))
+    pipeline = sys._pipeline[1]
+    assert len(pipeline.stages) == 3
+    ## the system continues where the pipeline stopped
+    np.testing.assert_array_equal(sys.process(inputs[:, :10]),
+                                  reference.process(inputs[:, :10]))
+    snapshot = registry.snapshot()
+    assert snapshot["sigflow_samples_total"]["samples"][0]["value"] == 2510
+    depths = snapshot["sigflow_stage_queue_depth"]["samples"]
+    assert [depth["value"] for depth in depths] == [0, 0]
+
+    ## a failing stage stops the others
+    lti = sys.blocks[5]
+    process, i2o = type(lti).process, type(lti)._i2o
+    with monkeypatch.context() as patch:
+        patch.setattr(type(lti), "process", lambda self, inputs: (
+            1/0 if self is lti else process(self, inputs)))
+        patch.setattr(type(lti), "_i2o", lambda self: (
+            1/0 if self is lti else i2o(self)))
+        with pytest.raises(ZeroDivisionError):
+            sys.process_pipelined(inputs, nstages=3, chunk=chunk)
+    assert sys.process_pipelined(inputs, nstages=3, chunk=chunk).shape == (
+        3, 2500)
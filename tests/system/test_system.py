@@ -235,3 +235,593 @@ def test_str(two_blocks_system):
 
 
 
+
+
+def test_from_edges():
+    """test System.from_edges bulk constructor"""
+    m = np.random.random((2, 2))
+    blocks = [sigflow.Matrix(m), sigflow.Junction("+-")]
+    edges = [[0, 0, 1, 1],
+             [0, 1, 1, 0],
+             [-1, 0, 0, 0],
+             [-1, 1, 0, 1],
+             [1, 0, -1, 0]]
+    sys = sigflow.System.from_edges(blocks, edges, nin=2, nout=1)
+
+    expected = sigflow.System(blocks, nin=2, nout=1)
+    for edge in edges:
+        edge_from = "input" if edge[0] == -1 else edge[0]
+        edge_to = "output" if edge[2] == -1 else edge[2]
+        expected.add_edge(edge_from, edge_to, edge[1], edge[3])
+    assert sys._succ == expected._succ
+    assert sys._pred == expected._pred
+    np.testing.assert_allclose(sys([4, 5]), expected([4, 5]))
+
+
+@pytest.mark.parametrize("edges, error",
+                         [[[[0, 2, 1, 0]], ValueError],
+                          [[[0, 0, 1, 2]], ValueError],
+                          [[[0, 0, 5, 0]], LookupError],
+                          [[[0, 0, 1, 0], [0, 1, 1, 0]], ValueError]])
+def test_from_edges_invalid(edges, error):
+    blocks = [sigflow.Matrix(np.ones((2, 2))), sigflow.Junction("+-")]
+    with pytest.raises(error):
+        sigflow.System.from_edges(blocks, edges)
+
+
+@pytest.fixture
+def lti_system():
+    """Returns a system with LTI, Filter, Matrix and Junction blocks."""
+    import control
+    import sigflow.blocks.filter
+    s = control.tf("s")
+    lti = sigflow.LTI(tf=1/(s+1), dt=1/64, label="lti")
+    filt = sigflow.blocks.filter.Filter(tf=10/(s+10), fs=64, label="filt")
+    mat = sigflow.Matrix(np.array([[1.], [2.]]), label="mat")
+    junction = sigflow.Junction("+-", label="junction")
+    sys = sigflow.System([lti, filt, mat, junction], nin=1, nout=1)
+    sys.add_edge("input", lti)
+    sys.add_edge(lti, filt)
+    sys.add_edge(filt, mat)
+    sys.add_edge(mat, junction, 0, 0)
+    sys.add_edge(mat, junction, 1, 1)
+    sys.add_edge(junction, "output")
+    return sys
+
+
+@pytest.mark.parametrize("mmap_mode", [None, "r"])
+def test_save_load(lti_system, tmp_path, monkeypatch, mmap_mode):
+    """test System.save and System.load"""
+    import control
+    import scipy
+    np.random.seed(0)
+    sys = lti_system
+    outer = sigflow.System([sys, sigflow.Matrix(np.eye(1))], nin=1, nout=1)
+    outer.add_edge("input", 0)
+    outer.add_edge(0, 1)
+    outer.add_edge(1, "output")
+    for u in np.random.normal(size=20):
+        outer(u)
+
+    path = tmp_path / "system.npz"
+    outer.save(path)
+    ## Loading must not realize or discretize again.
+    def fail(*args, **kwargs):
+        raise AssertionError("called during load")
+    with monkeypatch.context() as m:
+        m.setattr(control, "tf2ss", fail)
+        m.setattr(control, "tf", fail)
+        m.setattr(scipy.signal, "cont2discrete", fail)
+        m.setattr(scipy.linalg, "expm", fail)
+        loaded = sigflow.System.load(path, mmap_mode=mmap_mode)
+        assert loaded._plan is not None
+
+    inner = loaded.blocks[0]
+    assert [block.label for block in inner.blocks.values()] == [
+        "lti", "filt", "mat", "junction"]
+    assert inner.connections() == sys.connections()
+    if mmap_mode is not None:
+        assert isinstance(inner.blocks[2].matrix, np.memmap)
+
+    for u in np.random.normal(size=20):
+        np.testing.assert_allclose(loaded(u), outer(u))
+    ## The transfer function is rebuilt on demand.
+    np.testing.assert_allclose(inner.blocks[0].tf.den[0][0],
+                               sys.blocks[0].tf.den[0][0])
+
+    ## The values pending on feedback connections are restored.
+    junction = sigflow.Junction("+-", label="feedback")
+    loop = sigflow.System([junction, sigflow.LTI(
+        control.tf([10.], [1., 10.]), dt=1/64), outer], nin=1, nout=1)
+    loop.add_edge("input", 0, 0, 0)
+    loop.add_edge(0, 1)
+    loop.add_edge(1, 2)
+    loop.add_edge(2, 0, 0, 1)
+    loop.add_edge(2, "output")
+    for u in np.random.normal(size=20):
+        loop(u)
+    assert loop.state_index().keys() & {"pending/0/1"}
+    assert loop._pending[0][1] != 0
+    loop.save(path)
+    loaded = sigflow.System.load(path, mmap_mode=mmap_mode)
+    np.testing.assert_array_equal(loaded.get_state(), loop.get_state())
+    u = np.random.normal(size=(1, 40))
+    np.testing.assert_array_equal([loaded(u_i) for u_i in u[0, :20]],
+                                  [loop(u_i) for u_i in u[0, :20]])
+    np.testing.assert_array_equal(loaded.process(u[:, 20:]),
+                                  loop.process(u[:, 20:]))
+
+
+def test_get_set_state(lti_system, tmp_path):
+    """test System.get_state and System.set_state"""
+    np.random.seed(1)
+    def build():
+        ## lti_system with a feedback junction in front
+        sys = lti_system
+        junction = sigflow.Junction("+-", label="feedback")
+        outer = sigflow.System([junction, sys], nin=1, nout=1)
+        outer.add_edge("input", junction, 0, 0)
+        outer.add_edge(junction, sys)
+        outer.add_edge(sys, junction, 0, 1)
+        outer.add_edge(sys, "output")
+        return outer
+    sys = build()
+    for u in np.random.normal(size=30):
+        sys(u)
+    state = sys.get_state()
+    index = sys.state_index()
+    assert "pending/0/1" in index
+    assert "blocks/1/blocks/0/state_vector" in index
+    assert state.shape == (sum(int(np.prod(shape))
+                               for _, shape in index.values()),)
+    offset, shape = index["blocks/1/blocks/0/state_vector"]
+    np.testing.assert_equal(state[offset:offset+int(np.prod(shape))],
+                            sys.blocks[1].blocks[0]._state_vector)
+
+    ## snapshot into a preallocated array
+    out = np.empty_like(state)
+    sys.get_state(out=out)
+    np.testing.assert_equal(out, state)
+
+    u = np.random.normal(size=30)
+    expected = [sys(u_i) for u_i in u]
+    sys.set_state(state)
+    np.testing.assert_equal([sys(u_i) for u_i in u], expected)
+
+    ## restore into a freshly loaded system with the same topology
+    path = tmp_path / "system.npz"
+    sys.save(path)
+    other = sigflow.System.load(path)
+    other.set_state(state)
+    np.testing.assert_equal([other(u_i) for u_i in u], expected)
+
+    with pytest.raises(ValueError):
+        sys.set_state(state[:-1])
+
+
+def test_get_set_state_stateless():
+    """test the empty state of a system without states"""
+    sys = sigflow.System([sigflow.Matrix([[2.]]), sigflow.Junction("+-")],
+                         nin=1, nout=1)
+    sys.add_edge("input", 0)
+    sys.add_edge(0, 1, 0, 0)
+    sys.add_edge("input", 1, 0, 1)
+    sys.add_edge(1, "output")
+    sys(1.)
+    state = sys.get_state()
+    assert state.shape == (0,) and state.dtype == sys.dtype
+    assert sys.state_index() == {}
+    out = np.empty(0)
+    assert sys.get_state(out=out) is out
+    sys.set_state(state)
+    assert sys(2.)[0] == 2.
+    with pytest.raises(ValueError):
+        sys.set_state(np.zeros(1))
+    with pytest.raises(ValueError):
+        sys.get_state(out=np.empty(1))
+
+
+def test_block_change_notification(lti_system):
+    """Parameter changes are notified to the systems containing the block."""
+    import control
+    s = control.tf("s")
+    sys = lti_system
+    outer = sigflow.System(sys, nin=1, nout=1)
+    outer.add_edge("input", 0)
+    outer.add_edge(0, "output")
+    for u in np.linspace(0, 1, 10):
+        outer(u)
+    state = outer.get_state()
+    layout = outer._state_layout
+    lti = sys.blocks[0]
+
+    ## same number of states: states and state layout are kept
+    lti.tf = 2/(s+2)
+    assert outer._state_layout is layout
+    np.testing.assert_equal(outer.get_state(), state)
+    assert 0 in sys._changed
+
+    ## different number of states: the state layout is rebuilt
+    lti.tf = 1/(s+1)**2
+    assert outer._state_layout is None
+    assert len(outer.get_state()) == len(state) + 2
+
+    ## changed number of inputs resets the pending inputs
+    outer(1.)
+    sys.blocks[3].signs = "+-+"
+    assert len(sys._pending[3]) == 2
+    outer(1.)
+    assert len(sys._pending[3]) == 3
+    assert not sys._changed
+
+    ## removed blocks are not notified anymore
+    junction = sys.blocks[3]
+    sys.remove_blocks(junction)
+    junction.signs = "+"
+    assert not sys._changed
+
+
+def test_system_dtype(lti_system, tmp_path):
+    """test the dtype policy of System"""
+    sys = lti_system
+    x = np.random.default_rng(0).normal(size=256)
+    expected = sys.process(x[None, :])
+    sys.set_state(np.zeros_like(sys.get_state()))
+
+    sys.dtype = np.float32
+    for block in sys.blocks.values():
+        assert block.dtype == np.float32
+    ## blocks can still be set individually
+    sys.blocks[0].dtype = np.float64
+    outputs = sys.process(x[None, :128])
+    assert outputs.dtype == np.float32
+    np.testing.assert_allclose(outputs, expected[:, :128], atol=1e-5)
+
+    ## the states are kept in one buffer per dtype
+    index = sys.state_index()
+    state = sys.get_state()
+    assert state.dtype == np.float64
+    lti_state = sys.blocks[0]._state_vector
+    offset, shape = index["blocks/0/state_vector"]
+    np.testing.assert_array_equal(state[offset:offset+lti_state.size],
+                                  lti_state)
+    sys.set_state(state)
+    assert sys.blocks[1].input_register.dtype == np.float32
+
+    path = tmp_path / "system.npz"
+    sys.save(path)
+    loaded = sigflow.System.load(path)
+    assert loaded.dtype == np.float32
+    assert [block.dtype for block in loaded.blocks.values()] == [
+        block.dtype for block in sys.blocks.values()]
+    np.testing.assert_array_equal(loaded.get_state(), sys.get_state())
+    np.testing.assert_allclose(loaded.process(x[None, 128:]),
+                               expected[:, 128:], atol=1e-5)
+
+
+def test_frequency_response():
+    """test System.frequency_response and System.loop_response"""
+    import control
+    s = control.tf("s")
+    plant = 1/(s**2+s+1)
+    controller = 10*(s+1)/(s+10)
+    junction = sigflow.Junction("+-")
+    k = sigflow.LTI(controller, dt=1/64)
+    p = sigflow.LTI(plant, dt=1/64)
+    inner = sigflow.System([k], nin=1, nout=1)
+    inner.add_edge("input", 0)
+    inner.add_edge(0, "output")
+    sys = sigflow.System([junction, inner, p], nin=1, nout=3)
+    sys.add_edge("input", junction, 0, 0)
+    sys.add_edge(junction, inner)
+    sys.add_edge(inner, p)
+    sys.add_edge(p, junction, 0, 1)
+    sys.add_edge(p, "output", 0, 0)
+    sys.add_edge("input", "output", 0, 1)
+
+    freqs = np.logspace(-2, 2, 50)
+    s_eval = 2j*np.pi*freqs
+    loop_gain = (plant*controller)(s_eval)
+    response = sys.frequency_response(freqs)
+    assert response.shape == (50, 3, 1)
+    np.testing.assert_allclose(response[:, 0, 0],
+                               loop_gain/(1+loop_gain), rtol=1e-10)
+    np.testing.assert_allclose(response[:, 1, 0], 1)
+    assert np.isnan(response[:, 2, 0]).all()
+
+    open_loop = sys.frequency_response(freqs, break_edges=[(p, junction,
+                                                            0, 1)])
+    np.testing.assert_allclose(open_loop[:, 0, 0], loop_gain, rtol=1e-10)
+    np.testing.assert_allclose(sys.loop_response(freqs, (p, junction, 0, 1)),
+                               -loop_gain, rtol=1e-10)
+    np.testing.assert_allclose(sys.loop_response(freqs, (junction, 1)),
+                               -loop_gain, rtol=1e-10)
+
+    with pytest.raises(KeyError):
+        sys.frequency_response(freqs, break_edges=[(junction, p)])
+    with pytest.raises(ValueError):
+        sys.loop_response(freqs, ("input", junction))
+    with pytest.raises(ValueError):
+        sigflow.System([sigflow.FIR([1., 2.])]).frequency_response(freqs)
+    with pytest.raises(NotImplementedError):
+        sigflow.System([sigflow.MovingExtremum(3)]).frequency_response(freqs)
+
+
+@pytest.mark.parametrize("feedback", [False, True])
+def test_initialize_steady_state(lti_system, feedback):
+    """test System.initialize_steady_state"""
+    fir = sigflow.FIR([0.5, 0.25], dt=1/64)
+    sys = sigflow.System([lti_system, sigflow.Junction("++"), fir],
+                         nin=1, nout=1)
+    sys.add_edge("input", 1, 0, 0)
+    sys.add_edge(1, 0)
+    sys.add_edge(0, "output")
+    sys.add_edge(0, 2)
+    fir_gain = 0.
+    if feedback:
+        sys.add_edge(2, 1, 0, 1)
+        fir_gain = 0.75
+    ## lti_system is 1/(s+1) * 10/(s+10) * (1 - 2)
+    expected = 2. * -1 / (1 + fir_gain)
+    outputs = sys.initialize_steady_state(2.)
+    np.testing.assert_allclose(outputs, [expected])
+    np.testing.assert_allclose(sys.process(np.full((1, 100), 2.)),
+                               expected, rtol=1e-10)
+    np.testing.assert_allclose(fir(expected), 0.75*expected)
+
+
+def _nested_system(depth):
+    """Nested systems with feedback and pass-through connections."""
+    import control
+    s = control.tf("s")
+    lti = sigflow.LTI(1/(s+depth+1), dt=1/64, label="lti")
+    junction = sigflow.Junction("+-", label="junction")
+    blocks = [lti, junction]
+    if depth > 0:
+        blocks.append(_nested_system(depth-1))
+    sys = sigflow.System(blocks, nin=2, nout=2, label="level%d" % depth)
+    sys.add_edge("input", junction, 0, 0)
+    sys.add_edge(junction, lti)
+    sys.add_edge(lti, "output", 0, 0)
+    if depth > 0:
+        sys.add_edge(lti, 2, 0, 0)
+        sys.add_edge("input", 2, 1, 1)
+        sys.add_edge(2, junction, 0, 1)
+        sys.add_edge(2, "output", 1, 1)
+    else:
+        sys.add_edge(lti, junction, 0, 1)
+        sys.add_edge("input", "output", 1, 1)
+    return sys
+
+
+def _set_inline(sys, inline):
+    sys.inline = inline
+    for block in sys.blocks.values():
+        if isinstance(block, sigflow.System):
+            _set_inline(block, inline)
+
+
+@pytest.mark.parametrize("self_loop", [False, True])
+def test_inline(self_loop):
+    """test that inlining nested systems doesn't change the results"""
+    outputs = {}
+    states = {}
+    for inline in [False, True]:
+        nested = _nested_system(4)
+        sys = sigflow.System([nested, sigflow.Matrix([[2.]])],
+                             nin=1, nout=2)
+        sys.add_edge("input", 0, 0, 0)
+        sys.add_edge(0, 1, 0, 0)
+        sys.add_edge(1, "output", 0, 0)
+        sys.add_edge(0, "output", 1, 1)
+        if self_loop:
+            sys.add_edge(0, 0, 0, 1)
+        else:
+            sys.add_edge("input", 0, 0, 1)
+        _set_inline(sys, inline)
+        x = np.random.default_rng(0).normal(size=(1, 64))
+        y = [[np.ravel(value)[0] for value in sys(x[:, k])]
+             for k in range(32)]
+        y = np.array(y).T
+        outputs[inline] = np.hstack([y, sys.process(x[:, 32:])])
+        states[inline] = sys.get_state()
+    np.testing.assert_allclose(outputs[True], outputs[False], rtol=1e-12)
+    np.testing.assert_array_equal(states[True], states[False])
+
+
+def test_lookup_and_profile():
+    """test System.lookup and System.profile"""
+    nested = _nested_system(2)
+    sys = sigflow.System([nested], nin=2, nout=2)
+    sys.add_edge("input", 0, 0, 0)
+    sys.add_edge("input", 0, 1, 1)
+    sys.add_edge(0, "output", 0, 0)
+    lti = sys.lookup("level2/level1/lti")
+    assert lti is nested.blocks[2].blocks[0]
+    assert sys.lookup((0, 2, "lti")) is lti
+    assert sys.lookup("0/2/0") is lti
+    with pytest.raises(LookupError):
+        sys.lookup("level2/level0")
+    with pytest.raises(LookupError):
+        sys.lookup("level2/lti/lti")
+
+    sys.profiling = True
+    sys.process(np.ones((2, 100)))
+    sys([1., 1.])
+    profile = sys.profile(reset=True)
+    assert profile["level2"] > profile["level2/level1"] > 0
+    assert profile["level2/level1"] == pytest.approx(
+        profile["level2/level1/lti"] + profile["level2/level1/junction"]
+        + profile["level2/level1/level0"])
+    assert sys.profile() == {}
+
+
+def test_event_driven():
+    """test that event-driven mode only runs what changed"""
+    import copy
+    import control
+    s = control.tf("s")
+    outputs = {}
+    for event_driven in [False, True]:
+        sys = sigflow.System(
+            [_nested_system(3), sigflow.Matrix([[2.]]),
+             sigflow.Junction("+-"), sigflow.Matrix([[1.], [3.]])],
+            nin=2, nout=3)
+        sys.add_edge("input", 1, 0, 0)
+        sys.add_edge(1, 2, 0, 0)
+        sys.add_edge("input", 2, 1, 1)
+        sys.add_edge(2, 0, 0, 0)
+        sys.add_edge("input", 0, 1, 1)
+        sys.add_edge(0, "output", 0, 0)
+        sys.add_edge(0, 3, 1, 0)
+        sys.add_edge(3, "output", 0, 1)
+        sys.add_edge(3, "output", 1, 2)
+        sys.event_driven = event_driven
+        ## piecewise constant setpoints
+        rng = np.random.default_rng(0)
+        x = np.repeat(rng.normal(size=(2, 20)), 10, axis=1)
+        y = [[np.ravel(value)[0] for value in sys(x[:, k])]
+             for k in range(100)]
+        sys.blocks[1].matrix = np.array([[-1.]])
+        y += [[np.ravel(value)[0] for value in sys(x[:, k])]
+              for k in range(100, 150)]
+        outputs[event_driven] = np.hstack([np.array(y).T,
+                                           sys.process(x[:, 150:170])])
+        y = [[np.ravel(value)[0] for value in sys(x[:, k])]
+             for k in range(170, 200)]
+        outputs[event_driven] = np.hstack([outputs[event_driven],
+                                           np.array(y).T])
+    np.testing.assert_array_equal(outputs[True], outputs[False])
+
+    ## a chain of matrices next to an LTI
+    chain = [sigflow.Matrix([[1.]]) for _ in range(20)]
+    sys = sigflow.System(chain + [sigflow.LTI(1/(s+1), dt=1/64)],
+                         nin=1, nout=2)
+    sys.add_edge("input", 0)
+    for i in range(19):
+        sys.add_edge(i, i+1)
+    sys.add_edge(19, "output", 0, 0)
+    sys.add_edge("input", 20)
+    sys.add_edge(20, "output", 0, 1)
+    sys.event_driven = True
+    sys(1.)
+    assert sys._active == 21
+    assert sys(1.)[0] == 1.
+    assert sys._active == 1
+    assert sys(2.)[0] == 2.
+    assert sys._active == 21
+    chain[10].matrix = np.array([[3.]])
+    assert sys(2.)[0] == 6.
+    assert sys._active == 11
+
+
+def test_event_driven_feedback():
+    """test that a stateful block in a feedback loop steps once per call
+    in event-driven mode"""
+    x = np.random.default_rng(0).normal(size=20)
+    outputs = {}
+    for event_driven in [False, True]:
+        nlms = sigflow.NLMS(4)
+        sys = sigflow.System([nlms, sigflow.Matrix([[0.5]])], nin=1, nout=2)
+        sys.add_edge("input", 0, 0, 1)
+        sys.add_edge(0, 1, 0, 0)
+        sys.add_edge(1, 0, 0, 0)
+        sys.add_edge(0, "output", 0, 0)
+        sys.add_edge(0, "output", 1, 1)
+        sys.event_driven = event_driven
+        outputs[event_driven] = [[np.ravel(value)[0] for value in sys(u)]
+                                 for u in x]
+    np.testing.assert_array_equal(outputs[True], outputs[False])
+
+
+@pytest.mark.parametrize("delay", [0.5, 3.25, 40.])
+def test_delay_line_feedback(delay, monkeypatch):
+    """test that delay lines let feedback loops run in chunks"""
+    import copy
+    import control
+    s = control.tf("s")
+    lti = sigflow.LTI(10/(s+10), dt=1/64, label="lti")
+    delay_line = sigflow.DelayLine(delay/64, dt=1/64, label="delay")
+    junction = sigflow.Junction("+-", label="junction")
+    inner = sigflow.System([lti, delay_line], nin=1, nout=2)
+    inner.add_edge("input", 0)
+    inner.add_edge(0, 1)
+    inner.add_edge(0, "output", 0, 0)
+    inner.add_edge(1, "output", 0, 1)
+    sys = sigflow.System([junction, inner], nin=1, nout=2)
+    sys.add_edge("input", 0, 0, 0)
+    sys.add_edge(0, 1)
+    sys.add_edge(1, 0, 1, 1)
+    sys.add_edge(1, "output", 0, 0)
+    sys.add_edge(1, "output", 1, 1)
+    reference = copy.deepcopy(sys)
+    x = np.random.default_rng(0).normal(size=(1, 300))
+    expected = reference._process_samples(x)
+    if delay_line.latency > 0:
+        monkeypatch.setattr(sys, "_process_samples", None)
+    outputs = np.hstack([sys.process(x[:, :100]),
+                         [[np.ravel(y)[0]] for y in sys(x[:, 100])],
+                         sys.process(x[:, 101:])])
+    np.testing.assert_allclose(outputs, expected, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(sys.get_state(), reference.get_state(),
+                               rtol=1e-12, atol=1e-12)
+
+
+def test_memory_report():
+    """test System.memory_report and System.compact"""
+    import copy
+    import control
+    from sigflow.core.memory import sizeof
+    s = control.tf("s")
+    n = 50
+    inner = sigflow.System(
+        [sigflow.LTI(10/(s+10), dt=1/64) for _ in range(n)]
+        + [sigflow.Matrix(np.ones((1, 1)), label="gain")], nin=1, nout=1)
+    inner.add_edge("input", 0)
+    for i in range(n):
+        inner.add_edge(i, i+1)
+    inner.add_edge(n, "output")
+    sys = sigflow.System([inner, sigflow.Junction("+-", label="sum")],
+                         nin=1, nout=1)
+    sys.add_edge("input", 0)
+    sys.add_edge(0, 1, 0, 0)
+    sys.add_edge("input", 1, 0, 1)
+    sys.add_edge(1, "output")
+    x = np.random.default_rng(0).normal(size=(1, 100))
+    sys.process(x[:, :50])
+    sys.get_state()
+    reference = copy.deepcopy(sys)
+
+    report = sys.memory_report()
+    assert set(report["graph"]) == {"graph", "ports", "plan", "states",
+                                    "other"}
+    assert report["total"] == (sum(report["graph"].values())
+                               + sum(report["blocks"].values()))
+    assert sum(report["types"].values()) == sum(report["blocks"].values())
+    assert set(report["types"]) == {"LTI", "Matrix", "Junction"}
+    assert len(report["blocks"]) == n + 2
+    assert report["blocks"]["0/gain"] > 0 and report["blocks"]["sum"] > 0
+    ## nothing is counted twice
+    assert report["total"] <= sizeof(sys)
+
+    sys.compact()
+    compact = sys.memory_report()
+    assert compact["types"]["LTI"] * 5 < report["types"]["LTI"]
+    assert compact["graph"] == report["graph"]
+    ## identical blocks share their coefficients
+    first, second = inner.blocks[0], inner.blocks[1]
+    assert first._coefficients[0] is second._coefficients[0]
+    assert not first._coefficients[0].flags.writeable
+    assert first._tf is None
+    np.testing.assert_array_equal(first.tf.den[0][0], [1, 10])
+    np.testing.assert_array_equal(sys.process(x[:, 50:]),
+                                  reference.process(x[:, 50:]))
+    ## the blocks can still be changed
+    second.tf = 20/(s+20)
+    assert first.tf.den[0][0][1] == 10
+
+    lti = sigflow.LTI(10/(s+10), dt=1/64, keep_control=False)
+    assert lti._tf is None and lti._state_space is None
+    assert lti.tf is not lti.tf
+    lti.keep_control = True
+    assert lti.tf is lti.tf
@@ -0,0 +1,115 @@
+"""Tests for sigflow.metrics
+"""
+import math
+import urllib.request
+
+import numpy as np
+import pytest
+
+import sigflow
+from sigflow.metrics import Registry
+
+
+def test_metrics():
+    """test counters, gauges and histograms"""
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests.", ["code"])
+    counter.labels("200").inc()
+    counter.labels(code="200").inc(2)
+    counter.labels("500").inc()
+    assert registry.counter("requests_total", labelnames=["code"]) is counter
+    with pytest.raises(ValueError):
+        counter.labels("200").inc(-1)
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total")
+
+    gauge = registry.gauge("depth", "Queue depth.")
+    gauge.set(5)
+    gauge.dec(2)
+
+    histogram = registry.histogram("latency_seconds", "Latency.",
+                                   buckets=[0.1, 0.2, 0.4])
+    for value in [0.05, 0.15, 0.15, 0.3, 1.]:
+        histogram.observe(value)
+    child = histogram.labels()
+    assert child.counts == [1, 2, 1, 1]
+    assert child.quantile(0.5) == pytest.approx(0.1 + 0.1*1.5/2)
+    assert child.quantile(1.) == 0.4
+
+    snapshot = registry.snapshot()
+    assert snapshot["requests_total"]["samples"] == [
+        {"labels": {"code": "200"}, "value": 3.},
+        {"labels": {"code": "500"}, "value": 1.}]
+    assert snapshot["depth"]["samples"][0]["value"] == 3
+    value = snapshot["latency_seconds"]["samples"][0]["value"]
+    assert value["buckets"] == {0.1: 1, 0.2: 3, 0.4: 4, math.inf: 5}
+    assert value["count"] == 5
+    assert value["sum"] == pytest.approx(1.65)
+
+    text = registry.to_prometheus()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{code="200"} 3.0' in text
+    assert 'depth 3.0' in text
+    assert 'latency_seconds_bucket{le="0.2"} 3' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 5' in text
+    assert 'latency_seconds_count 5' in text
+
+
+def test_metrics_export(tmp_path):
+    """test exporting to a file and over HTTP"""
+    registry = Registry()
+    registry.counter("samples_total", labelnames=["system"]).labels(
+        'a "quoted"\nlabel').inc(7)
+    path = tmp_path / "metrics.prom"
+    registry.write_prometheus(path)
+    text = path.read_text()
+    assert text == registry.to_prometheus()
+    assert r'samples_total{system="a \"quoted\"\nlabel"} 7.0' in text
+    assert list(tmp_path.iterdir()) == [path]
+
+    server = registry.serve()
+    try:
+        host, port = server.server_address
+        with urllib.request.urlopen("http://{}:{}/metrics".format(
+                host, port)) as response:
+            assert response.read().decode() == text
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_system_metrics():
+    """test the metrics of System execution"""
+    import control
+    s = control.tf("s")
+    registry = Registry()
+    blocks = [sigflow.LTI(1/(s+1), dt=1/64, label="lti"),
+              sigflow.Matrix([[2.]], label="mat")]
+    sys = sigflow.System(blocks, nin=1, nout=1, label="loop")
+    sys.add_edge("input", 0)
+    sys.add_edge(0, 1)
+    sys.add_edge(1, "output")
+    sys.metrics = registry
+    sys.deadline = 0.
+    sys.profiling = True
+    for u in range(10):
+        sys(u)
+    sys.process(np.ones((1, 100)))
+
+    snapshot = registry.snapshot()
+    [samples] = snapshot["sigflow_samples_total"]["samples"]
+    assert samples == {"labels": {"system": "loop"}, "value": 110}
+    [steps] = snapshot["sigflow_step_seconds"]["samples"]
+    assert steps["value"]["count"] == 11
+    [overruns] = snapshot["sigflow_overruns_total"]["samples"]
+    assert overruns["value"] == 11
+    blocks = {sample["labels"]["block"]: sample["value"]
+              for sample in snapshot["sigflow_block_seconds_total"]["samples"]}
+    assert sorted(blocks) == ["lti", "mat"]
+    assert sum(blocks.values()) == pytest.approx(sum(
+        sys.profile().values()))
+
+    sys.metrics = None
+    sys(0.)
+    assert registry.snapshot()["sigflow_samples_total"]["samples"][0][
+        "value"] == 110
@@ -0,0 +1,77 @@
+"""Tests for sigflow.tracing
+"""
+import gc
+import json
+
+import numpy as np
+import pytest
+
+import sigflow
+from sigflow.tracing import Tracer
+
+
+def test_tracer_ring_buffer():
+    """test that the oldest events are overwritten"""
+    tracer = Tracer(capacity=4)
+    for i in range(6):
+        tracer.complete(str(i), 1000*i, 1000*i+500)
+    events = tracer.events()
+    assert [event["name"] for event in events] == ["2", "3", "4", "5"]
+    assert events[0]["ts"] == 2. and events[0]["dur"] == 0.5
+    assert events[0]["ph"] == "X"
+    assert tracer.dropped == 2
+    tracer.clear()
+    assert tracer.events() == []
+    with pytest.raises(ValueError):
+        Tracer(capacity=0)
+
+
+def test_tracer_gc_and_spans():
+    """test garbage collection and span events"""
+    tracer = Tracer()
+    with tracer:
+        with tracer.span("work", args={"n": 1}):
+            gc.collect()
+        tracer.instant("mark")
+    gc.collect()
+    events = tracer.events()
+    assert [event["name"] for event in events] == ["gc", "work", "mark"]
+    assert events[0]["cat"] == "gc"
+    assert events[0]["args"]["generation"] == 2
+    assert events[1]["args"] == {"n": 1}
+    assert events[1]["ts"] <= events[0]["ts"]
+    assert events[2]["ph"] == "i" and events[2]["s"] == "t"
+    assert "dur" not in events[2]
+    assert gc.callbacks.count(tracer._on_gc) == 0
+
+
+def test_system_tracer(tmp_path):
+    """test tracing the execution of a system"""
+    import control
+    s = control.tf("s")
+    inner = sigflow.System([sigflow.LTI(1/(s+1), dt=1/64, label="lti")],
+                           nin=1, nout=1, label="inner")
+    inner.add_edge("input", 0)
+    inner.add_edge(0, "output")
+    sys = sigflow.System([inner, sigflow.Matrix([[2.]], label="mat")],
+                         nin=1, nout=1, label="outer")
+    sys.add_edge("input", 0)
+    sys.add_edge(0, 1)
+    sys.add_edge(1, "output")
+    tracer = Tracer()
+    sys.tracer = tracer
+    sys(1.)
+    sys.process(np.ones((1, 10)))
+
+    names = [(event["name"], event["cat"]) for event in tracer.events()]
+    assert names == [("inner/lti", "block"), ("mat", "block"),
+                     ("outer", "system")] * 2
+    assert tracer.events()[-1]["args"] == {"samples": 10}
+    path = tmp_path / "trace.json"
+    tracer.dump(path)
+    trace = json.loads(path.read_text())
+    assert len(trace["traceEvents"]) == 6
+
+    sys.tracer = None
+    sys(1.)
+    assert len(tracer.events()) == 6